@@ -17,6 +17,15 @@ from google.api_core import exceptions as google_exceptions
 from google.cloud import aiplatform, aiplatform_v1, logging, storage
 from vertexai.preview.evaluation import AutoraterConfig, CustomMetric, EvalTask
 
+# The contains_words matcher is shared with the rag-agent evaluators. Its
+# directory is imported from directly, because importing the rag-agent `app`
+# package would build its agent.
+sys.path.append(
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "agents", "rag-agent", "app", "utils")
+)
+
+from text_matching import contains_words_score
+
 matplotlib.use("Agg")
 
 
@@ -36,6 +45,11 @@ SHORT_LOG_NAME = os.environ.get("LOG_NAME", "run_gemini_from_file")
 EXPERIMENT_NAME = "gemini-playground-evaluation"
 LOG_NAME = f"projects/{PROJECT_ID}/logs/{SHORT_LOG_NAME}"
 JUDGEMENT_MODEL_NAME = os.environ.get("JUDGEMENT_MODEL_NAME", "gemini-1.5-flash")
+# contains_words matching options. Set CONTAINS_WORDS_WHOLE_WORD to "true" to
+# stop "cat" from matching inside "concatenate"; this can lower scores that
+# relied on substring hits, so it is off by default.
+CONTAINS_WORDS_WHOLE_WORD = os.environ.get("CONTAINS_WORDS_WHOLE_WORD", "false").lower() == "true"
+CONTAINS_WORDS_IGNORE_CASE = os.environ.get("CONTAINS_WORDS_IGNORE_CASE", "false").lower() == "true"
 
 TIMESTAMP_FILE = "last_run_timestamp.txt"
 
@@ -44,13 +58,12 @@ def _contains_words_metric_function(test_case: dict) -> dict:
     response = test_case.get("response", "")
     reference = test_case.get("reference", "")
 
-    if not response or not reference:
-        return {"contains_words": 0.0}
-
-    words_to_check = [word.strip() for word in reference.split(" ") if word.strip()]
-    contains_all_words = all(word in response for word in words_to_check)
-
-    score = 1.0 if contains_all_words else 0.0
+    score = contains_words_score(
+        response,
+        reference,
+        whole_word=CONTAINS_WORDS_WHOLE_WORD,
+        ignore_case=CONTAINS_WORDS_IGNORE_CASE,
+    )
     return {"contains_words": score}
 
 
@@ -0,0 +1,262 @@
+#!/usr/bin/env python3
+"""
+A background writer that takes Cloud Logging calls off the request path.
+
+Request handlers call `BackgroundLogWriter.submit()`, which only puts the entry
+on a bounded asyncio queue and never blocks. A background task takes entries
+off the queue in batches and writes each batch with a single Cloud Logging
+API call in a worker thread, so log latency never adds to request latency.
+
+When the queue is full, the overload policy decides what happens to a new entry:
+  - "drop":   it is dropped.
+  - "sample": with probability `sample_rate` it replaces the oldest queued entry,
+              otherwise it is dropped, so a sample of the overload still gets through.
+  - "spool":  it is kept in an in-memory overflow buffer (of up to
+              `max_queue_size` entries, beyond which it is dropped), which the
+              background task appends to a JSON-lines file on local disk. The
+              file is written to Cloud Logging whenever the queue is at most
+              half full. Batches that fail to write are spooled too. The
+              default spool file is per process, so workers of one server
+              don't share it.
+
+A failed batch or spool drain is logged and counted, and never stops the
+background task.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import random
+import time
+
+logger = logging.getLogger(__name__)
+
+OVERLOAD_POLICIES = ("drop", "sample", "spool")
+
+
+class BackgroundLogWriter:
+    def __init__(
+        self,
+        cloud_logger,
+        max_queue_size: int = 1000,
+        batch_size: int = 100,
+        flush_interval: float = 1.0,
+        overload_policy: str = "drop",
+        sample_rate: float = 0.1,
+        spool_path: str | None = None,
+    ):
+        if overload_policy not in OVERLOAD_POLICIES:
+            raise ValueError(f"Unknown overload policy '{overload_policy}'. Use one of {OVERLOAD_POLICIES}.")
+        self.cloud_logger = cloud_logger
+        self.max_queue_size = max_queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.overload_policy = overload_policy
+        self.sample_rate = sample_rate
+        self.spool_path = spool_path or f"log_writer_spool.{os.getpid()}.jsonl"
+
+        self._queue: asyncio.Queue | None = None
+        self._task: asyncio.Task | None = None
+        self._counters = {
+            "submitted": 0,
+            "written": 0,
+            "batches": 0,
+            "dropped": 0,
+            "sampled_in": 0,
+            "spooled": 0,
+            "unspooled": 0,
+            "write_errors": 0,
+            "spool_errors": 0,
+            "max_queue_depth": 0,
+        }
+        self._last_write_seconds = 0.0
+        # Overflowing entries waiting to be spooled by the background task.
+        self._overflow: list = []
+        self._next_drain = 0.0
+
+    @classmethod
+    def from_env(cls, cloud_logger) -> "BackgroundLogWriter":
+        """Creates a writer configured by the LOG_WRITER_* environment variables."""
+        return cls(
+            cloud_logger,
+            max_queue_size=int(os.environ.get("LOG_WRITER_QUEUE_SIZE", 1000)),
+            batch_size=int(os.environ.get("LOG_WRITER_BATCH_SIZE", 100)),
+            flush_interval=float(os.environ.get("LOG_WRITER_FLUSH_INTERVAL_SECONDS", 1.0)),
+            overload_policy=os.environ.get("LOG_WRITER_OVERLOAD_POLICY", "drop"),
+            sample_rate=float(os.environ.get("LOG_WRITER_SAMPLE_RATE", 0.1)),
+            spool_path=os.environ.get("LOG_WRITER_SPOOL_PATH"),
+        )
+
+    def start(self) -> None:
+        """Starts the background task. Must be called from the event loop."""
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._task = asyncio.get_running_loop().create_task(self._run(), name="background-log-writer")
+
+    async def stop(self, timeout: float = 10.0) -> None:
+        """Writes what is still queued (within `timeout`) and stops the background task."""
+        if self._task is None:
+            return
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"Log writer stopped with {self._queue.qsize()} entries still queued.")
+        self._task.cancel()
+        try:
+            await self._task
+        except asyncio.CancelledError:
+            pass
+        self._task = None
+        await self._spool_overflow()
+        logger.info(f"Log writer stopped: {self.metrics()}")
+
+    def submit(self, entry: dict, severity: str = "INFO") -> None:
+        """Queues a structured log entry. Never blocks."""
+        self._counters["submitted"] += 1
+        item = (entry, severity)
+        if self._queue is None:
+            self._counters["dropped"] += 1
+            return
+        try:
+            self._queue.put_nowait(item)
+        except asyncio.QueueFull:
+            self._on_overload(item)
+        self._counters["max_queue_depth"] = max(self._counters["max_queue_depth"], self._queue.qsize())
+
+    def _on_overload(self, item) -> None:
+        if self.overload_policy == "spool":
+            # Disk writes are left to the background task, so submit() stays
+            # a few microseconds even under overload.
+            if len(self._overflow) >= self.max_queue_size:
+                self._counters["dropped"] += 1
+            else:
+                self._overflow.append(item)
+            return
+        self._counters["dropped"] += 1
+        if self.overload_policy == "sample" and random.random() < self.sample_rate:
+            # Make room by dropping the oldest entry instead of this one.
+            self._queue.get_nowait()
+            self._queue.task_done()
+            self._queue.put_nowait(item)
+            self._counters["sampled_in"] += 1
+
+    def _spool(self, items) -> None:
+        """Appends entries to the spool file. Runs in a worker thread."""
+        try:
+            with open(self.spool_path, "a", encoding="utf-8") as f:
+                for entry, severity in items:
+                    f.write(json.dumps({"entry": entry, "severity": severity}, default=str) + "\n")
+        except OSError as e:
+            self._counters["spool_errors"] += 1
+            self._counters["dropped"] += len(items)
+            logger.warning(f"Log writer failed to spool {len(items)} entries: {e}")
+            return
+        self._counters["spooled"] += len(items)
+
+    def _write_batch(self, items) -> None:
+        started = time.perf_counter()
+        with self.cloud_logger.batch() as batch:
+            for entry, severity in items:
+                batch.log_struct(entry, severity=severity)
+        self._last_write_seconds = time.perf_counter() - started
+
+    def _unspool(self) -> list:
+        """Takes the spooled entries off disk. Runs in a worker thread."""
+        draining = f"{self.spool_path}.draining"
+        # A drain that failed part way leaves its file behind; it is read
+        # again before the spool is moved over it.
+        if not os.path.exists(draining):
+            try:
+                os.replace(self.spool_path, draining)
+            except FileNotFoundError:
+                return []
+        items = []
+        with open(draining, encoding="utf-8") as f:
+            for line in filter(str.strip, f):
+                # A line torn by a crash mid-append is skipped rather than
+                # failing every later drain.
+                try:
+                    record = json.loads(line)
+                    items.append((record["entry"], record["severity"]))
+                except (ValueError, KeyError, TypeError):
+                    self._counters["spool_errors"] += 1
+        os.remove(draining)
+        return items
+
+    async def _write(self, items) -> None:
+        loop = asyncio.get_running_loop()
+        for start in range(0, len(items), self.batch_size):
+            batch = items[start : start + self.batch_size]
+            try:
+                await loop.run_in_executor(None, self._write_batch, batch)
+                self._counters["written"] += len(batch)
+                self._counters["batches"] += 1
+            except Exception as e:
+                self._counters["write_errors"] += 1
+                logger.warning(f"Log writer failed to write {len(batch)} entries: {e}")
+                if self.overload_policy == "spool":
+                    await loop.run_in_executor(None, self._spool, batch)
+                else:
+                    self._counters["dropped"] += len(batch)
+
+    def _should_drain(self) -> bool:
+        """Whether there is a spool to write and the queue has room for live entries meanwhile."""
+        return (
+            self.overload_policy == "spool"
+            and time.monotonic() >= self._next_drain
+            and self._queue.qsize() <= self.max_queue_size // 2
+            and (os.path.exists(self.spool_path) or os.path.exists(f"{self.spool_path}.draining"))
+        )
+
+    async def _spool_overflow(self) -> None:
+        """Moves the overflow buffer to the spool file."""
+        if not self._overflow:
+            return
+        items, self._overflow = self._overflow, []
+        await asyncio.get_running_loop().run_in_executor(None, self._spool, items)
+
+    async def _drain_spool(self) -> None:
+        """Writes what was spooled during an overload."""
+        loop = asyncio.get_running_loop()
+        try:
+            items = await loop.run_in_executor(None, self._unspool)
+        except Exception as e:
+            self._counters["spool_errors"] += 1
+            self._next_drain = time.monotonic() + self.flush_interval
+            logger.warning(f"Log writer failed to read the spool {self.spool_path}: {e}")
+            return
+        self._counters["unspooled"] += len(items)
+        await self._write(items)
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                first = await asyncio.wait_for(self._queue.get(), self.flush_interval)
+            except asyncio.TimeoutError:
+                first = None
+            if first is not None:
+                batch = [first]
+                while len(batch) < self.batch_size and not self._queue.empty():
+                    batch.append(self._queue.get_nowait())
+                try:
+                    await self._write(batch)
+                except Exception as e:
+                    self._counters["write_errors"] += 1
+                    self._counters["dropped"] += len(batch)
+                    logger.warning(f"Log writer lost a batch of {len(batch)} entries: {e}")
+                finally:
+                    for _ in batch:
+                        self._queue.task_done()
+            await self._spool_overflow()
+            if self._should_drain():
+                await self._drain_spool()
+
+    def metrics(self) -> dict:
+        """Returns the queue depth and the counters of submitted, written and lost entries."""
+        return {
+            "queue_depth": self._queue.qsize() if self._queue is not None else 0,
+            "overflow_depth": len(self._overflow),
+            "overload_policy": self.overload_policy,
+            "last_write_seconds": round(self._last_write_seconds, 4),
+            **self._counters,
+        }
@@ -7,21 +7,30 @@ It performs the following steps:
 1. Reads configuration (GitHub URL, GCS Bucket Name) from environment variables
    or command-line arguments.
 2. Parses the GitHub URL to identify the owner, repository, branch, and any specific subdirectory path.
-3. If a subdirectory is specified, it uses the GitHub API to recursively download only the contents of that path.
-4. If no subdirectory is specified, it first attempts to download the entire repository as a single zip file for efficiency.
-5. If the zip download fails (e.g., with a 404 Not Found error), it falls back to the recursive API download method for the entire repository.
-6. Uploads each file to the specified GCS bucket, creating the bucket if it
-   does not exist.
+3. If a subdirectory is specified, it lists that path with a single git trees API
+   request and downloads only the files whose git SHA differs from the mirrored copy.
+4. If no subdirectory is specified, it first attempts to download the entire repository
+   as a single zip file, streamed to a temporary file.
+5. If the zip download fails (e.g., with a 404 Not Found error), it falls back to the API
+   download method for the entire repository.
+6. Uploads the files to the specified GCS bucket on a bounded thread pool, creating the
+   bucket if it does not exist. Files whose git SHA (or MD5) matches the existing object
+   are skipped, so re-runs only upload what changed.
 """
 
 import argparse
+import base64
+import hashlib
 import logging
 import os
 import sys
+import tempfile
+import threading
 import requests
 import zipfile
-import io
 import re
+from concurrent.futures import Future, ThreadPoolExecutor
+from urllib.parse import quote
 
 from google.cloud import storage
 from google.api_core import exceptions
@@ -57,63 +66,203 @@ def parse_github_url(url: str) -> dict[str, str | None]:
     return {"owner": owner, "repo": repo, "branch": branch, "path": path}
 
 
-def download_repo_via_api(
+def git_blob_sha(content: bytes) -> str:
+    """Returns the git blob SHA-1 of some file content, as listed by the git trees API."""
+    return hashlib.sha1(b"blob %d\0" % len(content) + content).hexdigest()
+
+
+class GcsMirror:
+    """Uploads files to a GCS bucket concurrently, skipping unchanged ones.
+
+    Each uploaded object records the git blob SHA of its content in its
+    `git_sha` metadata. A file is skipped when the existing object has the
+    same SHA, or, for objects without it, the same MD5. Existing objects are
+    listed once, up front. At most `max_workers` uploads run at a time and at
+    most twice that many files are held in memory.
+    """
+
+    def __init__(self, bucket: storage.Bucket, max_workers: int = 16, force: bool = False) -> None:
+        self.bucket = bucket
+        self.max_workers = max_workers
+        self.force = force
+        self.uploaded = 0
+        self.skipped = 0
+        self.uploaded_bytes = 0
+        self._existing: dict[str, tuple[str | None, str | None]] = {}
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="gcs-upload")
+        self._slots = threading.BoundedSemaphore(2 * max_workers)
+        self._futures: list[Future] = []
+        self._lock = threading.Lock()
+
+    def load_existing(self, prefix: str = "") -> None:
+        for blob in self.bucket.list_blobs(prefix=prefix or None):
+            self._existing[blob.name] = ((blob.metadata or {}).get("git_sha"), blob.md5_hash)
+        logger.info(f"Found {len(self._existing)} existing objects in gs://{self.bucket.name}/{prefix}")
+
+    def is_unchanged(self, name: str, sha: str | None = None, content: bytes | None = None) -> bool:
+        """Checks a file against its existing object, by git SHA or by the MD5 of `content`."""
+        if self.force or name not in self._existing:
+            return False
+        existing_sha, existing_md5 = self._existing[name]
+        if sha is None and content is not None:
+            sha = git_blob_sha(content)
+        if existing_sha is not None:
+            return existing_sha == sha
+        return content is not None and existing_md5 == base64.b64encode(hashlib.md5(content).digest()).decode()
+
+    def skip(self, name: str) -> None:
+        with self._lock:
+            self.skipped += 1
+        logger.debug(f"  - Unchanged, skipping '{name}'")
+
+    def submit(self, name: str, fetch, sha: str | None = None) -> None:
+        """Uploads the bytes returned by `fetch()` to `name` on the pool, unless unchanged."""
+        self._slots.acquire()
+        try:
+            future = self._executor.submit(self._upload, name, fetch, sha)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        self._futures.append(future)
+
+    def _upload(self, name: str, fetch, sha: str | None) -> None:
+        content = fetch()
+        if self.is_unchanged(name, sha, content):
+            self.skip(name)
+            return
+        blob = self.bucket.blob(name)
+        blob.metadata = {"git_sha": sha or git_blob_sha(content)}
+        blob.upload_from_string(content)
+        with self._lock:
+            self.uploaded += 1
+            self.uploaded_bytes += len(content)
+        logger.info(f"  - Uploaded 'gs://{self.bucket.name}/{name}'")
+
+    def wait(self) -> None:
+        """Waits for all uploads and raises the first error."""
+        try:
+            for future in self._futures:
+                future.result()
+        finally:
+            self._futures = []
+            self._executor.shutdown(wait=True)
+
+
+def list_tree_via_api(
     session: requests.Session,
     owner: str,
     repo: str,
     branch: str,
-    bucket: storage.Bucket,
     path_in_repo: str = "",
-    base_path_to_strip: str = "",
-) -> int:
+) -> list[dict]:
     """
-    Recursively downloads repository contents via the GitHub API and uploads to GCS.
-    Returns the number of files uploaded.
+    Lists all files under a path with the git trees API, in one request when possible.
+    Returns tree entries with "path" (relative to path_in_repo), "sha" and "size".
     """
-    api_url = f"https://api.github.com/repos/{owner}/{repo}/contents/{path_in_repo}"
-    params = {"ref": branch}
+    api_base = f"https://api.github.com/repos/{owner}/{repo}/git/trees"
+    tree_ish = f"{branch}:{path_in_repo}" if path_in_repo else branch
+    logger.info(f"  - Listing tree of '{path_in_repo or '/'}' on branch '{branch}'")
+    response = session.get(f"{api_base}/{quote(tree_ish, safe='')}", params={"recursive": "1"}, timeout=60)
+    response.raise_for_status()
+    tree = response.json()
+    if not tree.get("truncated"):
+        return [entry for entry in tree["tree"] if entry["type"] == "blob"]
+
+    # Too large for one response: walk the subtrees one level at a time.
+    logger.warning("Tree listing was truncated. Listing subtrees one by one.")
+    files = []
+    pending = [("", tree["sha"])]
+    while pending:
+        prefix, sha = pending.pop()
+        response = session.get(f"{api_base}/{sha}", timeout=60)
+        response.raise_for_status()
+        for entry in response.json()["tree"]:
+            entry_path = f"{prefix}{entry['path']}"
+            if entry["type"] == "tree":
+                pending.append((f"{entry_path}/", entry["sha"]))
+            elif entry["type"] == "blob":
+                files.append({**entry, "path": entry_path})
+    return files
 
-    logger.info(f"  - Querying API for contents of: '{path_in_repo if path_in_repo else '/'}' on branch '{branch}'")
 
+def download_repo_via_api(
+    session: requests.Session,
+    owner: str,
+    repo: str,
+    branch: str,
+    mirror: GcsMirror,
+    path_in_repo: str = "",
+) -> int:
+    """
+    Mirrors the files under a path via the GitHub API. Files whose git SHA
+    matches the existing object are not downloaded.
+    Returns the number of files listed.
+    """
     try:
-        response = session.get(api_url, params=params, timeout=60)
-        response.raise_for_status()
-        contents = response.json()
+        files = list_tree_via_api(session, owner, repo, branch, path_in_repo)
+    except requests.exceptions.HTTPError as e:
+        if e.response.status_code == 404:
+            logger.warning(f"Could not find contents at path '{path_in_repo}'. It might be an empty directory or submodule. Skipping.")
+            return 0
+        raise e
 
-        # If the path points to a single file, the response is a dict, not a list.
-        if isinstance(contents, dict) and contents.get("type") == "file":
-            contents = [contents]
+    def fetch_blob(sha: str):
+        def fetch() -> bytes:
+            response = session.get(
+                f"https://api.github.com/repos/{owner}/{repo}/git/blobs/{sha}",
+                headers={"Accept": "application/vnd.github.raw"},
+                timeout=300,
+            )
+            response.raise_for_status()
+            return response.content
 
-        upload_count = 0
-        for item in contents:
-            if item["type"] == "file":
-                logger.info(f"    - Downloading file: {item['path']}")
-                file_response = session.get(item["download_url"], timeout=300)
-                file_response.raise_for_status()
+        return fetch
 
-                destination_blob_name = item["path"]
-                if base_path_to_strip and destination_blob_name.startswith(base_path_to_strip):
-                    destination_blob_name = destination_blob_name[len(base_path_to_strip) :].lstrip("/")
+    for entry in files:
+        if mirror.is_unchanged(entry["path"], sha=entry["sha"]):
+            mirror.skip(entry["path"])
+            continue
+        mirror.submit(entry["path"], fetch_blob(entry["sha"]), sha=entry["sha"])
+    return len(files)
 
+
+def download_repo_via_zip(session: requests.Session, zipball_url: str, mirror: GcsMirror) -> int:
+    """
+    Streams the repository zipball to a temporary file and mirrors its entries.
+    Returns the number of files in the archive.
+    """
+    with tempfile.TemporaryFile() as zip_file:
+        with session.get(zipball_url, stream=True, timeout=300) as response:
+            response.raise_for_status()
+            for block in response.iter_content(chunk_size=1 << 20):
+                zip_file.write(block)
+        logger.info(f"Repository downloaded successfully as a zip file ({zip_file.tell() / 2**20:.1f} MB).")
+
+        zip_file.seek(0)
+        if not zipfile.is_zipfile(zip_file):
+            raise ValueError("Downloaded content is not a valid zip file.")
+
+        zip_file.seek(0)
+        with zipfile.ZipFile(zip_file, "r") as zip_ref:
+            file_list = [member for member in zip_ref.namelist() if not member.endswith("/")]
+            if not file_list:
+                logger.warning("Zip file is empty. Nothing to upload.")
+                return 0
+            root_dir = os.path.commonprefix(zip_ref.namelist())
+            root_dir = root_dir[: root_dir.rfind("/") + 1]
+            logger.info(f"Common root directory in zip: '{root_dir}'")
+            count = 0
+            for member in file_list:
+                destination_blob_name = member[len(root_dir) :]
                 if not destination_blob_name:
                     continue
+                # Entries are read here, one at a time; only the uploads run concurrently.
+                content = zip_ref.read(member)
+                mirror.submit(destination_blob_name, lambda content=content: content)
+                count += 1
+            return count
 
-                blob = bucket.blob(destination_blob_name)
-                blob.upload_from_string(file_response.content)
-                upload_count += 1
-            elif item["type"] == "dir":
-                # Recursively download contents of the directory
-                upload_count += download_repo_via_api(
-                    session, owner, repo, branch, bucket, item["path"], base_path_to_strip
-                )
-        return upload_count
-    except requests.exceptions.HTTPError as e:
-        # If a sub-folder is not found, just log it and continue.
-        if e.response.status_code == 404:
-            logger.warning(f"Could not find contents at path '{path_in_repo}'. It might be an empty directory or submodule. Skipping.")
-            return 0
-        # Re-raise other HTTP errors to be caught by the main handler
-        raise e
 
 def main(args):
     """Main execution function."""
@@ -160,67 +309,45 @@ def main(args):
             logger.info(f"Bucket '{target_bucket_name}' created.")
 
         # --- Download Logic ---
-        upload_count = 0
-        # Use a single requests session
+        mirror = GcsMirror(bucket, max_workers=args.max_workers, force=args.force)
+        mirror.load_existing()
+        file_count = 0
+        # Use a single requests session, sized for the upload pool
         with requests.Session() as session:
+            adapter = requests.adapters.HTTPAdapter(pool_maxsize=args.max_workers)
+            session.mount("https://", adapter)
             session.headers.update({"User-Agent": "Gemini-Code-Assist-Mirror-Script"})
             if github_token:
                 logger.info("    Found GITHUB_TOKEN. Using it for authentication.")
                 session.headers.update({"Authorization": f"token {github_token}"})
 
-            # If a path is specified, go directly to API download.
-            # Otherwise, attempt zipball download first.
-            if path_to_mirror:
-                logger.info(f"Subdirectory specified. Using API-based download for path: '{path_to_mirror}'")
-                upload_count = download_repo_via_api(
-                    session, owner, repo, branch, bucket, path_in_repo=path_to_mirror, base_path_to_strip=path_to_mirror
-                )
-            else:
-                # Attempt to download the GitHub repository zip file
-                zipball_url = f"https://github.com/{owner}/{repo}/archive/refs/heads/{branch}.zip"
-                logger.info(f"Attempting to download repository as a zip file from: {zipball_url}")
-                try:
-                    response = session.get(zipball_url, stream=True, timeout=300)
-                    response.raise_for_status()
-
-                    zip_bytes_io = io.BytesIO(response.content)
-                    logger.info("Repository downloaded successfully as a zip file.")
-
-                    # Extract and upload to GCS from Zip
-                    if not zipfile.is_zipfile(zip_bytes_io):
-                        raise ValueError("Downloaded content is not a valid zip file.")
-
-                    zip_bytes_io.seek(0)
-                    with zipfile.ZipFile(zip_bytes_io, "r") as zip_ref:
-                        file_list = zip_ref.namelist()
-                        if not file_list:
-                            logger.warning("Zip file is empty. Nothing to upload.")
+            try:
+                # If a path is specified, go directly to API download.
+                # Otherwise, attempt zipball download first.
+                if path_to_mirror:
+                    logger.info(f"Subdirectory specified. Using API-based download for path: '{path_to_mirror}'")
+                    file_count = download_repo_via_api(session, owner, repo, branch, mirror, path_in_repo=path_to_mirror)
+                else:
+                    # Attempt to download the GitHub repository zip file
+                    zipball_url = f"https://github.com/{owner}/{repo}/archive/refs/heads/{branch}.zip"
+                    logger.info(f"Attempting to download repository as a zip file from: {zipball_url}")
+                    try:
+                        file_count = download_repo_via_zip(session, zipball_url, mirror)
+                    except requests.exceptions.HTTPError as e:
+                        if e.response.status_code == 404:
+                            logger.warning("Zipball download failed with 404 Not Found. Falling back to download via the GitHub API.")
+                            # Fallback to API-based download for the whole repo
+                            file_count = download_repo_via_api(session, owner, repo, branch, mirror, path_in_repo="")
                         else:
-                            root_dir = os.path.commonprefix(file_list)
-                            logger.info(f"Common root directory in zip: '{root_dir}'")
-                            for member in file_list:
-                                if member.endswith("/"):
-                                    continue
-                                file_content = zip_ref.read(member)
-                                destination_blob_name = member[len(root_dir) :]
-                                if not destination_blob_name:
-                                    continue
-                                logger.info(f"  - Uploading '{member}' to 'gs://{target_bucket_name}/{destination_blob_name}'")
-                                blob = bucket.blob(destination_blob_name)
-                                blob.upload_from_string(file_content)
-                                upload_count += 1
-                except requests.exceptions.HTTPError as e:
-                    if e.response.status_code == 404:
-                        logger.warning("Zipball download failed with 404 Not Found. Falling back to folder-by-folder download via the GitHub API.")
-                        # Fallback to API-based download for the whole repo
-                        upload_count = download_repo_via_api(
-                            session, owner, repo, branch, bucket, path_in_repo="", base_path_to_strip=""
-                        )
-                    else:
-                        raise e
+                            raise e
+            finally:
+                mirror.wait()
 
         logger.info("---" * 10)
-        logger.info(f"✅ Mirroring complete! Uploaded {upload_count} files to gs://{target_bucket_name}")
+        logger.info(
+            f"✅ Mirroring complete! {file_count} files: uploaded {mirror.uploaded} "
+            f"({mirror.uploaded_bytes / 2**20:.1f} MB), skipped {mirror.skipped} unchanged, to gs://{target_bucket_name}"
+        )
         logger.info("---" * 10)
 
     except requests.exceptions.RequestException as e:
@@ -236,5 +363,7 @@ if __name__ == "__main__":
     parser.add_argument("--github_repo_url", type=str, help="The URL of the GitHub repository to mirror. Overrides $GITHUB_REPO_URL.")
     parser.add_argument("--target_gcs_bucket", type=str, help="The name of the GCS bucket for the mirror. Overrides $GITHUB_TARGET_BUCKET.")
     parser.add_argument("--github_repo_branch", type=str, help="The branch to use if not specified in the URL. Overrides $GITHUB_REPO_BRANCH.")
+    parser.add_argument("--max_workers", type=int, default=16, help="Number of concurrent downloads/uploads.")
+    parser.add_argument("--force", action="store_true", help="Upload every file, even if unchanged.")
     parsed_args = parser.parse_args()
     main(parsed_args)
\ No newline at end of file
@@ -1,17 +1,23 @@
 #!/usr/bin/env python3
 
 import os
+import sqlite3
 import sys
 import uvicorn
 import logging as python_logging
 
 # Add rag-agent to sys.path
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'agents', 'rag-agent')))
+# Add the project root so the shared 'agents' package (agent registry) can be imported.
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+# Add this directory so the background log writer can be imported.
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 import google.auth
-from starlette.middleware.base import BaseHTTPMiddleware
 import json
 import google.cloud.logging
+from log_writer import BackgroundLogWriter
+from agents.session_pool import current_session_id
 
 # --- Configuration & Custom Logger ---
 PROJECT_ID = os.environ.get("PROJECT_ID")
@@ -26,90 +32,224 @@ print(f"--- Using PROJECT_ID: {PROJECT_ID} ---")
 LOCATION = os.environ.get("REGION", "us-central1")
 SHORT_LOG_NAME = os.environ.get("LOG_NAME", "run_gemini_from_file")
 print(f"--- Using LOG_NAME: {SHORT_LOG_NAME} ---")
-from starlette.requests import Request
+# Requests to these paths have the user message and the agent's final answer logged.
+LOGGED_PATHS = ("/invoke", "/run_sse", "/run")
+# Largest request body, and largest non-streaming response body, kept for logging.
+MAX_LOGGED_BODY_BYTES = int(os.environ.get("MAX_LOGGED_BODY_BYTES", 10 * 1024 * 1024))
+# Number of uvicorn worker processes. With more than one, auto-reload is off and
+# sessions are kept in a SQLite database in WAL mode shared by all workers,
+# unless SESSION_SERVICE_URI points at another database. Artifacts and memory
+# must then be shared too, through ARTIFACT_SERVICE_URI (e.g. a gs:// bucket)
+# and MEMORY_SERVICE_URI (e.g. rag://<corpus> or agentengine://<id>): the ADK
+# web app would otherwise give each worker its own in-memory services.
+WORKERS = int(os.environ.get("WORKERS", 1))
+SESSION_DB_PATH = os.path.abspath(os.environ.get("SESSION_DB_PATH", ".adk_state.db"))
+# Seconds a worker waits for another worker's write lock on the session database.
+SESSION_DB_TIMEOUT_SECONDS = int(os.environ.get("SESSION_DB_TIMEOUT_SECONDS", 30))
+SESSION_SERVICE_URI = os.environ.get("SESSION_SERVICE_URI") or (
+    f"sqlite:///{SESSION_DB_PATH}?timeout={SESSION_DB_TIMEOUT_SECONDS}" if WORKERS > 1 else None
+)
+ARTIFACT_SERVICE_URI = os.environ.get("ARTIFACT_SERVICE_URI")
+MEMORY_SERVICE_URI = os.environ.get("MEMORY_SERVICE_URI")
 
-class LoggingMiddleware(BaseHTTPMiddleware):
-    async def dispatch(self, request: Request, call_next):
-        print(f"DEBUG: LoggingMiddleware entered for path: {request.url.path}")
-        
-        if "/invoke" in request.url.path or "/run_sse" in request.url.path:
-            # Read the request body
-            body = await request.body()
-            print(f"DEBUG: LoggingMiddleware received body: {body.decode()}")
-            
-            # Let the request proceed to get the response
-            response = await call_next(request)
-            
-            # Read response body
-            response_body = b""
-            async for chunk in response.body_iterator:
-                response_body += chunk
-            print(f"DEBUG: Raw response body: {response_body.decode()}") # Added debug print
-
-            # Recreate response to send to client
-            from starlette.responses import Response
-            response = Response(content=response_body, status_code=response.status_code, headers=dict(response.headers), media_type=response.media_type)
-
-            # Now, log the relevant information
+if WORKERS > 1:
+    missing = [
+        name for name, uri in (("ARTIFACT_SERVICE_URI", ARTIFACT_SERVICE_URI), ("MEMORY_SERVICE_URI", MEMORY_SERVICE_URI))
+        if not uri
+    ]
+    if missing:
+        raise ValueError(
+            f"WORKERS={WORKERS} needs {' and '.join(missing)} so that artifacts and memory are shared by "
+            "all workers. Set them, or run a single worker."
+        )
+    if not os.environ.get("SESSION_SERVICE_URI"):
+        # WAL lets the workers read while one of them writes. The mode is
+        # stored in the database file, so setting it once here is enough.
+        connection = sqlite3.connect(SESSION_DB_PATH, timeout=SESSION_DB_TIMEOUT_SECONDS)
+        try:
+            connection.execute("PRAGMA journal_mode=WAL")
+        finally:
+            connection.close()
+
+
+def _first_text(content) -> str:
+    parts = (content or {}).get("parts") or [{}]
+    return parts[0].get("text", "") or ""
+
+
+def _session_id(request_body: bytes):
+    try:
+        request_data = json.loads(request_body)
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        return None
+    return request_data.get("sessionId") if isinstance(request_data, dict) else None
+
+
+def _is_final_response(event: dict) -> bool:
+    """Mirrors google.adk Event.is_final_response() on a serialized event."""
+    if "isFinalResponse" in event:
+        return bool(event["isFinalResponse"])
+    if event.get("partial") or event.get("author") == "user":
+        return False
+    actions = event.get("actions") or {}
+    if actions.get("skipSummarization") or event.get("longRunningToolIds"):
+        return True
+    parts = (event.get("content") or {}).get("parts") or []
+    return not any(
+        part.get("functionCall") or part.get("functionResponse") or part.get("codeExecutionResult")
+        for part in parts
+    )
+
+
+class FinalResponseParser:
+    """Finds the agent's final answer in a response body fed to it chunk by chunk.
+
+    Server-sent events are parsed as each one completes, so only the event in
+    progress is buffered. Other bodies (e.g. the JSON of /run) are buffered up
+    to MAX_LOGGED_BODY_BYTES and parsed at the end.
+    """
+
+    def __init__(self, streaming: bool):
+        self.streaming = streaming
+        self.final_answer = ""
+        self._buffer = b""
+        self._overflow = False
+
+    def feed(self, chunk: bytes) -> None:
+        if not self.streaming:
+            if len(self._buffer) + len(chunk) > MAX_LOGGED_BODY_BYTES:
+                self._overflow = True
+                self._buffer = b""
+            elif not self._overflow:
+                self._buffer += chunk
+            return
+        self._buffer += chunk.replace(b"\r\n", b"\n")
+        while b"\n\n" in self._buffer:
+            raw_event, self._buffer = self._buffer.split(b"\n\n", 1)
+            self._parse_sse_event(raw_event)
+
+    def close(self) -> str:
+        if self.streaming:
+            if self._buffer.strip():
+                self._parse_sse_event(self._buffer)
+        elif self._buffer and not self._overflow:
             try:
-                request_data = json.loads(body)
-                print(f"DEBUG: LoggingMiddleware parsed request_data: {request_data}")
-                prompt = request_data.get("newMessage", {}).get("parts", [{}])[0].get("text", "")
-                session_id = request_data.get('sessionId')
-                user_id = request_data.get('userId')
-
-                cloud_logger = request.app.state.cloud_logger # Access the logger from app.state
-
-                if prompt:
-                    print(f"DEBUG: LoggingMiddleware triggered for prompt: {prompt}")
-                    cloud_logger.log_struct(
-                        {
-                            'prompt': prompt,
-                            'session_id': session_id,
-                            'user_id': user_id,
-                            'request_id': session_id,
-                            'log_type': 'user_message'
-                        },
-                        severity='INFO'
-                    )
-
-                # Log agent's final answer
-                # Strip "data: " prefix if present, as it's not valid JSON
-                response_str = response_body.decode()
-                if response_str.startswith("data: "):
-                    response_str = response_str[len("data: "):]
-                
-                response_data = json.loads(response_str)
-                agent_response_text = ""
-                # Assuming the response structure from ADK's /run_sse or /invoke endpoint
-                # This might need adjustment based on actual ADK response format
-                if "events" in response_data:
-                    for event in response_data["events"]:
-                        if event.get("isFinalResponse"):
-                            agent_response_text = event.get("content", {}).get("parts", [{}])[0].get("text", "")
-                            break
-                elif "content" in response_data: # For /invoke endpoint directly
-                    agent_response_text = response_data.get("content", {}).get("parts", [{}])[0].get("text", "")
-
-                if agent_response_text:
-                    cloud_logger.log_struct(
-                        {
-                            'final_answer': agent_response_text,
-                            'session_id': session_id,
-                            'user_id': user_id,
-                            'request_id': session_id,
-                            'log_type': 'final_answer'
-                        },
-                        severity='INFO'
-                    )
-
-            except (json.JSONDecodeError, KeyError) as e:
-                print(f"DEBUG: LoggingMiddleware: Failed to parse JSON body or find data: {e}")
-                pass
-            return response
-        else:
-            # If the path does not match, just pass the request through
-            return await call_next(request)
+                self._parse_json(json.loads(self._buffer))
+            except (json.JSONDecodeError, UnicodeDecodeError) as e:
+                python_logging.debug(f"LoggingMiddleware: could not parse response body: {e}")
+        self._buffer = b""
+        return self.final_answer
+
+    def _parse_sse_event(self, raw_event: bytes) -> None:
+        data = b"\n".join(
+            line[len(b"data:"):].lstrip(b" ") for line in raw_event.split(b"\n") if line.startswith(b"data:")
+        )
+        if not data:
+            return
+        try:
+            self._parse_json(json.loads(data))
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            python_logging.debug(f"LoggingMiddleware: could not parse event: {e}")
+
+    def _parse_json(self, data) -> None:
+        if isinstance(data, dict) and "events" in data:
+            data = data["events"]
+        if isinstance(data, list):
+            for event in data:
+                self._parse_json(event)
+        elif isinstance(data, dict) and "content" in data and _is_final_response(data):
+            text = _first_text(data.get("content"))
+            if text:
+                self.final_answer = text
+
+
+class LoggingMiddleware:
+    """Logs the user message and the agent's final answer of agent requests.
+
+    A pure ASGI middleware: response messages are passed on to the client as
+    soon as the app sends them, so server-sent events still stream, and each
+    chunk is only fed to an incremental FinalResponseParser on the way. The
+    log entries are handed to the app's BackgroundLogWriter once the response
+    is complete, which writes them in batches off the request path.
+
+    Once the request body has been read, its sessionId becomes the current
+    session (agents.session_pool.current_session_id) of the request's task,
+    so BaseAgent queries made while serving it use the ADK session.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].endswith(LOGGED_PATHS):
+            await self.app(scope, receive, send)
+            return
+
+        request_body = bytearray()
+        parser = None
+
+        async def receive_and_keep():
+            message = await receive()
+            if message["type"] == "http.request" and len(request_body) < MAX_LOGGED_BODY_BYTES:
+                request_body.extend(message.get("body", b""))
+                if not message.get("more_body", False):
+                    session_id = _session_id(bytes(request_body))
+                    if session_id:
+                        current_session_id.set(session_id)
+            return message
+
+        async def send_and_parse(message):
+            nonlocal parser
+            if message["type"] == "http.response.start":
+                content_type = dict(message.get("headers") or []).get(b"content-type", b"")
+                parser = FinalResponseParser(streaming=content_type.startswith(b"text/event-stream"))
+            elif message["type"] == "http.response.body" and parser is not None:
+                await send(message)
+                parser.feed(message.get("body", b""))
+                return
+            await send(message)
+
+        try:
+            await self.app(scope, receive_and_keep, send_and_parse)
+        finally:
+            final_answer = parser.close() if parser is not None else ""
+            log_writer = getattr(scope.get("app").state, "log_writer", None) if scope.get("app") else None
+            if log_writer is not None:
+                for entry in self._log_entries(bytes(request_body), final_answer):
+                    log_writer.submit(entry, severity='INFO')
+
+    @staticmethod
+    def _log_entries(request_body: bytes, final_answer: str) -> list:
+        try:
+            request_data = json.loads(request_body)
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            python_logging.debug(f"LoggingMiddleware: could not parse request body: {e}")
+            return []
+        prompt = _first_text(request_data.get("newMessage"))
+        session_id = request_data.get("sessionId")
+        user_id = request_data.get("userId")
+        entries = []
+        if prompt:
+            entries.append(
+                {
+                    'prompt': prompt,
+                    'session_id': session_id,
+                    'user_id': user_id,
+                    'request_id': session_id,
+                    'log_type': 'user_message'
+                }
+            )
+        if final_answer:
+            entries.append(
+                {
+                    'final_answer': final_answer,
+                    'session_id': session_id,
+                    'user_id': user_id,
+                    'request_id': session_id,
+                    'log_type': 'final_answer'
+                }
+            )
+        return entries
 
 # --- App Initialization ---
 # We no longer need to set up logging here; it will be passed to uvicorn.run()
@@ -132,6 +272,9 @@ async def lifespan(app: FastAPI):
         client = google_cloud_logging.Client(project=current_project_id)
         app.state.cloud_logging_client = client # Store client in app.state
         app.state.cloud_logger = client.logger(SHORT_LOG_NAME) # Store logger in app.state
+        # Request logs are queued and written in batches by a background task.
+        app.state.log_writer = BackgroundLogWriter.from_env(app.state.cloud_logger)
+        app.state.log_writer.start()
         
         # Keep the python_logging handler for other internal logs if needed, but it won't be used by middleware
         cloud_handler = CloudLoggingHandler(client=client, name=SHORT_LOG_NAME)
@@ -143,9 +286,18 @@ async def lifespan(app: FastAPI):
     else:
         python_logging.warning("PROJECT_ID not found, CloudLoggingHandler not attached in worker process.")
 
+    # Set up the agents listed in $PREWARM_AGENTS now, so their first request
+    # doesn't pay for vertexai.init and model construction. Other agents are
+    # set up lazily on their first query.
+    from agents.agent_registry import get_registry
+    get_registry().prewarm_from_env(project=current_project_id, location=LOCATION)
+
     yield
 
-    # Shutdown event: Close CloudLoggingHandler
+    # Shutdown event: Write the queued request logs, then close CloudLoggingHandler
+    log_writer = getattr(app.state, "log_writer", None)
+    if log_writer is not None:
+        await log_writer.stop()
     root_logger = python_logging.getLogger()
     for handler in root_logger.handlers:
         if isinstance(handler, CloudLoggingHandler): # Check for CloudLoggingHandler
@@ -155,17 +307,32 @@ async def lifespan(app: FastAPI):
 
 app = get_fast_api_app(
     agents_dir=os.path.abspath(os.path.join(os.path.dirname(__file__), '..', 'agents')),
+    session_service_uri=SESSION_SERVICE_URI,
+    artifact_service_uri=ARTIFACT_SERVICE_URI,
+    memory_service_uri=MEMORY_SERVICE_URI,
     web=True,
     lifespan=lifespan,
 )
 app.add_middleware(LoggingMiddleware)
 
+
+@app.get("/log_writer/metrics")
+async def log_writer_metrics():
+    """Queue depth, batch and drop counters of the background log writer."""
+    log_writer = getattr(app.state, "log_writer", None)
+    return log_writer.metrics() if log_writer is not None else {}
+
 if __name__ == "__main__":
     print("--- Starting ADK Web Server with custom logging ---")
     print("ADK will manage its own internal OpenTelemetry tracing.")
+    # The session tables were created when `app` was built above, before the
+    # workers start, so the workers don't race to create them.
+    if WORKERS > 1:
+        print(f"--- Running {WORKERS} workers, sessions in {SESSION_SERVICE_URI}, artifacts in {ARTIFACT_SERVICE_URI}, memory in {MEMORY_SERVICE_URI} ---")
     uvicorn.run(
         "run_adk_web_with_logging:app",
         host="127.0.0.1",
         port=8001,
-        reload=True, # This enables auto-reloading
+        workers=WORKERS if WORKERS > 1 else None,
+        reload=WORKERS == 1, # Auto-reloading only works with a single worker
     )
\ No newline at end of file
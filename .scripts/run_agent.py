@@ -4,20 +4,30 @@
 import os
 import sys
 import argparse
+import asyncio
 import uuid
 import re
 import json
 import logging
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime
 from pathlib import Path
 from typing import Dict, Any, List, Optional, Tuple
 
 import vertexai
 from vertexai.preview import rag
-from vertexai.generative_models import GenerativeModel, Tool, Part, FunctionDeclaration
+from vertexai.generative_models import Content, GenerativeModel, Tool, Part
 from google.cloud import logging as cloud_logging
 from google.cloud.logging.handlers import setup_logging
 
+# Make the 'agents' package at the project root importable.
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from agents.context_cache import cached_model
+from agents.history import POLICY_SUMMARIZE, ConversationHistory
+from agents.tool_registry import get_tool_registry
 # Import our defined tools
 from agent_tools import get_todays_date
 # Import shared evaluation utilities
@@ -28,6 +38,11 @@ logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s', str
 logger = logging.getLogger(__name__)
 
 MAX_AGENT_STEPS = 10 # Prevent infinite loops
+# Upper bound on synchronous tools executed at the same time within one step.
+MAX_TOOL_WORKERS = int(os.environ.get("MAX_TOOL_WORKERS", "8"))
+# Conversation history compaction: "none", "sliding_window" or "summarize".
+HISTORY_POLICY = os.environ.get("HISTORY_POLICY", "sliding_window")
+HISTORY_MAX_TOKENS = int(os.environ.get("HISTORY_MAX_TOKENS", "32000"))
 
 # Regex to find sections like # Name, # Instruction, etc. Handles multiple hashes,
 # optional space after hashes, and hyphens in the name. It correctly limits
@@ -40,10 +55,12 @@ LOCATION = os.environ.get("REGION", "us-central1")
 SUPPORTED_ON_DEMAND_METRICS = ["fluency", "coherence", "safety", "rouge"]
 
 # --- Tool and Logging Setup ---
-AVAILABLE_TOOLS = {
-    # This dictionary maps function tool names from markdown to actual Python functions.
-    "get_todays_date": get_todays_date,
-}
+# Function tools the task files can reference by name. They live in the same
+# shared registry as the agents' tools; a '# Tools' entry can also name a tool
+# by "import_path" and set "timeout_seconds", "max_concurrency", "memoize" and
+# "ttl_seconds" for it.
+TOOL_REGISTRY = get_tool_registry()
+TOOL_REGISTRY.register("get_todays_date", func=get_todays_date)
 
 def setup_cloud_logger():
     project_id = os.getenv("PROJECT_ID")
@@ -147,8 +164,35 @@ def parse_sections(text_content: str) -> Tuple[Dict[str, str], Optional[List[str
 
     return sections, eval_metrics_list
 
+async def execute_tool_call(function_call, executor: ThreadPoolExecutor, session_id: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Executes one function call requested by the model and returns the payload
+    for its function response. Coroutine tools are awaited directly; regular
+    tools run on the executor so several can make progress at once. Memoized
+    tools reuse the result of an identical earlier call in the same session.
+    """
+    tool_name = function_call.name
+    tool_args = {key: value for key, value in function_call.args.items()}
+
+    if tool_name not in TOOL_REGISTRY:
+        print(f"Error: Agent tried to call unknown tool '{tool_name}'")
+        return {"error": f"Tool '{tool_name}' not found."}
+
+    try:
+        tool_output = await TOOL_REGISTRY.acall(tool_name, tool_args, scope=session_id, executor=executor)
+        print(f"Observation ({tool_name}): {tool_output}")
+        return {"result": tool_output}
+    except Exception as e:
+        print(f"Error executing tool '{tool_name}': {e}")
+        # Feed the error back to the model
+        return {"error": str(e)}
+
 # --- Core Agent Logic ---
 def run_agent(prompt_filepath: str):
+    """Runs the agent described by a task file to completion."""
+    asyncio.run(run_agent_async(prompt_filepath))
+
+async def run_agent_async(prompt_filepath: str):
     filepath = Path(prompt_filepath)
     session_id = f"agent-session-{datetime.now().strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
     print(f"--- Starting Agent Session: {session_id} for file: {filepath.name} ---")
@@ -187,13 +231,8 @@ def run_agent(prompt_filepath: str):
     # Code fence stripping is now handled robustly in the parse_sections function.
     # 2. Setup Model and Tools
     model_name = os.getenv('GEMINI_MODEL_NAME', 'gemini-1.5-flash-latest')
-    model = GenerativeModel(
-        model_name,
-        system_instruction=[system_instruction]
-    )
-    
     all_tools = []
-    function_declarations = []
+    function_tool_names = []
     # Only attempt to parse JSON if the tools string is not empty.
     if tools_json_str:
         try:
@@ -220,79 +259,124 @@ def run_agent(prompt_filepath: str):
                         logger.info(f"Configured RAG tool '{tool_config.get('name')}' with corpus: {rag_corpus}")
                 elif tool_type == "FunctionTool":
                     tool_name = tool_config.get("name")
-                    if tool_name in AVAILABLE_TOOLS:
-                        func = AVAILABLE_TOOLS[tool_name]
-                        function_declarations.append(FunctionDeclaration.from_func(func))
+                    if TOOL_REGISTRY.configure(tool_config) is not None:
+                        function_tool_names.append(tool_name)
                         logger.info(f"Found Function tool: '{tool_name}'")
                     else:
-                        logger.warning(f"Function tool '{tool_name}' defined in markdown but not found in agent_tools.py")
+                        logger.warning(f"Function tool '{tool_name}' defined in markdown but not found in agent_tools.py and has no 'import_path'")
         except json.JSONDecodeError as e:
             logger.error(f"Error parsing JSON in # Tools section: {e}")
 
+    # Tools are imported on first use, so only the ones this task needs are loaded.
+    function_declarations = TOOL_REGISTRY.function_declarations(function_tool_names)
     if function_declarations:
         all_tools.append(Tool(function_declarations=function_declarations))
         logger.info(f"Configured {len(function_declarations)} function-based tools.")
 
+    # Serve the static instruction and tool definitions from a context cache
+    # when enabled and large enough, so each step only sends the conversation.
+    model = cached_model(
+        model_name, system_instruction=system_instruction, tools=all_tools, project=PROJECT_ID, location=LOCATION
+    )
+    prefix_cached = model is not None
+    if not prefix_cached:
+        model = GenerativeModel(
+            model_name,
+            system_instruction=[system_instruction]
+        )
+    request_tools = None if prefix_cached else all_tools
+
     # 3. Run the Agent Loop
-    conversation_history = [initial_prompt]
+    summarizer = None
+    if HISTORY_POLICY == POLICY_SUMMARIZE:
+        summarizer_model = GenerativeModel(model_name)
+        summarizer = lambda summary_prompt: summarizer_model.generate_content(summary_prompt).text
+    conversation_history = ConversationHistory(
+        policy=HISTORY_POLICY,
+        max_tokens=HISTORY_MAX_TOKENS,
+        summarizer=summarizer,
+        # The summary follows the pinned task prompt and precedes a model turn,
+        # so it is given as a model turn followed by a user turn to keep the
+        # roles alternating.
+        summary_turn_factory=lambda summary: [
+            Content(role="model", parts=[Part.from_text(f"Summary of my earlier steps:\n{summary}")]),
+            Content(role="user", parts=[Part.from_text("Continue with the task.")]),
+        ],
+    )
+    conversation_history.append(Content(role="user", parts=[Part.from_text(initial_prompt)]))
+
+    async def add_turn(content: Content, tokens: Optional[int] = None) -> None:
+        # Compaction may call the summarizer model, which blocks, so it runs off the event loop.
+        await asyncio.to_thread(conversation_history.append, content, tokens)
+
     final_answer = ""
 
-    for step in range(MAX_AGENT_STEPS):
-        print(f"\n[Step {step + 1}] Thinking...")
-        # Pass the dynamically built list of tools to the model
-        response = model.generate_content(conversation_history, tools=all_tools)
-        part = response.candidates[0].content.parts[0]
-
-        # New: Check for and display grounding metadata from the RAG tool
-        if hasattr(response.candidates[0], 'grounding_metadata') and response.candidates[0].grounding_metadata.retrieval_queries:
-            print("\n--- Grounding Metadata (Retrieved from RAG Engine) ---")
-            for query in response.candidates[0].grounding_metadata.retrieval_queries:
-                for chunk in query.retrieved_chunks:
-                     print(f"  - Source: {chunk.source}")
-                     print(f"  - Content: {chunk.content[:150]}...")
-            print("----------------------------------------------------")
-
-        if part.function_call:
-            function_call = part.function_call
-            tool_name = function_call.name
-            tool_args = {key: value for key, value in function_call.args.items()}
-            print(f"Action: Calling tool '{tool_name}' with args: {tool_args}")
-
-            agent_logger.log({
-                "step": step, "log_type": "thought",
-                "thought": f"Decided to call tool '{tool_name}' with arguments {tool_args}."
-            })
-
-            if tool_name in AVAILABLE_TOOLS:
-                tool_function = AVAILABLE_TOOLS[tool_name]
-                try:
-                    tool_output = tool_function(**tool_args)
-                    print(f"Observation: {tool_output}")
+    with ThreadPoolExecutor(max_workers=MAX_TOOL_WORKERS, thread_name_prefix="agent-tool") as tool_executor:
+        for step in range(MAX_AGENT_STEPS):
+            print(f"\n[Step {step + 1}] Thinking...")
+            # Pass the dynamically built list of tools to the model
+            response = await model.generate_content_async(conversation_history.contents(), tools=request_tools)
+            candidate = response.candidates[0]
+            usage_metadata = getattr(response, 'usage_metadata', None)
+            if usage_metadata:
+                logger.info(f"Step {step + 1} input tokens: {usage_metadata.prompt_token_count} (history: {len(conversation_history)} turns, ~{conversation_history.total_tokens} tokens)")
+
+            # New: Check for and display grounding metadata from the RAG tool
+            if hasattr(candidate, 'grounding_metadata') and candidate.grounding_metadata.retrieval_queries:
+                print("\n--- Grounding Metadata (Retrieved from RAG Engine) ---")
+                for query in candidate.grounding_metadata.retrieval_queries:
+                    for chunk in query.retrieved_chunks:
+                         print(f"  - Source: {chunk.source}")
+                         print(f"  - Content: {chunk.content[:150]}...")
+                print("----------------------------------------------------")
+
+            function_calls = [part.function_call for part in candidate.content.parts if part.function_call]
+
+            if function_calls:
+                # Run every tool the model asked for in this step concurrently, then
+                # answer all of them in a single turn to save round trips.
+                for function_call in function_calls:
+                    tool_args = {key: value for key, value in function_call.args.items()}
+                    print(f"Action: Calling tool '{function_call.name}' with args: {tool_args}")
                     agent_logger.log({
-                        "step": step, "log_type": "tool_result",
-                        "tool_name": tool_name, "tool_args": tool_args, "tool_output": tool_output
+                        "step": step, "log_type": "thought",
+                        "thought": f"Decided to call tool '{function_call.name}' with arguments {tool_args}."
                     })
-                    conversation_history.append(response.candidates[0].content) # Add model's function call
-                    conversation_history.append(Part.from_function_response(name=tool_name, response={"result": tool_output}))
-                except Exception as e:
-                    print(f"Error executing tool '{tool_name}': {e}")
-                    # Feed the error back to the model
-                    conversation_history.append(Part.from_function_response(name=tool_name, response={"error": str(e)}))
+
+                function_responses = await asyncio.gather(*(
+                    execute_tool_call(function_call, tool_executor, session_id) for function_call in function_calls
+                ))
+
+                for function_call, function_response in zip(function_calls, function_responses):
+                    if "result" in function_response:
+                        agent_logger.log({
+                            "step": step, "log_type": "tool_result",
+                            "tool_name": function_call.name,
+                            "tool_args": {key: value for key, value in function_call.args.items()},
+                            "tool_output": function_response["result"],
+                        })
+
+                # Add model's function calls, using the exact output token count when available.
+                await add_turn(candidate.content, tokens=getattr(usage_metadata, 'candidates_token_count', None) or None)
+                await add_turn(Content(role="user", parts=[
+                    Part.from_function_response(name=function_call.name, response=function_response)
+                    for function_call, function_response in zip(function_calls, function_responses)
+                ]))
             else:
-                print(f"Error: Agent tried to call unknown tool '{tool_name}'")
-                conversation_history.append(Part.from_function_response(name=tool_name, response={"error": f"Tool '{tool_name}' not found."}))
-        else:
-            # Safely get the text attribute. If it's missing, the model has finished
-            # without a clear text response, which can happen. Default to an empty string.
-            final_answer = getattr(part, 'text', '')
-            if not final_answer:
-                logger.warning("Model finished without a function call or a text response. The agent might be stuck or has completed its task implicitly.")
-                final_answer = "(No final text answer provided by the model)"
-            print(f"\nFinal Answer: {final_answer}")
-            agent_logger.log({
-                "step": step, "log_type": "final_answer", "final_answer": final_answer
-            })
-            break # Agent has finished
+                # Safely get the text attribute. If it's missing, the model has finished
+                # without a clear text response, which can happen. Default to an empty string.
+                final_answer = "".join(getattr(part, 'text', '') or '' for part in candidate.content.parts)
+                if not final_answer:
+                    logger.warning("Model finished without a function call or a text response. The agent might be stuck or has completed its task implicitly.")
+                    final_answer = "(No final text answer provided by the model)"
+                print(f"\nFinal Answer: {final_answer}")
+                agent_logger.log({
+                    "step": step, "log_type": "final_answer", "final_answer": final_answer
+                })
+                break # Agent has finished
+
+    TOOL_REGISTRY.log_metrics()
+    TOOL_REGISTRY.clear_memo(scope=session_id)
 
     # 4. Save Output
     output_filename = filepath.with_name(f"{filepath.stem}.{model_name}.output.md")
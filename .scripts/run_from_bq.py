@@ -1,88 +1,373 @@
 #!/usr/bin/env python3
 # Install required libraries first:
-# pip install --upgrade google-cloud-aiplatform google-cloud-bigquery
+# pip install --upgrade google-cloud-aiplatform google-cloud-bigquery pyyaml
+"""
+Runs grounded Gemini generations over the rows of a BigQuery table and writes
+one result row per source row to a date-partitioned, clustered table.
+
+The job is described by a YAML (or JSON) config file; every key is optional
+and defaults to the values in DEFAULT_CONFIG:
+
+    project_id: my-project
+    source_table: my-project.dataset.guidelines
+    row_key_column: guideline_id          # omit to key rows by a hash of their prompt columns
+    prompt_columns: [TITLE, GUIDELINE]
+    prompt_template: "{TITLE}\\n\\n{GUIDELINE}"   # omit to use "column: value" lines
+    source_filter: "STATUS = 'active'"
+    destination_table: my-project.dataset.guideline_answers
+    cluster_columns: [row_key]
+
+    uv run python .scripts/run_from_bq.py --config batch_job.yaml
+
+Each result row records the row key, the input columns, the response, token
+usage, latency, attempts, grounding sources and any error. Results are
+partitioned by day of processed_at, so re-runs only check the partitions of
+the last `resume_lookback_days` days for rows that already succeeded.
+"""
+
+import argparse
+import json
+import os
+import threading
+import time
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field, fields
+from datetime import datetime, timezone
 
 import vertexai
+from google.api_core import exceptions
 from vertexai.generative_models import GenerativeModel, Tool, grounding
 from google.cloud import bigquery
-import time
 
-# --- Your Configuration ---
-PROJECT_ID = "kallogjeri-project-345114"
-LOCATION = "us-central1"
-DATASTORE_PATH = "projects/kallogjeri-project-345114/locations/global/collections/default_collection/dataStores/as_hcls_demo"
+# --- Default Configuration ---
+DEFAULT_CONFIG = {
+    "project_id": os.getenv("PROJECT_ID", "kallogjeri-project-345114"),
+    "location": os.getenv("REGION", "us-central1"),
+    "model": "gemini-2.5-flash",
+    "datastore_path": "projects/kallogjeri-project-345114/locations/global/collections/default_collection/dataStores/as_hcls_demo",
+    # BigQuery Details
+    "source_table": "kallogjeri-project-345114.test_upload.test",  # Table with prompts
+    "prompt_columns": ["GUIDELINE"],  # The columns in your source table making up the prompts
+    # Table to store results. Not the legacy `test_results` table, whose
+    # prompt/response schema predates RESULT_SCHEMA.
+    "destination_table": "kallogjeri-project-345114.test_upload.grounded_results",
+}
+
+
+@dataclass
+class BatchJobConfig:
+    project_id: str
+    source_table: str
+    destination_table: str
+    prompt_columns: list[str]
+    datastore_path: str | None = None  # Vertex AI Search datastore to ground on; None for no grounding
+    location: str = "us-central1"
+    model: str = "gemini-2.5-flash"
+    row_key_column: str | None = None  # Source column identifying a row; defaults to a hash of the prompt columns
+    prompt_template: str | None = None  # str.format template over the prompt columns
+    source_filter: str | None = None  # SQL condition selecting source rows
+    cluster_columns: list[str] = field(default_factory=lambda: ["row_key"])
+    resume_lookback_days: int = 30  # Partitions checked for rows that already succeeded
+    # Batch runner settings
+    max_concurrency: int = 8  # Generations in flight at once
+    requests_per_minute: float = 60  # Rate limit across all workers
+    max_retries: int = 5  # Retries of a rate-limited or unavailable model call
+    page_size: int = 500  # Rows read from BigQuery per page
+    flush_every_rows: int = 100  # Write results after this many rows...
+    flush_every_seconds: float = 30  # ...or this many seconds, whichever comes first
+
+    @classmethod
+    def from_file(cls, path: str | None) -> "BatchJobConfig":
+        values = dict(DEFAULT_CONFIG)
+        if path:
+            import yaml
+
+            with open(path, "r", encoding="utf-8") as f:
+                values.update(yaml.safe_load(f) or {})
+        unknown = set(values) - {f.name for f in fields(cls)}
+        if unknown:
+            raise ValueError(f"Unknown config keys in '{path}': {sorted(unknown)}")
+        config = cls(**values)
+        if not config.prompt_columns:
+            raise ValueError("'prompt_columns' must list at least one column.")
+        return config
+
 
-# BigQuery Details
-BQ_SOURCE_TABLE = "kallogjeri-project-345114.test_upload.test"  # Table with prompts
-BQ_PROMPT_COLUMN = "GUIDELINE"  # The column in your source table containing the prompts
-BQ_DESTINATION_TABLE = "kallogjeri-project-345114.test_upload.test" # Table to store results
+RESULT_SCHEMA = [
+    bigquery.SchemaField("row_key", "STRING", mode="REQUIRED"),
+    bigquery.SchemaField("run_id", "STRING"),
+    bigquery.SchemaField("processed_at", "TIMESTAMP", mode="REQUIRED"),
+    bigquery.SchemaField("model", "STRING"),
+    bigquery.SchemaField("inputs", "STRING", description="The prompt columns of the source row, as JSON."),
+    bigquery.SchemaField("prompt", "STRING"),
+    bigquery.SchemaField("grounded_response", "STRING"),
+    bigquery.SchemaField("error", "STRING"),
+    bigquery.SchemaField("attempts", "INT64"),
+    bigquery.SchemaField("latency_ms", "FLOAT64"),
+    bigquery.SchemaField("prompt_tokens", "INT64"),
+    bigquery.SchemaField("response_tokens", "INT64"),
+    bigquery.SchemaField("total_tokens", "INT64"),
+    bigquery.SchemaField(
+        "grounding_sources",
+        "RECORD",
+        mode="REPEATED",
+        fields=[bigquery.SchemaField("uri", "STRING"), bigquery.SchemaField("title", "STRING")],
+    ),
+]
+
+# Rows per streaming insert request; BigQuery recommends at most 500.
+INSERT_BATCH_ROWS = 500
 
 # --- Main Functions ---
 
-def get_grounded_response(model, prompt: str) -> str:
-    """Calls the Gemini model with a pre-configured grounding tool."""
-    try:
-        # Add a small delay to avoid hitting rate limits on very fast loops
-        time.sleep(1) 
-        response = model.generate_content(prompt)
-        return response.text
-    except Exception as e:
-        print(f"Error processing prompt '{prompt[:50]}...': {e}")
-        return f"Error: {e}"
+class RateLimiter:
+    """Spaces calls evenly so that at most `per_minute` start in any minute, across threads."""
+
+    def __init__(self, per_minute: float):
+        self.interval = 60.0 / per_minute
+        self._next = time.monotonic()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        with self._lock:
+            now = time.monotonic()
+            start = max(now, self._next)
+            self._next = start + self.interval
+        time.sleep(max(0.0, start - now))
+
+
+def render_prompt(config: BatchJobConfig, inputs: dict) -> str:
+    if config.prompt_template:
+        return config.prompt_template.format(**inputs)
+    if len(config.prompt_columns) == 1:
+        return str(inputs[config.prompt_columns[0]])
+    return "\n".join(f"{column}: {inputs[column]}" for column in config.prompt_columns)
+
+
+def grounding_sources(response) -> list[dict]:
+    """Returns the uri and title of the documents a response was grounded on."""
+    sources = []
+    for candidate in response.candidates[:1]:
+        metadata = getattr(candidate, "grounding_metadata", None)
+        for chunk in getattr(metadata, "grounding_chunks", None) or []:
+            context = getattr(chunk, "retrieved_context", None) or getattr(chunk, "web", None)
+            if context is not None:
+                sources.append({"uri": context.uri or None, "title": context.title or None})
+    return sources
+
+
+def get_grounded_response(model, prompt: str, config: BatchJobConfig, rate_limiter: RateLimiter) -> dict:
+    """Calls the Gemini model with a pre-configured grounding tool.
+
+    Returns the result columns: the response and its metrics, or the error once retries are exhausted.
+    """
+    result = {"grounded_response": None, "error": None, "attempts": 0, "grounding_sources": []}
+    for attempt in range(config.max_retries + 1):
+        rate_limiter.wait()
+        result["attempts"] = attempt + 1
+        started = time.perf_counter()
+        try:
+            response = model.generate_content(prompt)
+            result["latency_ms"] = 1000 * (time.perf_counter() - started)
+            result["grounded_response"] = response.text
+            usage = response.usage_metadata
+            result["prompt_tokens"] = usage.prompt_token_count
+            result["response_tokens"] = usage.candidates_token_count
+            result["total_tokens"] = usage.total_token_count
+            result["grounding_sources"] = grounding_sources(response)
+            # An earlier attempt may have failed with a retryable error.
+            result["error"] = None
+            return result
+        except (exceptions.ResourceExhausted, exceptions.ServiceUnavailable) as e:
+            result["latency_ms"] = 1000 * (time.perf_counter() - started)
+            result["error"] = str(e)
+            if attempt < config.max_retries:
+                time.sleep(2 ** attempt)
+        except Exception as e:
+            print(f"Error processing prompt '{prompt[:50]}...': {e}")
+            result["latency_ms"] = 1000 * (time.perf_counter() - started)
+            result["error"] = str(e)
+            return result
+    return result
 
-def process_prompts_in_batch():
-    """Reads prompts from BigQuery, gets grounded responses, and saves them back to BigQuery."""
+
+def ensure_destination_table(bq_client: bigquery.Client, config: BatchJobConfig):
+    """Creates the result table, partitioned by day of processed_at and clustered, if it does not exist.
+
+    Raises:
+        ValueError: If the table exists without the columns of RESULT_SCHEMA.
+    """
+    table = bigquery.Table(config.destination_table, schema=RESULT_SCHEMA)
+    table.time_partitioning = bigquery.TimePartitioning(
+        type_=bigquery.TimePartitioningType.DAY, field="processed_at"
+    )
+    table.clustering_fields = config.cluster_columns or None
+    table = bq_client.create_table(table, exists_ok=True)
+    existing_columns = {schema_field.name for schema_field in table.schema}
+    missing_columns = [schema_field.name for schema_field in RESULT_SCHEMA if schema_field.name not in existing_columns]
+    if missing_columns:
+        raise ValueError(
+            f"{config.destination_table} already exists without the result columns {missing_columns}. "
+            "It was probably written by an earlier version of this script. Set 'destination_table' "
+            "to a new table."
+        )
+    if not table.time_partitioning:
+        print(f"Warning: {config.destination_table} already exists and is not partitioned; re-runs will scan all of it.")
+
+
+def read_pending_rows(bq_client: bigquery.Client, config: BatchJobConfig):
+    """Streams the source rows that have no successful result yet, page by page."""
+    columns = ", ".join(f"`{column}`" for column in config.prompt_columns)
+    if config.row_key_column:
+        key_expression = f"CAST(`{config.row_key_column}` AS STRING)"
+    else:
+        key_expression = f"TO_HEX(SHA256(TO_JSON_STRING(STRUCT({columns}))))"
+    query = f"""
+        WITH source AS (
+            SELECT {key_expression} AS row_key, {columns}
+            FROM `{config.source_table}`
+            WHERE {config.source_filter or "TRUE"}
+        )
+        SELECT * FROM source
+        WHERE row_key IS NOT NULL
+            AND row_key NOT IN (
+                SELECT row_key FROM `{config.destination_table}`
+                WHERE error IS NULL
+                    AND processed_at >= TIMESTAMP_SUB(CURRENT_TIMESTAMP(), INTERVAL {int(config.resume_lookback_days)} DAY)
+            )
+        QUALIFY ROW_NUMBER() OVER (PARTITION BY row_key) = 1
+    """
+    rows = bq_client.query(query).result(page_size=config.page_size)
+    print(f"Found {rows.total_rows} rows to process.")
+    for row in rows:
+        yield row["row_key"], {column: row[column] for column in config.prompt_columns}
+
+
+def write_results(bq_client: bigquery.Client, config: BatchJobConfig, results: list[dict]):
+    """Appends a micro-batch of results to the destination table with streaming inserts.
+
+    Unlike load jobs, streaming inserts have no daily per-table quota, and the
+    rows can be queried at once, so the resume query of a re-run sees them.
+    The row ids let BigQuery drop the duplicates of a retried request.
+    """
+    for start in range(0, len(results), INSERT_BATCH_ROWS):
+        batch = results[start : start + INSERT_BATCH_ROWS]
+        errors = bq_client.insert_rows_json(
+            config.destination_table, batch, row_ids=[f"{row['run_id']}:{row['row_key']}" for row in batch]
+        )
+        if errors:
+            raise RuntimeError(f"Failed to write {len(errors)} results to {config.destination_table}: {errors[:3]}")
+
+
+def process_prompts_in_batch(config: BatchJobConfig):
+    """Streams rows from BigQuery, gets grounded responses concurrently, and saves them back in micro-batches.
+
+    Results are written every `flush_every_rows` rows or `flush_every_seconds`
+    seconds, and rows that already have a successful result are skipped, so an
+    interrupted run resumes where it stopped. Writes run on a writer thread of
+    their own, so they never hold up the submission of new rows; a failed
+    write stops the run at the next flush.
+    """
 
     print("Initializing Vertex AI and BigQuery clients...")
-    vertexai.init(project=PROJECT_ID, location=LOCATION)
-    bq_client = bigquery.Client(project=PROJECT_ID)
+    vertexai.init(project=config.project_id, location=config.location)
+    bq_client = bigquery.Client(project=config.project_id)
+    ensure_destination_table(bq_client, config)
 
     # 1. Configure the grounding tool
-    grounding_tool = Tool.from_retrieval(
-        retrieval=grounding.Retrieval(source=grounding.VertexAISearch(datastore=DATASTORE_PATH))
-    )
+    tools = []
+    if config.datastore_path:
+        tools.append(Tool.from_retrieval(
+            retrieval=grounding.Retrieval(source=grounding.VertexAISearch(datastore=config.datastore_path))
+        ))
 
     # 2. Load the Gemini model once with the tool
-    model = GenerativeModel(
-        "gemini-2.5-flash",
-        tools=[grounding_tool]
-    )
+    model = GenerativeModel(config.model, tools=tools)
+
+    # 3. Stream the rows that still need a response
+    print(f"Reading rows from table: {config.source_table}")
+    rows = read_pending_rows(bq_client, config)
+
+    # 4. Process the rows concurrently, writing results as they accumulate
+    run_id = uuid.uuid4().hex
+    rate_limiter = RateLimiter(config.requests_per_minute)
+    pending_results = []
+    counts = {"processed": 0, "errors": 0, "written": 0, "total_tokens": 0}
+    last_flush = time.monotonic()
+    started = time.monotonic()
+    # A single writer thread keeps the micro-batches in order.
+    writer = ThreadPoolExecutor(max_workers=1, thread_name_prefix="bq-writer")
+    writes = []
+
+    def write(results):
+        write_results(bq_client, config, results)
+        counts["written"] += len(results)
+        elapsed = time.monotonic() - started
+        print(
+            f"Wrote {counts['written']} results ({counts['errors']} errors, "
+            f"{counts['processed'] / elapsed:.2f} rows/s, {counts['total_tokens']} tokens)."
+        )
+
+    def check_writes():
+        nonlocal writes
+        for done in [w for w in writes if w.done()]:
+            done.result()
+        writes = [w for w in writes if not w.done()]
+
+    def flush():
+        nonlocal pending_results, last_flush
+        check_writes()
+        if pending_results:
+            writes.append(writer.submit(write, pending_results))
+        pending_results = []
+        last_flush = time.monotonic()
 
-    # 3. Read prompts from the source BigQuery table
-    print(f"Reading prompts from table: {BQ_SOURCE_TABLE}")
-    query = f"SELECT {BQ_PROMPT_COLUMN} FROM `{BQ_SOURCE_TABLE}`"
-    query_job = bq_client.query(query)  # API request
-    prompts = [row[0] for row in query_job]
-    print(f"Found {len(prompts)} prompts to process.")
-
-    # 4. Process each prompt and collect the results
-    results_to_insert = []
-    for i, prompt_text in enumerate(prompts):
-        print(f"Processing prompt {i+1}/{len(prompts)}...")
-        response_text = get_grounded_response(model, prompt_text)
-        results_to_insert.append({
-            "prompt": prompt_text,
-            "grounded_response": response_text,
+    def collect(row_key, inputs, prompt, future):
+        result = future.result()
+        counts["processed"] += 1
+        counts["errors"] += result["error"] is not None
+        counts["total_tokens"] += result.get("total_tokens") or 0
+        pending_results.append({
+            "row_key": row_key,
+            "run_id": run_id,
+            "processed_at": datetime.now(timezone.utc).isoformat(),
+            "model": config.model,
+            "inputs": json.dumps(inputs, default=str),
+            "prompt": prompt,
+            **result,
         })
-        
-    # 5. Write the results to the destination BigQuery table
-    if not results_to_insert:
+        if len(pending_results) >= config.flush_every_rows or time.monotonic() - last_flush >= config.flush_every_seconds:
+            flush()
+
+    try:
+        with ThreadPoolExecutor(max_workers=config.max_concurrency) as executor:
+            in_flight = deque()
+            for row_key, inputs in rows:
+                prompt = render_prompt(config, inputs)
+                future = executor.submit(get_grounded_response, model, prompt, config, rate_limiter)
+                in_flight.append((row_key, inputs, prompt, future))
+                if len(in_flight) >= 2 * config.max_concurrency:
+                    collect(*in_flight.popleft())
+            while in_flight:
+                collect(*in_flight.popleft())
+    finally:
+        # 5. Write whatever is left, also when interrupted
+        if pending_results:
+            writes.append(writer.submit(write, pending_results))
+        writer.shutdown(wait=True)
+    check_writes()
+
+    if not counts["processed"]:
         print("No results to write.")
         return
-
-    print(f"Writing {len(results_to_insert)} results to {BQ_DESTINATION_TABLE}...")
-    # This will create the table if it doesn't exist, based on the schema of the first row.
-    job_config = bigquery.LoadJobConfig(autodetect=True, write_disposition="WRITE_APPEND")
-    
-    load_job = bq_client.load_table_from_json(
-        results_to_insert,
-        BQ_DESTINATION_TABLE,
-        job_config=job_config
-    )
-    load_job.result() # Wait for the job to complete
-    print("Batch processing complete.")
+    print(f"Batch processing complete (run {run_id}): {counts['processed']} rows, {counts['errors']} errors.")
 
 
 # --- Run the script ---
 if __name__ == "__main__":
-    process_prompts_in_batch()
+    parser = argparse.ArgumentParser(description="Run grounded Gemini generations over the rows of a BigQuery table.")
+    parser.add_argument("--config", type=str, help="YAML or JSON job config. Keys not set keep their defaults.")
+    parsed_args = parser.parse_args()
+    process_prompts_in_batch(BatchJobConfig.from_file(parsed_args.config))
@@ -24,6 +24,10 @@ from vertexai.generative_models import Part, GenerationConfig, HarmCategory, Har
 
 # --- Define the project root as the parent directory of the .scripts folder ---
 PROJECT_ROOT = Path(__file__).resolve().parent.parent
+if str(PROJECT_ROOT) not in sys.path:
+    sys.path.insert(0, str(PROJECT_ROOT))
+
+from agents.context_cache import ENABLE_CONTEXT_CACHE, cached_model
 
 # --- Add necessary imports ---
 from prompt_manager import PromptManager
@@ -866,15 +870,6 @@ def call_gemini_with_prompt_file(prompt_filepath: str, cloud_logging_enabled: bo
             logger.info("    Using Application Default Credentials (ADC) from the environment.")
 
 
-        # 5. Prepare Model
-        model = GenerativeModel(
-            model_name=model_name,
-            system_instruction=system_instructions,
-            safety_settings=safety_settings # Apply safety settings here
-        )
-
-        # 6. Call Gemini API (Primary Call)
-        logger.info("    Calling Gemini API (Primary Call)...")
         # Combine function calling tools and the RAG tool
         all_tools = []
         if proto_tool:
@@ -882,12 +877,43 @@ def call_gemini_with_prompt_file(prompt_filepath: str, cloud_logging_enabled: bo
         if rag_tool:
             all_tools.append(rag_tool)
 
+        # 5. Prepare Model
+        # With context caching enabled, a large system instruction and tool
+        # definitions are served from a server-side cache shared by every
+        # prompt file with the same prefix, instead of being resent inline.
+        model = None
+        if ENABLE_CONTEXT_CACHE and system_instructions:
+            try:
+                cache_tools = [
+                    Tool.from_dict(type(tool).to_dict(tool)) if isinstance(tool, glm.Tool) else tool
+                    for tool in all_tools
+                ]
+                model = cached_model(
+                    model_name,
+                    system_instruction=system_instructions,
+                    tools=cache_tools,
+                    safety_settings=safety_settings,
+                )
+            except Exception as e:
+                logger.warning(f"    Could not use context caching, sending the prompt prefix inline: {e}")
+        prefix_cached = model is not None
+        if not prefix_cached:
+            model = GenerativeModel(
+                model_name=model_name,
+                system_instruction=system_instructions,
+                safety_settings=safety_settings # Apply safety settings here
+            )
+        logger.info(f"    Context Cache Used: {'Yes' if prefix_cached else 'No'}")
+
+        # 6. Call Gemini API (Primary Call)
+        logger.info("    Calling Gemini API (Primary Call)...")
         start_time_primary = time.monotonic()
         response = generate_with_retry(
             model,
             user_prompt,
             generation_config=generation_config,
-            tools=all_tools if all_tools else None
+            # Cached tools are part of the cached content and must not be resent.
+            tools=all_tools if all_tools and not prefix_cached else None
         )
         duration_primary = time.monotonic() - start_time_primary
         logger.info(f"    Primary API call complete in {duration_primary:.2f} seconds.")
@@ -0,0 +1,166 @@
+import asyncio
+import os
+import sys
+
+import pytest
+
+# The scripts are not a package; import the writer from the scripts directory.
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from log_writer import BackgroundLogWriter
+
+
+class FakeBatch:
+    def __init__(self, cloud_logger):
+        self.cloud_logger = cloud_logger
+        self.entries = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            if self.cloud_logger.failures:
+                self.cloud_logger.failures -= 1
+                raise RuntimeError("Cloud Logging unavailable")
+            self.cloud_logger.written.extend(self.entries)
+        return False
+
+    def log_struct(self, entry, severity="INFO"):
+        self.entries.append(entry)
+
+
+class FakeCloudLogger:
+    """Records the entries written in batches; the first `failures` batches fail."""
+
+    def __init__(self, failures: int = 0):
+        self.failures = failures
+        self.written = []
+
+    def batch(self):
+        return FakeBatch(self)
+
+
+def make_writer(tmp_path, cloud_logger, **kwargs) -> BackgroundLogWriter:
+    kwargs.setdefault("max_queue_size", 2)
+    kwargs.setdefault("batch_size", 10)
+    kwargs.setdefault("flush_interval", 0.01)
+    return BackgroundLogWriter(cloud_logger, spool_path=str(tmp_path / "spool.jsonl"), **kwargs)
+
+
+async def wait_until(predicate, timeout: float = 5.0) -> None:
+    deadline = asyncio.get_running_loop().time() + timeout
+    while not predicate():
+        assert asyncio.get_running_loop().time() < deadline, "timed out"
+        await asyncio.sleep(0.01)
+
+
+def submit_all(writer: BackgroundLogWriter, count: int) -> None:
+    # Called before the background task first runs, so the queue overflows.
+    for i in range(count):
+        writer.submit({"i": i})
+
+
+def test_drop_policy_drops_new_entries(tmp_path) -> None:
+    async def run():
+        cloud_logger = FakeCloudLogger()
+        writer = make_writer(tmp_path, cloud_logger, overload_policy="drop")
+        writer.start()
+        submit_all(writer, 5)
+        await writer.stop()
+        return cloud_logger, writer.metrics()
+
+    cloud_logger, metrics = asyncio.run(run())
+    assert cloud_logger.written == [{"i": 0}, {"i": 1}]
+    assert metrics["dropped"] == 3
+    assert metrics["submitted"] == 5
+    assert metrics["max_queue_depth"] == 2
+
+
+def test_sample_policy_replaces_the_oldest_entry(tmp_path) -> None:
+    async def run():
+        cloud_logger = FakeCloudLogger()
+        writer = make_writer(tmp_path, cloud_logger, overload_policy="sample", sample_rate=1.0)
+        writer.start()
+        submit_all(writer, 5)
+        await writer.stop()
+        return cloud_logger, writer.metrics()
+
+    cloud_logger, metrics = asyncio.run(run())
+    assert cloud_logger.written == [{"i": 3}, {"i": 4}]
+    assert metrics["sampled_in"] == 3
+    assert metrics["dropped"] == 3
+
+
+def test_spool_policy_writes_overflow_once_the_queue_drains(tmp_path) -> None:
+    async def run():
+        cloud_logger = FakeCloudLogger()
+        writer = make_writer(tmp_path, cloud_logger, overload_policy="spool", max_queue_size=3)
+        writer.start()
+        submit_all(writer, 6)
+        # submit() only buffers the overflow; the file is written by the task.
+        assert not os.path.exists(writer.spool_path)
+        assert writer.metrics()["overflow_depth"] == 3
+        await wait_until(lambda: len(cloud_logger.written) == 6)
+        await writer.stop()
+        return cloud_logger, writer
+
+    cloud_logger, writer = asyncio.run(run())
+    assert sorted(entry["i"] for entry in cloud_logger.written) == [0, 1, 2, 3, 4, 5]
+    metrics = writer.metrics()
+    assert metrics["spooled"] == 3
+    assert metrics["unspooled"] == 3
+    assert metrics["dropped"] == 0
+    assert not os.path.exists(writer.spool_path)
+
+
+def test_spool_overflow_buffer_is_bounded(tmp_path) -> None:
+    async def run():
+        writer = make_writer(tmp_path, FakeCloudLogger(), overload_policy="spool")
+        writer.start()
+        submit_all(writer, 10)
+        metrics = writer.metrics()
+        await writer.stop()
+        return metrics
+
+    metrics = asyncio.run(run())
+    assert metrics["overflow_depth"] == 2
+    assert metrics["dropped"] == 6
+
+
+def test_failed_batch_is_respooled_and_written_later(tmp_path) -> None:
+    async def run():
+        cloud_logger = FakeCloudLogger(failures=1)
+        writer = make_writer(tmp_path, cloud_logger, overload_policy="spool")
+        writer.start()
+        submit_all(writer, 2)
+        await wait_until(lambda: len(cloud_logger.written) == 2)
+        await writer.stop()
+        return cloud_logger, writer.metrics()
+
+    cloud_logger, metrics = asyncio.run(run())
+    assert sorted(entry["i"] for entry in cloud_logger.written) == [0, 1]
+    assert metrics["write_errors"] == 1
+    assert metrics["spooled"] == 2
+    assert metrics["unspooled"] == 2
+    assert metrics["written"] == 2
+
+
+def test_failed_batch_is_dropped_without_spool(tmp_path) -> None:
+    async def run():
+        cloud_logger = FakeCloudLogger(failures=1)
+        writer = make_writer(tmp_path, cloud_logger, overload_policy="drop")
+        writer.start()
+        submit_all(writer, 2)
+        await writer.stop()
+        return cloud_logger, writer.metrics()
+
+    cloud_logger, metrics = asyncio.run(run())
+    assert cloud_logger.written == []
+    assert metrics["write_errors"] == 1
+    assert metrics["dropped"] == 2
+
+
+def test_unknown_overload_policy(tmp_path) -> None:
+    with pytest.raises(ValueError):
+        make_writer(tmp_path, FakeCloudLogger(), overload_policy="block")
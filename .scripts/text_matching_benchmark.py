@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Benchmarks the compiled "contains words" matcher against the legacy scorer.
+
+The matcher lives in agents/rag-agent/app/utils/text_matching.py, which the
+rag-agent ContainsWords evaluator and .scripts/eval_agent.py both use, so
+they score the same way.
+
+Whole-word references of TOKEN_SET_MIN_WORDS words or more are checked in a
+single pass over the response, which shows on long references where most
+rows contain every word:
+    ./.scripts/text_matching_benchmark.py --reference-words 64 --planted-fraction 0.9
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+from typing import Iterable, Optional
+
+# The matcher's directory is imported from directly, because importing the
+# rag-agent `app` package would also build its root agent.
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "agents", "rag-agent", "app", "utils"))
+
+from text_matching import compile_reference, score_contains_words_batch
+
+
+def _legacy_contains_words(response: str, reference: str) -> float:
+    """The original per-word substring check, kept for benchmarking."""
+    if not response or not reference:
+        return 0.0
+    words_to_check = [word.strip() for word in reference.split(" ") if word.strip()]
+    return 1.0 if all(word in response for word in words_to_check) else 0.0
+
+
+def _synthetic_rows(
+    rows: int, response_words: int, reference_words: int, distinct_references: int, planted_fraction: float, seed: int
+):
+    rng = random.Random(seed)
+    vocabulary = [f"term{i}" for i in range(5000)] + ["concatenate", "category", "cat", "Alice", "rabbit", "U.S."]
+    references = [
+        " ".join(rng.choice(vocabulary) for _ in range(reference_words)) for _ in range(distinct_references)
+    ]
+    for _ in range(rows):
+        reference = rng.choice(references)
+        words = [rng.choice(vocabulary) for _ in range(response_words)]
+        # Plant the reference words in a fraction of the rows so both the
+        # fast-reject and the full whole-word verification paths are exercised.
+        if rng.random() < planted_fraction:
+            # Distinct positions, so a planted word never overwrites another.
+            reference_words_ = reference.split(" ")
+            for position, word in zip(rng.sample(range(response_words), len(reference_words_)), reference_words_):
+                words[position] = word
+        yield " ".join(words), reference
+
+
+def benchmark(
+    rows: int = 2000,
+    response_words: int = 1000,
+    reference_words: int = 8,
+    distinct_references: int = 50,
+    planted_fraction: float = 0.5,
+    seed: int = 0,
+) -> dict:
+    """Times the legacy scorer against the compiled scorer on synthetic rows."""
+    data = list(_synthetic_rows(rows, response_words, reference_words, distinct_references, planted_fraction, seed))
+    responses = [r for r, _ in data]
+    references = [ref for _, ref in data]
+    compile_reference.cache_clear()
+
+    timings = {}
+    start = time.perf_counter()
+    for response, reference in data:
+        _legacy_contains_words(response, reference)
+    timings["legacy_substring"] = time.perf_counter() - start
+
+    for name, whole_word, ignore_case in (
+        ("compiled_whole_word", True, False),
+        ("compiled_whole_word_ignore_case", True, True),
+        ("compiled_substring", False, False),
+    ):
+        start = time.perf_counter()
+        score_contains_words_batch(responses, references, whole_word=whole_word, ignore_case=ignore_case)
+        timings[name] = time.perf_counter() - start
+
+    return {"rows": rows, "response_words": response_words, "reference_words": reference_words, "seconds": timings}
+
+
+def _print_benchmark(result: dict) -> None:
+    print(
+        f"--- contains_words benchmark: {result['rows']} rows x {result['response_words']} words/response, "
+        f"{result['reference_words']} words/reference ---"
+    )
+    legacy = result["seconds"]["legacy_substring"]
+    for name, seconds in result["seconds"].items():
+        speedup = legacy / seconds if seconds else float("inf")
+        print(f"  {name:<34} {seconds:8.3f}s  ({result['rows'] / seconds:10.0f} rows/s, {speedup:5.2f}x vs legacy)")
+
+
+def main(argv: Optional[Iterable[str]] = None):
+    parser = argparse.ArgumentParser(description="Benchmark the contains_words scorers.")
+    parser.add_argument("--rows", type=int, default=2000, help="Number of synthetic eval rows.")
+    parser.add_argument("--response-words", type=int, default=1000, help="Words per synthetic agent response.")
+    parser.add_argument("--reference-words", type=int, default=8, help="Words per reference string.")
+    parser.add_argument("--distinct-references", type=int, default=50, help="Number of distinct reference strings.")
+    parser.add_argument(
+        "--planted-fraction", type=float, default=0.5, help="Fraction of rows that contain every reference word."
+    )
+    parser.add_argument("--seed", type=int, default=0, help="Random seed for the synthetic data.")
+    args = parser.parse_args(argv)
+    _print_benchmark(
+        benchmark(
+            args.rows,
+            args.response_words,
+            args.reference_words,
+            args.distinct_references,
+            args.planted_fraction,
+            args.seed,
+        )
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -25,10 +25,7 @@ from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import FileResponse
 from fastapi.staticfiles import StaticFiles
 from google.adk.agents.live_request_queue import LiveRequest, LiveRequestQueue
-from google.adk.artifacts.in_memory_artifact_service import InMemoryArtifactService
-from google.adk.memory.in_memory_memory_service import InMemoryMemoryService
 from google.adk.runners import Runner
-from google.adk.sessions.in_memory_session_service import InMemorySessionService
 from google.cloud import logging as google_cloud_logging
 from opentelemetry import trace
 from opentelemetry.sdk.trace import TracerProvider, export
@@ -36,6 +33,7 @@ from vertexai.agent_engines import _utils
 from websockets.exceptions import ConnectionClosedError
 
 from .agent import root_agent
+from .utils.shared_services import create_services
 from .utils.tracing import CloudTraceLoggingSpanExporter
 from .utils.typing import Feedback
 
@@ -71,10 +69,9 @@ provider.add_span_processor(processor)
 trace.set_tracer_provider(provider)
 
 
-# Initialize ADK services
-session_service = InMemorySessionService()
-artifact_service = InMemoryArtifactService()
-memory_service = InMemoryMemoryService()
+# Initialize ADK services. Set SESSION_BACKEND=sqlite when running more than
+# one worker, so that sessions are shared by all of them.
+session_service, artifact_service, memory_service = create_services()
 
 # Initialize ADK runner
 runner = Runner(
@@ -0,0 +1,367 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""ADK services whose state is shared by all worker processes on a host.
+
+The in-memory services keep their state in the process that created it, so
+with more than one uvicorn worker a session created by one worker is unknown
+to the others. The "sqlite" backend keeps sessions, artifacts and memory in a
+single SQLite database in WAL mode, which any number of processes can read
+and write concurrently. Sessions use ADK's DatabaseSessionService; artifacts
+and memory are stored in tables of the same database by the services below,
+which implement the same interfaces as their in-memory counterparts.
+"""
+
+import asyncio
+import fcntl
+import logging
+import os
+import re
+import sqlite3
+import threading
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from datetime import datetime
+from typing import Any, TypeVar
+
+from google.adk.artifacts.base_artifact_service import BaseArtifactService
+from google.adk.artifacts.in_memory_artifact_service import InMemoryArtifactService
+from google.adk.memory.base_memory_service import (
+    BaseMemoryService,
+    SearchMemoryResponse,
+)
+from google.adk.memory.in_memory_memory_service import InMemoryMemoryService
+from google.adk.memory.memory_entry import MemoryEntry
+from google.adk.sessions.base_session_service import BaseSessionService
+from google.adk.sessions.database_session_service import DatabaseSessionService
+from google.adk.sessions.in_memory_session_service import InMemorySessionService
+from google.adk.sessions.session import Session
+from google.genai import types
+
+SESSION_BACKENDS = ("memory", "sqlite")
+DEFAULT_DB_PATH = ".adk_state.db"
+
+T = TypeVar("T")
+
+
+class SqliteStore:
+    """A SQLite database with one connection per thread, used off the event loop."""
+
+    def __init__(self, db_path: str, schema: str) -> None:
+        """Opens the database and creates the tables of `schema` if needed.
+
+        Args:
+            db_path: Path of the database file
+            schema: CREATE TABLE IF NOT EXISTS statements
+        """
+        self.db_path = db_path
+        self._local = threading.local()
+        self.connection().executescript(schema)
+
+    def connection(self) -> sqlite3.Connection:
+        """Returns this thread's connection."""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            # Autocommit mode: transactions are started explicitly.
+            connection = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    @contextmanager
+    def transaction(self) -> Iterator[sqlite3.Connection]:
+        """Runs a write transaction, holding the write lock from its start."""
+        connection = self.connection()
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield connection
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+    async def run(self, func: Callable[..., T], *args: Any) -> T:
+        """Runs a blocking database call in a worker thread."""
+        return await asyncio.to_thread(func, *args)
+
+
+class SqliteArtifactService(BaseArtifactService):
+    """An artifact service storing versioned artifacts in a SQLite database.
+
+    Like InMemoryArtifactService, filenames starting with "user:" are shared by
+    all sessions of a user.
+    """
+
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS artifacts (
+            scope TEXT NOT NULL,
+            filename TEXT NOT NULL,
+            version INTEGER NOT NULL,
+            part TEXT NOT NULL,
+            PRIMARY KEY (scope, filename, version)
+        );
+    """
+
+    def __init__(self, db_path: str) -> None:
+        self._store = SqliteStore(db_path, self._SCHEMA)
+
+    @staticmethod
+    def _scope(app_name: str, user_id: str, session_id: str, filename: str) -> str:
+        if filename.startswith("user:"):
+            return f"{app_name}/{user_id}/user"
+        return f"{app_name}/{user_id}/{session_id}"
+
+    async def save_artifact(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        session_id: str,
+        filename: str,
+        artifact: types.Part,
+    ) -> int:
+        scope = self._scope(app_name, user_id, session_id, filename)
+        part = artifact.model_dump_json(exclude_none=True)
+
+        def save() -> int:
+            with self._store.transaction() as connection:
+                (version,) = connection.execute(
+                    "SELECT COALESCE(MAX(version) + 1, 0) FROM artifacts"
+                    " WHERE scope = ? AND filename = ?",
+                    (scope, filename),
+                ).fetchone()
+                connection.execute(
+                    "INSERT INTO artifacts VALUES (?, ?, ?, ?)",
+                    (scope, filename, version, part),
+                )
+            return int(version)
+
+        return await self._store.run(save)
+
+    async def load_artifact(
+        self,
+        *,
+        app_name: str,
+        user_id: str,
+        session_id: str,
+        filename: str,
+        version: int | None = None,
+    ) -> types.Part | None:
+        scope = self._scope(app_name, user_id, session_id, filename)
+        if version is None:
+            query = (
+                "SELECT part FROM artifacts WHERE scope = ? AND filename = ?"
+                " ORDER BY version DESC LIMIT 1"
+            )
+            params: tuple = (scope, filename)
+        else:
+            query = (
+                "SELECT part FROM artifacts"
+                " WHERE scope = ? AND filename = ? AND version = ?"
+            )
+            params = (scope, filename, version)
+
+        def load() -> str | None:
+            row = self._store.connection().execute(query, params).fetchone()
+            return row[0] if row else None
+
+        part = await self._store.run(load)
+        return types.Part.model_validate_json(part) if part is not None else None
+
+    async def list_artifact_keys(
+        self, *, app_name: str, user_id: str, session_id: str
+    ) -> list[str]:
+        scopes = (
+            self._scope(app_name, user_id, session_id, ""),
+            self._scope(app_name, user_id, session_id, "user:"),
+        )
+
+        def list_keys() -> list[str]:
+            rows = self._store.connection().execute(
+                "SELECT DISTINCT filename FROM artifacts WHERE scope IN (?, ?)"
+                " ORDER BY filename",
+                scopes,
+            )
+            return [filename for (filename,) in rows]
+
+        return await self._store.run(list_keys)
+
+    async def delete_artifact(
+        self, *, app_name: str, user_id: str, session_id: str, filename: str
+    ) -> None:
+        scope = self._scope(app_name, user_id, session_id, filename)
+
+        def delete() -> None:
+            with self._store.transaction() as connection:
+                connection.execute(
+                    "DELETE FROM artifacts WHERE scope = ? AND filename = ?",
+                    (scope, filename),
+                )
+
+        await self._store.run(delete)
+
+    async def list_versions(
+        self, *, app_name: str, user_id: str, session_id: str, filename: str
+    ) -> list[int]:
+        scope = self._scope(app_name, user_id, session_id, filename)
+
+        def list_versions() -> list[int]:
+            rows = self._store.connection().execute(
+                "SELECT version FROM artifacts WHERE scope = ? AND filename = ?"
+                " ORDER BY version",
+                (scope, filename),
+            )
+            return [version for (version,) in rows]
+
+        return await self._store.run(list_versions)
+
+
+def _words(text: str) -> set[str]:
+    return {word.lower() for word in re.findall(r"[A-Za-z]+", text)}
+
+
+class SqliteMemoryService(BaseMemoryService):
+    """A memory service storing session events in a SQLite database.
+
+    Like InMemoryMemoryService, it uses keyword matching instead of semantic
+    search.
+    """
+
+    _SCHEMA = """
+        CREATE TABLE IF NOT EXISTS memory_events (
+            app_name TEXT NOT NULL,
+            user_id TEXT NOT NULL,
+            session_id TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            author TEXT,
+            timestamp REAL NOT NULL,
+            content TEXT NOT NULL,
+            PRIMARY KEY (app_name, user_id, session_id, position)
+        );
+    """
+
+    def __init__(self, db_path: str) -> None:
+        self._store = SqliteStore(db_path, self._SCHEMA)
+
+    async def add_session_to_memory(self, session: Session) -> None:
+        key = (session.app_name, session.user_id, session.id)
+        rows = [
+            (
+                *key,
+                position,
+                event.author,
+                event.timestamp,
+                event.content.model_dump_json(exclude_none=True),
+            )
+            for position, event in enumerate(
+                event
+                for event in session.events
+                if event.content and event.content.parts
+            )
+        ]
+
+        def add() -> None:
+            # A session may be added several times; keep its latest events.
+            with self._store.transaction() as connection:
+                connection.execute(
+                    "DELETE FROM memory_events"
+                    " WHERE app_name = ? AND user_id = ? AND session_id = ?",
+                    key,
+                )
+                connection.executemany(
+                    "INSERT INTO memory_events VALUES (?, ?, ?, ?, ?, ?, ?)", rows
+                )
+
+        await self._store.run(add)
+
+    async def search_memory(
+        self, *, app_name: str, user_id: str, query: str
+    ) -> SearchMemoryResponse:
+        def load() -> list[tuple[str, float, str]]:
+            return self._store.connection().execute(
+                "SELECT author, timestamp, content FROM memory_events"
+                " WHERE app_name = ? AND user_id = ?"
+                " ORDER BY session_id, position",
+                (app_name, user_id),
+            ).fetchall()
+
+        words_in_query = _words(query)
+        response = SearchMemoryResponse()
+        for author, timestamp, content_json in await self._store.run(load):
+            content = types.Content.model_validate_json(content_json)
+            words_in_event = _words(
+                " ".join(part.text for part in content.parts or [] if part.text)
+            )
+            if words_in_query & words_in_event:
+                response.memories.append(
+                    MemoryEntry(
+                        content=content,
+                        author=author,
+                        timestamp=datetime.fromtimestamp(timestamp).isoformat(),
+                    )
+                )
+        return response
+
+
+@contextmanager
+def _init_lock(db_path: str) -> Iterator[None]:
+    # Workers start at the same time; only one of them creates the tables.
+    with open(f"{db_path}.lock", "w") as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+def create_services(
+    backend: str | None = None, db_path: str | None = None
+) -> tuple[BaseSessionService, BaseArtifactService, BaseMemoryService]:
+    """Creates the session, artifact and memory services of a backend.
+
+    Args:
+        backend: "memory" (state is lost on restart and not shared between
+            workers) or "sqlite" (state is shared by all workers on the host).
+            Defaults to $SESSION_BACKEND, else "memory".
+        db_path: The SQLite database file. Defaults to $SESSION_DB_PATH, else
+            DEFAULT_DB_PATH.
+
+    Returns:
+        The session, artifact and memory services
+    """
+    backend = backend or os.environ.get("SESSION_BACKEND", "memory")
+    if backend == "memory":
+        return (
+            InMemorySessionService(),
+            InMemoryArtifactService(),
+            InMemoryMemoryService(),
+        )
+    if backend != "sqlite":
+        raise ValueError(
+            f"Unknown session backend '{backend}'. Use one of {SESSION_BACKENDS}."
+        )
+
+    db_path = os.path.abspath(
+        db_path or os.environ.get("SESSION_DB_PATH", DEFAULT_DB_PATH)
+    )
+    with _init_lock(db_path):
+        # The artifact store is opened first so the database is in WAL mode
+        # before the session service connects to it.
+        artifact_service = SqliteArtifactService(db_path)
+        memory_service = SqliteMemoryService(db_path)
+        session_service = DatabaseSessionService(
+            f"sqlite:///{db_path}", connect_args={"timeout": 30}
+        )
+    logging.info(f"Using shared session, artifact and memory state in {db_path}")
+    return session_service, artifact_service, memory_service
@@ -0,0 +1,135 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Compares the throughput of the server with different numbers of workers.
+
+For each worker count, the server is started with the shared SQLite session
+backend, the load test in load_test.py is run against it with the same users
+and duration, and the aggregated Locust statistics are printed side by side.
+"""
+
+import argparse
+import csv
+import os
+import socket
+import subprocess
+import tempfile
+import time
+from pathlib import Path
+
+LOAD_TEST = Path(__file__).with_name("load_test.py")
+RESULTS_DIR = Path(__file__).with_name(".results")
+
+
+def wait_for_port(port: int, timeout: float) -> None:
+    """Waits until the server accepts connections."""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.5)
+    raise TimeoutError(f"Server did not start on port {port} within {timeout}s")
+
+
+def run_load_test(workers: int, args: argparse.Namespace) -> dict[str, str]:
+    """Starts the server with `workers` workers, load tests it and stops it.
+
+    Returns:
+        The "Aggregated" row of the Locust stats CSV
+    """
+    csv_prefix = RESULTS_DIR / f"workers_{workers}"
+    with tempfile.TemporaryDirectory() as state_dir:
+        env = {
+            **os.environ,
+            "SESSION_BACKEND": "sqlite",
+            "SESSION_DB_PATH": os.path.join(state_dir, "adk_state.db"),
+        }
+        server = subprocess.Popen(
+            [
+                *args.server_command.split(),
+                "app.server:app",
+                "--host",
+                "127.0.0.1",
+                "--port",
+                str(args.port),
+                "--workers",
+                str(workers),
+            ],
+            env=env,
+        )
+        try:
+            wait_for_port(args.port, args.startup_timeout)
+            subprocess.run(
+                [
+                    "locust",
+                    "-f",
+                    str(LOAD_TEST),
+                    "-H",
+                    f"http://127.0.0.1:{args.port}",
+                    "--headless",
+                    "-t",
+                    args.duration,
+                    "-u",
+                    str(args.users),
+                    "-r",
+                    str(args.spawn_rate),
+                    "--csv",
+                    str(csv_prefix),
+                    "--only-summary",
+                ],
+                check=False,
+            )
+        finally:
+            server.terminate()
+            server.wait(timeout=30)
+
+    with open(f"{csv_prefix}_stats.csv", newline="") as f:
+        return next(row for row in csv.DictReader(f) if row["Name"] == "Aggregated")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 4])
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--spawn-rate", type=int, default=5)
+    parser.add_argument("--duration", default="60s")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--startup-timeout", type=float, default=60.0)
+    parser.add_argument(
+        "--server-command",
+        default="uv run uvicorn",
+        help="Command that starts uvicorn in the application environment.",
+    )
+    args = parser.parse_args()
+    RESULTS_DIR.mkdir(exist_ok=True)
+
+    results = {workers: run_load_test(workers, args) for workers in args.workers}
+
+    baseline = float(results[args.workers[0]]["Requests/s"]) or float("nan")
+    print(
+        f"\n{'workers':>8} {'requests':>9} {'failures':>9} {'req/s':>8}"
+        f" {'speedup':>8} {'median ms':>10} {'p95 ms':>8}"
+    )
+    for workers, row in results.items():
+        requests_per_second = float(row["Requests/s"])
+        print(
+            f"{workers:>8} {row['Request Count']:>9} {row['Failure Count']:>9}"
+            f" {requests_per_second:>8.2f} {requests_per_second / baseline:>7.2f}x"
+            f" {row['Median Response Time']:>10} {row['95%']:>8}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,170 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import subprocess
+import sys
+import textwrap
+from pathlib import Path
+
+import pytest
+from google.adk.events.event import Event
+from google.adk.sessions.session import Session
+from google.genai import types
+
+from app.utils.shared_services import (
+    SqliteArtifactService,
+    SqliteMemoryService,
+    create_services,
+)
+
+APP_ROOT = Path(__file__).resolve().parents[2]
+SCOPE = {"app_name": "app", "user_id": "user"}
+
+
+def text_part(text: str) -> types.Part:
+    return types.Part(text=text)
+
+
+@pytest.mark.asyncio
+async def test_artifact_versions(tmp_path: Path) -> None:
+    service = SqliteArtifactService(str(tmp_path / "state.db"))
+    for text in ("v0", "v1", "v2"):
+        await service.save_artifact(
+            **SCOPE, session_id="s1", filename="notes.txt", artifact=text_part(text)
+        )
+
+    assert await service.list_versions(
+        **SCOPE, session_id="s1", filename="notes.txt"
+    ) == [0, 1, 2]
+    latest = await service.load_artifact(
+        **SCOPE, session_id="s1", filename="notes.txt"
+    )
+    first = await service.load_artifact(
+        **SCOPE, session_id="s1", filename="notes.txt", version=0
+    )
+    assert latest.text == "v2"
+    assert first.text == "v0"
+
+    await service.delete_artifact(**SCOPE, session_id="s1", filename="notes.txt")
+    assert (
+        await service.load_artifact(**SCOPE, session_id="s1", filename="notes.txt")
+        is None
+    )
+
+
+@pytest.mark.asyncio
+async def test_user_artifacts_are_shared_by_sessions(tmp_path: Path) -> None:
+    service = SqliteArtifactService(str(tmp_path / "state.db"))
+    await service.save_artifact(
+        **SCOPE, session_id="s1", filename="user:profile", artifact=text_part("p")
+    )
+    await service.save_artifact(
+        **SCOPE, session_id="s1", filename="draft", artifact=text_part("d")
+    )
+
+    assert await service.list_artifact_keys(**SCOPE, session_id="s1") == [
+        "draft",
+        "user:profile",
+    ]
+    assert await service.list_artifact_keys(**SCOPE, session_id="s2") == [
+        "user:profile"
+    ]
+    shared = await service.load_artifact(
+        **SCOPE, session_id="s2", filename="user:profile"
+    )
+    assert shared.text == "p"
+    assert (
+        await service.load_artifact(**SCOPE, session_id="s2", filename="draft")
+        is None
+    )
+
+
+@pytest.mark.asyncio
+async def test_artifact_bytes_round_trip(tmp_path: Path) -> None:
+    service = SqliteArtifactService(str(tmp_path / "state.db"))
+    data = bytes(range(256))
+    await service.save_artifact(
+        **SCOPE,
+        session_id="s1",
+        filename="blob.bin",
+        artifact=types.Part.from_bytes(data=data, mime_type="application/octet-stream"),
+    )
+
+    loaded = await service.load_artifact(**SCOPE, session_id="s1", filename="blob.bin")
+    assert loaded.inline_data.data == data
+    assert loaded.inline_data.mime_type == "application/octet-stream"
+
+
+@pytest.mark.asyncio
+async def test_memory_keyword_search(tmp_path: Path) -> None:
+    service = SqliteMemoryService(str(tmp_path / "state.db"))
+    session = Session(
+        id="s1",
+        **SCOPE,
+        events=[
+            Event(
+                author="user",
+                content=types.Content(role="user", parts=[text_part("I like whales.")]),
+            ),
+            Event(
+                author="agent",
+                content=types.Content(role="model", parts=[text_part("Noted!")]),
+            ),
+        ],
+    )
+    await service.add_session_to_memory(session)
+    # Adding a session again replaces its events rather than duplicating them.
+    await service.add_session_to_memory(session)
+
+    found = await service.search_memory(**SCOPE, query="Whales?")
+    assert [memory.content.parts[0].text for memory in found.memories] == [
+        "I like whales."
+    ]
+    assert found.memories[0].author == "user"
+    assert not (await service.search_memory(**SCOPE, query="dolphins")).memories
+    assert not (
+        await service.search_memory(app_name="app", user_id="other", query="whales")
+    ).memories
+
+
+@pytest.mark.asyncio
+async def test_sessions_are_shared_between_processes(tmp_path: Path) -> None:
+    db_path = str(tmp_path / "state.db")
+    session_service, _, _ = create_services("sqlite", db_path)
+    session = await session_service.create_session(**SCOPE, state={"color": "blue"})
+
+    # A second worker process opens the same database.
+    script = textwrap.dedent(
+        f"""
+        import asyncio
+        from app.utils.shared_services import create_services
+
+        async def main():
+            session_service, _, _ = create_services("sqlite", {db_path!r})
+            session = await session_service.get_session(
+                app_name="app", user_id="user", session_id={session.id!r}
+            )
+            print(session.state["color"])
+
+        asyncio.run(main())
+        """
+    )
+    result = subprocess.run(
+        [sys.executable, "-c", script],
+        cwd=APP_ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert result.stdout.strip().splitlines()[-1] == "blue"
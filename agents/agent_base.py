@@ -1,21 +1,37 @@
+import asyncio
 import os
 import re
-import json
-import importlib
 import logging
+import threading
 from pathlib import Path
 from typing import Dict, List, Any, Optional, Callable
 
 import vertexai
-from vertexai.generative_models import GenerativeModel, Tool, Part
+from vertexai.generative_models import Content, GenerativeModel, Tool, Part
+
+from agents.agent_registry import AgentConfig, AgentRegistry, get_registry
+from agents.context_cache import ENABLE_CONTEXT_CACHE, CacheEntry, get_default_manager
+from agents.history import POLICY_SUMMARIZE, ConversationHistory
+from agents.session_pool import (
+    AGENT_MAX_SESSIONS,
+    AGENT_SESSION_TTL_SECONDS,
+    AgentSession,
+    SessionPool,
+    resolve_session_id,
+)
+from agents.tool_registry import get_tool_registry
 
 logger = logging.getLogger(__name__)
 
+# Chat history compaction defaults: "none", "sliding_window" or "summarize".
+HISTORY_POLICY = os.environ.get("HISTORY_POLICY", "sliding_window")
+HISTORY_MAX_TOKENS = int(os.environ.get("HISTORY_MAX_TOKENS", "32000"))
+
 # Regex to find sections like # Name, # Instruction, etc.
 SECTION_PATTERN = re.compile(r"^\s*#+\s*([\w -]+?)\s*$", re.MULTILINE)
 
 
-def parse_agent_md(agent_name: str) -> Dict[str, Any]:
+def parse_agent_md(agent_name: str, agents_dir: Optional[Path] = None) -> Dict[str, Any]:
     """
     Parses the agent.md file for a given agent.
     The agent.md file is expected in the agent's directory.
@@ -23,7 +39,7 @@ def parse_agent_md(agent_name: str) -> Dict[str, Any]:
     """
     # Assuming the script is run from the project root.
     # The agent directory is relative to this script's location.
-    script_dir = Path(__file__).parent.absolute()
+    script_dir = Path(agents_dir) if agents_dir else Path(__file__).parent.absolute()
     md_path = script_dir / agent_name / "agent.md"
 
     if not md_path.exists():
@@ -62,9 +78,28 @@ def parse_agent_md(agent_name: str) -> Dict[str, Any]:
 class BaseAgent:
     """
     A base class for creating agents that are configured via an agent.md file.
+
+    The agent.md config comes from the shared `AgentRegistry`, which parses and
+    validates each file once. The Vertex AI client and model are built lazily on
+    the first query (or by `AgentRegistry.prewarm`), and rebuilt if agent.md
+    changes on disk.
+
+    One agent instance serves many users: each session_id gets its own chat
+    from a bounded `SessionPool`, with LRU and idle-TTL eviction.
     """
 
-    def __init__(self, agent_name: str, project: str, location: str, tools_registry: Optional[Dict[str, Callable]] = None):
+    def __init__(
+        self,
+        agent_name: str,
+        project: str,
+        location: str,
+        tools_registry: Optional[Dict[str, Callable]] = None,
+        history_policy: str = HISTORY_POLICY,
+        history_max_tokens: int = HISTORY_MAX_TOKENS,
+        registry: Optional[AgentRegistry] = None,
+        max_sessions: int = AGENT_MAX_SESSIONS,
+        session_ttl_seconds: float = AGENT_SESSION_TTL_SECONDS,
+    ):
         """
         Initializes the agent by loading its configuration.
 
@@ -72,21 +107,55 @@ class BaseAgent:
             agent_name: The name of the agent, corresponding to its directory.
             project: The Google Cloud project ID.
             location: The Google Cloud location/region.
-            tools_registry: A dictionary mapping tool names to their factory functions.
+            tools_registry: A dictionary mapping tool names to their functions, registered in the shared tool
+                registry under this agent's namespace.
+            history_policy: How to bound the chat history ("none", "sliding_window" or "summarize").
+            history_max_tokens: Token budget for the chat history sent on each turn.
+            registry: The registry to load agent.md from. Defaults to the shared one.
+            max_sessions: How many chat sessions to keep before evicting the least recently used.
+            session_ttl_seconds: How long an idle chat session is kept.
         """
         self.agent_name = agent_name
         self.project = project
         self.location = location
+        self.registry = registry or get_registry()
+        self.tool_registry = get_tool_registry()
+        for tool_name, tool_function in (tools_registry or {}).items():
+            self.tool_registry.register(tool_name, func=tool_function, namespace=self.agent_name)
 
-        config = parse_agent_md(agent_name)
-        self.name = config["name"]
-        self.model_name = config["model"]
-        self.instruction = config["instruction"]
-        self.tools_json_str = config["tools_json"]
+        self._apply_config(self.registry.get_config(agent_name))
+        self._setup_lock = threading.Lock()
 
         self.model: Optional[GenerativeModel] = None
-        self.chat: Optional[vertexai.generative_models._generative_models.ChatSession] = None
         self.tools: List[Tool] = []
+        self.history_policy = history_policy
+        self.history_max_tokens = history_max_tokens
+        self.sessions = SessionPool(max_sessions=max_sessions, ttl_seconds=session_ttl_seconds)
+        self._cache_entry: Optional[CacheEntry] = None
+
+    def _apply_config(self, config: AgentConfig) -> None:
+        self.config = config
+        self.name = config.name
+        self.model_name = config.model
+        self.instruction = config.instruction
+        self.tools_json_str = config.tools_json
+
+    def ensure_setup(self) -> None:
+        """
+        Sets the agent up on first use, and again if its agent.md has changed
+        since. Safe to call from concurrent requests.
+        """
+        config = self.registry.get_config(self.agent_name)
+        if self.model is not None and config is self.config:
+            return
+        with self._setup_lock:
+            if self.model is not None and config is self.config:
+                return
+            if self.model is not None:
+                logger.info(f"agent.md for agent '{self.agent_name}' changed. Rebuilding the agent.")
+                self.sessions.clear()
+            self._apply_config(config)
+            self.setup()
 
     def setup(self):
         """
@@ -95,51 +164,149 @@ class BaseAgent:
         """
         vertexai.init(project=self.project, location=self.location)
 
-        # Dynamically load tools based on the agent's config
-        all_tools = []
-        if self.tools_json_str:
-            try:
-                tool_configs = json.loads(self.tools_json_str)
-                for config in tool_configs:
-                    tool_type = config.get("type")
-                    if tool_type == "VertexAiRagRetrieval":
-                        # The RAG tool is special and defined within the agent's package
-                        try:
-                            tool_module = importlib.import_module(f"agents.{self.agent_name}.tools")
-                            rag_tool = getattr(tool_module, "rag_tool", None)
-                            if rag_tool:
-                                all_tools.append(rag_tool)
-                                logger.info(f"Loaded RAG tool for agent '{self.agent_name}'.")
-                            else:
-                                logger.warning(f"RAG tool configured but not found in agents.{self.agent_name}.tools")
-                        except ImportError:
-                            logger.error(f"Could not import tools for agent '{self.agent_name}'.")
-
-            except json.JSONDecodeError as e:
-                logger.error(f"Error parsing tools JSON for agent '{self.agent_name}': {e}")
-
-        self.tools = all_tools
-        self.model = GenerativeModel(
+        # Load tools based on the agent's config through the shared tool
+        # registry. The tools JSON was already parsed and validated.
+        self.tools = self.tool_registry.build_tools(
+            self.config.tools, agent_package=f"agents.{self.agent_name}", namespace=self.agent_name
+        )
+        # Serve the static instruction and tool definitions from a context
+        # cache when enabled and large enough; otherwise send them inline.
+        self.model = self._build_model()
+        logger.info(f"Agent '{self.name}' setup complete with model '{self.model_name}'.")
+
+    def _build_model(self) -> GenerativeModel:
+        self._cache_entry = None
+        if ENABLE_CONTEXT_CACHE:
+            manager = get_default_manager()
+            self._cache_entry = manager.get_or_create(
+                self.model_name,
+                system_instruction=self.instruction,
+                tools=self.tools,
+                project=self.project,
+                location=self.location,
+            )
+            if self._cache_entry:
+                logger.info(f"Agent '{self.name}' is using cached context '{self._cache_entry.name}'.")
+                return manager.model_for(self._cache_entry)
+        return GenerativeModel(
             self.model_name,
             system_instruction=[self.instruction],
             tools=self.tools,
         )
-        logger.info(f"Agent '{self.name}' setup complete with model '{self.model_name}'.")
 
-    def query(self, user_prompt: str, **kwargs):
+    def _refresh_cached_model(self) -> None:
         """
-        Sends a prompt to the agent and returns the response.
-        Maintains a chat session.
+        Keeps a cached prefix alive across long sessions. The manager extends
+        the cache TTL before it expires; if the cache had to be recreated under
+        a new name, the model is rebuilt and each session's chat is rebound to
+        it on that session's next turn.
+
+        The expiry check is lock-free, so queries only take the setup lock in
+        the short window where the cache needs a refresh.
+        """
+        manager = get_default_manager()
+        entry = self._cache_entry
+        if entry is None or manager.is_fresh(entry):
+            return
+        with self._setup_lock:
+            entry = self._cache_entry
+            if entry is None or manager.is_fresh(entry):
+                return
+            refreshed = manager.get_or_create(
+                self.model_name,
+                system_instruction=self.instruction,
+                tools=self.tools,
+                project=self.project,
+                location=self.location,
+            )
+            if refreshed is not None and refreshed.name == entry.name:
+                self._cache_entry = refreshed
+                return
+            self.model = self._build_model()
+
+    def query(self, user_prompt: str, session_id: Optional[str] = None, **kwargs):
         """
-        if not self.model:
-            raise RuntimeError("Agent is not set up. Please call .setup() first.")
+        Sends a prompt to the agent and returns the response.
+        Maintains one chat session per session_id. Turns of the same session
+        are serialized; different sessions run concurrently.
 
-        if not self.chat:
-            self.chat = self.model.start_chat()
+        Without a session_id, the session of the request being served (see
+        `agents.session_pool.session_scope`) is used.
+        """
+        session_id = resolve_session_id(session_id)
+        self.ensure_setup()
+        self._refresh_cached_model()
+        session = self.sessions.get(session_id)
+        with session.lock:
+            model = self.model
+            if session.chat is None:
+                session.chat = model.start_chat()
+                session.history = self._new_history()
+            elif session.model is not model:
+                session.chat = model.start_chat(history=session.chat.history)
+            session.model = model
 
-        logger.info(f"Sending prompt to agent '{self.name}': '{user_prompt[:100]}...'")
-        response = self.chat.send_message(user_prompt, **kwargs)
+            logger.info(f"Sending prompt to agent '{self.name}' (session '{session_id}'): '{user_prompt[:100]}...'")
+            seen_turns = len(session.chat.history)
+            response = session.chat.send_message(user_prompt, **kwargs)
+            self._compact_history(session, session.chat.history[seen_turns:], response)
+            session.last_used = self.sessions.clock()
 
         # The response can contain function calls or text.
         # For ADK compatibility, we return the raw response object.
-        return response
\ No newline at end of file
+        return response
+
+    async def aquery(self, user_prompt: str, session_id: Optional[str] = None, **kwargs):
+        """
+        Async version of `query`. The blocking model call runs in a worker
+        thread, so concurrent sessions don't block the event loop or each other.
+        """
+        return await asyncio.to_thread(self.query, user_prompt, resolve_session_id(session_id), **kwargs)
+
+    def call_tool(self, tool_name: str, args: Optional[Dict[str, Any]] = None, session_id: Optional[str] = None) -> Any:
+        """
+        Runs a function tool the model asked for. Memoized tools reuse the
+        result of an identical call made earlier in the same session.
+        """
+        return self.tool_registry.call(
+            tool_name, args, scope=f"{self.agent_name}:{resolve_session_id(session_id)}", namespace=self.agent_name
+        )
+
+    def end_session(self, session_id: str) -> bool:
+        """Drops a session's chat and memoized tool results. Returns True if the session existed."""
+        self.tool_registry.clear_memo(scope=f"{self.agent_name}:{session_id}")
+        return self.sessions.discard(session_id)
+
+    def _new_history(self) -> ConversationHistory:
+        """Creates the token-bounded history that mirrors a chat session."""
+        summarizer = None
+        if self.history_policy == POLICY_SUMMARIZE:
+            summary_model = GenerativeModel(self.model_name)
+            summarizer = lambda prompt: summary_model.generate_content(prompt).text
+        return ConversationHistory(
+            policy=self.history_policy,
+            max_tokens=self.history_max_tokens,
+            pinned_turns=0,
+            summarizer=summarizer,
+            summary_turn_factory=lambda summary: [
+                Content(role="user", parts=[Part.from_text(f"Summary of our earlier conversation:\n{summary}")]),
+                Content(role="model", parts=[Part.from_text("Understood.")]),
+            ],
+        )
+
+    def _compact_history(self, session: AgentSession, new_turns: List[Content], response) -> None:
+        """
+        Records the turns added by the last exchange and, if the history had to
+        be compacted, restarts the session's chat from the compacted history.
+        """
+        history = session.history
+        dropped_before = history.dropped_turns
+        usage_metadata = getattr(response, "usage_metadata", None)
+        for turn in new_turns:
+            tokens = None
+            if turn.role == "model" and usage_metadata:
+                tokens = usage_metadata.candidates_token_count or None
+            history.append(turn, tokens=tokens)
+
+        if history.dropped_turns != dropped_before:
+            session.chat = session.model.start_chat(history=history.contents())
@@ -0,0 +1,161 @@
+import json
+import logging
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+AGENTS_DIR = Path(__file__).parent.absolute()
+# Comma-separated agent names to set up when the server starts. "*" means all.
+PREWARM_AGENTS = os.environ.get("PREWARM_AGENTS", "")
+# How often, in seconds, a cached agent.md is checked for changes. 0 checks on every query.
+AGENT_CONFIG_RELOAD_SECONDS = float(os.environ.get("AGENT_CONFIG_RELOAD_SECONDS", "5"))
+
+
+@dataclass(frozen=True)
+class AgentConfig:
+    """A validated agent.md definition."""
+
+    agent_name: str
+    name: str
+    model: str
+    instruction: str
+    tools_json: str
+    tools: List[Dict[str, Any]] = field(default_factory=list)
+    path: Optional[Path] = None
+    mtime: float = 0.0
+
+
+def validate_agent_config(agent_name: str, raw: Dict[str, Any], path: Optional[Path] = None, mtime: float = 0.0) -> AgentConfig:
+    """
+    Validates the dictionary returned by `parse_agent_md` and compiles the
+    '# Tools' JSON once, so invalid agent.md files fail at load time rather
+    than on the first query.
+    """
+    if not raw.get("model", "").strip():
+        raise ValueError(f"agent.md for agent '{agent_name}' has an empty '# Model' section.")
+
+    tools_json = raw.get("tools_json") or "[]"
+    try:
+        tools = json.loads(tools_json)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Error parsing tools JSON for agent '{agent_name}': {e}") from e
+    if not isinstance(tools, list) or not all(isinstance(tool, dict) and tool.get("type") for tool in tools):
+        raise ValueError(f"The '# Tools' section for agent '{agent_name}' must be a JSON list of objects with a 'type' key.")
+
+    return AgentConfig(
+        agent_name=agent_name,
+        name=raw["name"],
+        model=raw["model"].strip(),
+        instruction=raw["instruction"],
+        tools_json=tools_json,
+        tools=tools,
+        path=path,
+        mtime=mtime,
+    )
+
+
+class AgentRegistry:
+    """
+    Loads every agents/<name>/agent.md once into a validated `AgentConfig`,
+    re-parsing a file only when its mtime changes (checked at most every
+    `reload_interval` seconds), and hands out one lazily
+    set up `BaseAgent` per agent name. Agents are only set up (vertexai.init
+    and model construction) on their first query, unless pre-warmed.
+    """
+
+    def __init__(
+        self,
+        agents_dir: Path = AGENTS_DIR,
+        reload_interval: float = AGENT_CONFIG_RELOAD_SECONDS,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.agents_dir = Path(agents_dir)
+        self.reload_interval = reload_interval
+        self.clock = clock
+        self._configs: Dict[str, AgentConfig] = {}
+        self._checked: Dict[str, float] = {}
+        self._agents: Dict[tuple, Any] = {}
+        self._lock = threading.RLock()
+
+    def discover(self) -> List[str]:
+        """Returns the names of all agents that have an agent.md file."""
+        return sorted(path.parent.name for path in self.agents_dir.glob("*/agent.md"))
+
+    def get_config(self, agent_name: str) -> AgentConfig:
+        """Returns the cached config for an agent, re-parsing it if agent.md changed."""
+        from agents.agent_base import parse_agent_md
+
+        now = self.clock()
+        with self._lock:
+            cached = self._configs.get(agent_name)
+            if cached and now - self._checked.get(agent_name, 0.0) < self.reload_interval:
+                return cached
+
+        md_path = self.agents_dir / agent_name / "agent.md"
+        try:
+            mtime = md_path.stat().st_mtime
+        except FileNotFoundError:
+            raise FileNotFoundError(f"agent.md not found for agent '{agent_name}' at {md_path}") from None
+
+        with self._lock:
+            cached = self._configs.get(agent_name)
+            if cached and cached.mtime == mtime:
+                self._checked[agent_name] = now
+                return cached
+            config = validate_agent_config(agent_name, parse_agent_md(agent_name, agents_dir=self.agents_dir), md_path, mtime)
+            if cached:
+                logger.info(f"Reloaded agent.md for agent '{agent_name}'.")
+            self._configs[agent_name] = config
+            self._checked[agent_name] = now
+            return config
+
+    def get_agent(self, agent_name: str, project: Optional[str], location: str, **agent_kwargs) -> Any:
+        """Returns the shared, lazily set up agent instance for a name."""
+        from agents.agent_base import BaseAgent
+
+        key = (agent_name, project, location)
+        with self._lock:
+            agent = self._agents.get(key)
+            if agent is None:
+                agent = BaseAgent(agent_name=agent_name, project=project, location=location, registry=self, **agent_kwargs)
+                self._agents[key] = agent
+            return agent
+
+    def prewarm(self, agent_names: List[str], project: Optional[str], location: str) -> List[str]:
+        """Sets up the given agents now so their first query doesn't pay for it."""
+        if agent_names == ["*"]:
+            agent_names = self.discover()
+        warmed = []
+        for agent_name in agent_names:
+            try:
+                self.get_agent(agent_name, project, location).ensure_setup()
+                warmed.append(agent_name)
+            except Exception as e:
+                logger.error(f"Could not pre-warm agent '{agent_name}': {e}")
+        logger.info(f"Pre-warmed agents: {warmed}")
+        return warmed
+
+    def prewarm_from_env(self, project: Optional[str], location: str) -> List[str]:
+        """Pre-warms the agents listed in $PREWARM_AGENTS."""
+        agent_names = [name.strip() for name in PREWARM_AGENTS.split(",") if name.strip()]
+        if not agent_names:
+            return []
+        return self.prewarm(agent_names, project, location)
+
+
+_registry: Optional[AgentRegistry] = None
+_registry_lock = threading.Lock()
+
+
+def get_registry() -> AgentRegistry:
+    """Returns the process-wide registry for the agents directory."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = AgentRegistry()
+        return _registry
@@ -20,7 +20,15 @@ import vertexai
 from google.adk.agents import Agent
 from langchain_google_vertexai import VertexAIEmbeddings
 
-from app.retrievers import get_compressor, get_retriever
+from app.context_assembly import ContextAssembler
+from app.embeddings import BatchingEmbeddings
+from app.retrieval_pipeline import RetrievalPipeline
+from app.retrievers import (
+    get_compressor,
+    get_retriever,
+    get_vertex_ai_search_retriever,
+)
+from app.semantic_cache import CachedRetrieval, SemanticCache
 from app.templates import format_docs
 
 EMBEDDING_MODEL = "text-embedding-005"
@@ -34,8 +42,16 @@ os.environ.setdefault("GOOGLE_CLOUD_LOCATION", LLM_LOCATION)
 os.environ.setdefault("GOOGLE_GENAI_USE_VERTEXAI", "True")
 
 vertexai.init(project=project_id, location=LOCATION)
-embedding = VertexAIEmbeddings(
-    project=project_id, location=LOCATION, model_name=EMBEDDING_MODEL
+# Coalesce concurrent query embeddings into batched requests and cache them
+# by text, instead of one embedding request per tool call.
+embedding = BatchingEmbeddings(
+    VertexAIEmbeddings(
+        project=project_id, location=LOCATION, model_name=EMBEDDING_MODEL
+    ),
+    max_batch_size=int(os.getenv("EMBEDDING_MAX_BATCH_SIZE", "32")),
+    max_wait_ms=float(os.getenv("EMBEDDING_MAX_WAIT_MS", "10")),
+    cache_size=int(os.getenv("EMBEDDING_CACHE_SIZE", "4096")),
+    timeout_s=float(os.getenv("EMBEDDING_TIMEOUT_S", "30")),
 )
 
 
@@ -62,6 +78,52 @@ compressor = get_compressor(
     project_id=project_id,
 )
 
+# Query every configured source concurrently, fuse the results with
+# reciprocal-rank fusion and re-rank them, each stage within a latency budget.
+retrieval_sources = {"vector_search": retriever}
+vertex_ai_search_data_store_id = os.getenv("VERTEX_AI_SEARCH_DATA_STORE_ID")
+if vertex_ai_search_data_store_id:
+    retrieval_sources["vertex_ai_search"] = get_vertex_ai_search_retriever(
+        project_id=project_id,
+        location_id=os.getenv("VERTEX_AI_SEARCH_LOCATION", "global"),
+        data_store_id=vertex_ai_search_data_store_id,
+    )
+rerank_skip_margin = os.getenv("RERANK_SKIP_MARGIN")
+retrieval_pipeline = RetrievalPipeline(
+    sources=retrieval_sources,
+    compressor=compressor,
+    retrieval_budget_s=float(os.getenv("RETRIEVAL_BUDGET_SECONDS", "2.0")),
+    rerank_budget_s=float(os.getenv("RERANK_BUDGET_SECONDS", "1.5")),
+    skip_rerank_margin=float(rerank_skip_margin) if rerank_skip_margin else None,
+)
+
+# Optionally serve paraphrased repeat questions from an in-process semantic
+# cache of ranked results, skipping retrieval and Vertex AI Rank. Off by
+# default: a question close enough to a cached one gets its documents, so
+# tune SEMANTIC_CACHE_THRESHOLD on your own traffic before enabling it.
+semantic_cache = (
+    SemanticCache(
+        threshold=float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.95")),
+        ttl_seconds=float(os.getenv("SEMANTIC_CACHE_TTL_SECONDS", "3600")),
+        max_entries=int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "1024")),
+    )
+    if os.getenv("SEMANTIC_CACHE_ENABLED", "false").lower() == "true"
+    else None
+)
+cached_retrieval = CachedRetrieval(
+    pipeline=retrieval_pipeline,
+    embedding=embedding,
+    cache=semantic_cache,
+)
+
+# Keep the retrieved context within a predictable token cost: drop
+# near-duplicate chunks and trim documents that don't fit the budget.
+context_assembler = ContextAssembler(
+    max_tokens=int(os.getenv("CONTEXT_MAX_TOKENS", "4000")),
+    dedup_threshold=float(os.getenv("CONTEXT_DEDUP_THRESHOLD", "0.8")),
+    order=os.getenv("CONTEXT_ORDER", "rank"),
+)
+
 
 def retrieve_docs(query: str) -> str:
     """
@@ -75,14 +137,13 @@ def retrieve_docs(query: str) -> str:
         str: Formatted string containing relevant document content retrieved and ranked based on the query.
     """
     try:
-        # Use the retriever to fetch relevant documents based on the query
-        retrieved_docs = retriever.invoke(query)
-        # Re-rank docs with Vertex AI Rank for better relevance
-        ranked_docs = compressor.compress_documents(
-            documents=retrieved_docs, query=query
-        )
+        # Fetch relevant documents from all sources and re-rank them with Vertex
+        # AI Rank, or reuse the ranked documents of a similar earlier query
+        ranked_docs = cached_retrieval.invoke(query)
+        # Fit the ranked documents into the context token budget
+        context = context_assembler.assemble(ranked_docs, query=query)
         # Format ranked documents into a consistent structure for LLM consumption
-        formatted_docs = format_docs.format(docs=ranked_docs)
+        formatted_docs = format_docs.format(docs=context.docs)
     except Exception as e:
         return f"Calling retrieval tool with query:\n\n{query}\n\nraised the following error:\n\n{type(e)}: {e}"
 
@@ -0,0 +1,225 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import re
+import zlib
+from collections.abc import Callable
+from dataclasses import dataclass, field
+
+import numpy as np
+from langchain_core.documents import Document
+
+logger = logging.getLogger(__name__)
+
+ORDER_RANK = "rank"
+ORDER_EDGES = "edges"
+
+_WORD = re.compile(r"\w+")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+|\n{2,}")
+_MERSENNE_PRIME = (1 << 61) - 1
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate (~4 characters per token)."""
+    return max(1, len(text) // 4) if text else 0
+
+
+def split_sentences(text: str) -> list[str]:
+    return [sentence.strip() for sentence in _SENTENCE_END.split(text) if sentence.strip()]
+
+
+class MinHasher:
+    """MinHash signatures of word shingles, for estimating Jaccard similarity.
+
+    Args:
+        num_perm: Number of hash functions; more is more accurate and slower.
+        shingle_size: Words per shingle.
+        seed: Seed for the hash functions.
+    """
+
+    def __init__(self, num_perm: int = 64, shingle_size: int = 5, seed: int = 0) -> None:
+        rng = np.random.default_rng(seed)
+        self.shingle_size = shingle_size
+        self._a = rng.integers(1, _MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, _MERSENNE_PRIME, size=num_perm, dtype=np.uint64)
+
+    def signature(self, text: str) -> np.ndarray:
+        words = _WORD.findall(text.casefold())
+        size = min(self.shingle_size, len(words)) or 1
+        shingles = {" ".join(words[i : i + size]) for i in range(max(1, len(words) - size + 1))}
+        hashes = np.array([zlib.crc32(shingle.encode("utf-8")) for shingle in shingles], dtype=np.uint64)
+        # (a * h + b) mod p; uint64 arithmetic wraps, which is fine for hashing.
+        permuted = (np.outer(hashes, self._a) + self._b) % np.uint64(_MERSENNE_PRIME)
+        return permuted.min(axis=0)
+
+    @staticmethod
+    def similarity(first: np.ndarray, second: np.ndarray) -> float:
+        return float(np.mean(first == second))
+
+
+@dataclass
+class AssemblyReport:
+    """What `ContextAssembler.assemble` kept and dropped."""
+
+    input_tokens: int = 0
+    output_tokens: int = 0
+    duplicates_removed: int = 0
+    trimmed_docs: int = 0
+    dropped_docs: int = 0
+    kept_ids: list[str] = field(default_factory=list)
+
+    @property
+    def dropped_tokens(self) -> int:
+        return self.input_tokens - self.output_tokens
+
+
+@dataclass
+class AssembledContext:
+    docs: list[Document]
+    report: AssemblyReport
+
+
+class ContextAssembler:
+    """Fits ranked documents into a token budget before they are formatted for the model.
+
+    1. Near-duplicate chunks (MinHash Jaccard estimate >= `dedup_threshold`)
+       are removed, keeping the higher-ranked one.
+    2. Documents are taken in rank order, each costing its tokens plus
+       `doc_overhead_tokens` for the markup that separates it from the others.
+       One that does not fit the remaining budget is trimmed to its sentences
+       sharing the most words with the query (kept in their original order,
+       counting the spaces that join them); if no sentence fits, the best one
+       is cut to the budget. If fewer than `min_doc_tokens` would remain, the
+       document is dropped.
+    3. The kept documents are ordered by rank, or with `order="edges"` the
+       best ones are placed at the start and end of the context, where models
+       attend to them most.
+
+    Args:
+        max_tokens: Token budget for all document contents.
+        dedup_threshold: Similarity above which a chunk counts as a duplicate.
+        min_doc_tokens: Smallest trimmed document worth keeping.
+        order: "rank" or "edges".
+        token_counter: Counts tokens in a string.
+        doc_overhead_tokens: Tokens of the per-document markup added when
+            the documents are formatted (e.g. "<Document 0>" tags).
+    """
+
+    def __init__(
+        self,
+        max_tokens: int = 4000,
+        dedup_threshold: float = 0.8,
+        min_doc_tokens: int = 32,
+        order: str = ORDER_RANK,
+        token_counter: Callable[[str], int] = estimate_tokens,
+        hasher: MinHasher | None = None,
+        doc_overhead_tokens: int = 8,
+    ) -> None:
+        if order not in (ORDER_RANK, ORDER_EDGES):
+            raise ValueError(f"Unknown order '{order}'. Use '{ORDER_RANK}' or '{ORDER_EDGES}'.")
+        self.max_tokens = max_tokens
+        self.dedup_threshold = dedup_threshold
+        self.min_doc_tokens = min_doc_tokens
+        self.order = order
+        self.token_counter = token_counter
+        self.hasher = hasher or MinHasher()
+        self.doc_overhead_tokens = doc_overhead_tokens
+
+    def _dedupe(self, docs: list[Document]) -> list[Document]:
+        kept: list[Document] = []
+        signatures: list[np.ndarray] = []
+        for doc in docs:
+            signature = self.hasher.signature(doc.page_content)
+            if any(MinHasher.similarity(signature, other) >= self.dedup_threshold for other in signatures):
+                continue
+            kept.append(doc)
+            signatures.append(signature)
+        return kept
+
+    def _truncate(self, text: str, budget: int) -> str:
+        """Cuts text to its longest word prefix (or, for a single huge word, character prefix) within budget."""
+        words = text.split()
+        low, high = 0, len(words)
+        while low < high:
+            middle = (low + high + 1) // 2
+            if self.token_counter(" ".join(words[:middle])) <= budget:
+                low = middle
+            else:
+                high = middle - 1
+        if low:
+            return " ".join(words[:low])
+        low, high = 0, len(text)
+        while low < high:
+            middle = (low + high + 1) // 2
+            if self.token_counter(text[:middle]) <= budget:
+                low = middle
+            else:
+                high = middle - 1
+        return text[:low]
+
+    def _trim(self, text: str, query_words: set[str], budget: int) -> str:
+        sentences = split_sentences(text)
+        scored = sorted(
+            range(len(sentences)),
+            key=lambda i: (-len(query_words & set(_WORD.findall(sentences[i].casefold()))), i),
+        )
+        chosen: list[int] = []
+        for i in scored:
+            # Count the whole joined text, so the separators are paid for too.
+            candidate = sorted(chosen + [i])
+            if self.token_counter(" ".join(sentences[j] for j in candidate)) <= budget:
+                chosen = candidate
+        if not chosen and scored:
+            # Every sentence is larger than the budget: cut the best one to fit.
+            return self._truncate(sentences[scored[0]], budget)
+        return " ".join(sentences[i] for i in chosen)
+
+    def assemble(self, docs: list[Document], query: str = "") -> AssembledContext:
+        """Returns the documents to send, trimmed and ordered, and a report of what was dropped."""
+        report = AssemblyReport(input_tokens=sum(self.token_counter(doc.page_content) for doc in docs))
+        unique = self._dedupe(docs)
+        report.duplicates_removed = len(docs) - len(unique)
+
+        query_words = set(_WORD.findall(query.casefold()))
+        remaining = self.max_tokens
+        kept: list[Document] = []
+        for doc in unique:
+            tokens = self.token_counter(doc.page_content) + self.doc_overhead_tokens
+            if tokens <= remaining:
+                kept.append(doc)
+                remaining -= tokens
+                continue
+            content_budget = remaining - self.doc_overhead_tokens
+            trimmed = self._trim(doc.page_content, query_words, content_budget) if content_budget >= self.min_doc_tokens else ""
+            trimmed_tokens = self.token_counter(trimmed)
+            if trimmed_tokens < self.min_doc_tokens:
+                report.dropped_docs += 1
+                continue
+            kept.append(Document(page_content=trimmed, metadata={**doc.metadata, "trimmed": True}))
+            report.trimmed_docs += 1
+            remaining -= trimmed_tokens + self.doc_overhead_tokens
+
+        if self.order == ORDER_EDGES:
+            # Best documents at both ends: 1st, 3rd, 5th ... then ... 4th, 2nd.
+            kept = kept[0::2] + kept[1::2][::-1]
+
+        report.output_tokens = sum(self.token_counter(doc.page_content) for doc in kept)
+        report.kept_ids = [str(doc.metadata.get("id", "")) for doc in kept]
+        logger.info(
+            f"Assembled context: {report.output_tokens}/{report.input_tokens} tokens kept, "
+            f"{report.dropped_tokens} dropped ({report.duplicates_removed} duplicates, "
+            f"{report.trimmed_docs} trimmed, {report.dropped_docs} dropped documents)."
+        )
+        return AssembledContext(docs=kept, report=report)
@@ -0,0 +1,224 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import asyncio
+import hashlib
+import logging
+import queue
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any
+
+from langchain_core.embeddings import Embeddings
+
+logger = logging.getLogger(__name__)
+
+QUERY_TASK_TYPE = "RETRIEVAL_QUERY"
+DOCUMENT_TASK_TYPE = "RETRIEVAL_DOCUMENT"
+
+
+def _text_key(task_type: str, text: str) -> str:
+    return f"{task_type}:{hashlib.sha256(text.encode('utf-8')).hexdigest()}"
+
+
+class BatchingEmbeddings(Embeddings):
+    """Wraps an embeddings model to coalesce concurrent queries into batches.
+
+    Concurrent `embed_query` calls are queued and sent to the model together,
+    in batches of up to `max_batch_size` texts. A query that arrives with
+    nothing else pending is sent at once; otherwise the batch waits at most
+    `max_wait_ms` to fill. Identical texts already in flight share one request,
+    and finished embeddings are cached by text hash (LRU, `cache_size`
+    entries). Being a LangChain `Embeddings`, it can be passed anywhere the
+    wrapped model is, e.g. to `get_retriever`.
+
+    Args:
+        embeddings: The wrapped model, e.g. `VertexAIEmbeddings`.
+        max_batch_size: Maximum texts per model request.
+        max_wait_ms: How long a batch of concurrent queries waits for more.
+        cache_size: Number of embeddings kept in the cache. 0 disables it.
+        timeout_s: How long `embed_query` waits for its embedding.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        max_batch_size: int = 32,
+        max_wait_ms: float = 10,
+        cache_size: int = 4096,
+        timeout_s: float = 30,
+    ) -> None:
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1.")
+        self.embeddings = embeddings
+        self.max_batch_size = max_batch_size
+        self.max_wait_ms = max_wait_ms
+        self.cache_size = cache_size
+        self.timeout_s = timeout_s
+
+        self._cache: OrderedDict[str, list[float]] = OrderedDict()
+        self._in_flight: dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self._queue: queue.Queue[tuple[str, str]] = queue.Queue()
+        self._worker: threading.Thread | None = None
+
+        self.requests = 0
+        self.batched_texts = 0
+        self.cache_hits = 0
+        self.dedup_hits = 0
+
+    # --- Cache ---
+
+    def _cache_get(self, key: str) -> list[float] | None:
+        embedding = self._cache.get(key)
+        if embedding is not None:
+            self._cache.move_to_end(key)
+            self.cache_hits += 1
+        return embedding
+
+    def _cache_put(self, key: str, embedding: list[float]) -> None:
+        if not self.cache_size:
+            return
+        self._cache[key] = embedding
+        self._cache.move_to_end(key)
+        while len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+
+    # --- Query coalescing ---
+
+    def _ensure_worker(self) -> None:
+        if self._worker is None or not self._worker.is_alive():
+            self._worker = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+            self._worker.start()
+
+    def _submit_query(self, text: str) -> Future:
+        key = _text_key(QUERY_TASK_TYPE, text)
+        with self._lock:
+            future: Future = Future()
+            cached = self._cache_get(key)
+            if cached is not None:
+                future.set_result(cached)
+                return future
+            in_flight = self._in_flight.get(key)
+            if in_flight is not None:
+                self.dedup_hits += 1
+                return in_flight
+            self._in_flight[key] = future
+            self._ensure_worker()
+        self._queue.put((key, text))
+        return future
+
+    def _next_batch(self) -> list[tuple[str, str]]:
+        batch = [self._queue.get()]
+        while len(batch) < self.max_batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        if len(batch) == 1:
+            # Nothing else is pending, so waiting would only add latency.
+            return batch
+        deadline = time.monotonic() + self.max_wait_ms / 1000
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._next_batch()
+            keys = [key for key, _ in batch]
+            try:
+                vectors = self._embed_batch([text for _, text in batch], QUERY_TASK_TYPE)
+            except Exception as e:
+                logger.error(f"Embedding batch of {len(batch)} queries failed: {e}")
+                with self._lock:
+                    futures = [self._in_flight.pop(key) for key in keys]
+                for future in futures:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+
+            with self._lock:
+                futures = [self._in_flight.pop(key) for key in keys]
+                for key, vector in zip(keys, vectors):
+                    self._cache_put(key, vector)
+            for future, vector in zip(futures, vectors):
+                if not future.done():
+                    future.set_result(vector)
+
+    def _embed_batch(self, texts: list[str], task_type: str) -> list[list[float]]:
+        self.requests += 1
+        self.batched_texts += len(texts)
+        # VertexAIEmbeddings.embed takes a task type, so queries keep their
+        # RETRIEVAL_QUERY embeddings even though they are sent as a batch.
+        embed = getattr(self.embeddings, "embed", None)
+        if callable(embed):
+            vectors = embed(texts, embeddings_task_type=task_type)
+        elif task_type == QUERY_TASK_TYPE:
+            vectors = [self.embeddings.embed_query(text) for text in texts]
+        else:
+            vectors = self.embeddings.embed_documents(texts)
+        if len(vectors) != len(texts):
+            raise ValueError(f"Embedding model returned {len(vectors)} vectors for {len(texts)} texts.")
+        return vectors
+
+    # --- Embeddings interface ---
+
+    def embed_query(self, text: str) -> list[float]:
+        """Embeds a query, batched together with concurrent queries."""
+        return self._submit_query(text).result(timeout=self.timeout_s)
+
+    async def aembed_query(self, text: str) -> list[float]:
+        # shield() so a timeout doesn't cancel a future other callers share.
+        return await asyncio.wait_for(asyncio.shield(asyncio.wrap_future(self._submit_query(text))), self.timeout_s)
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        """Embeds documents in batches of `max_batch_size`, skipping cached and repeated texts."""
+        keys = [_text_key(DOCUMENT_TASK_TYPE, text) for text in texts]
+        results: dict[str, list[float]] = {}
+        with self._lock:
+            for key in keys:
+                cached = self._cache_get(key)
+                if cached is not None:
+                    results[key] = cached
+        missing = list(dict.fromkeys((key, text) for key, text in zip(keys, texts) if key not in results))
+        for start in range(0, len(missing), self.max_batch_size):
+            batch = missing[start : start + self.max_batch_size]
+            vectors = self._embed_batch([text for _, text in batch], DOCUMENT_TASK_TYPE)
+            with self._lock:
+                for (key, _), vector in zip(batch, vectors):
+                    results[key] = vector
+                    self._cache_put(key, vector)
+        return [results[key] for key in keys]
+
+    async def aembed_documents(self, texts: list[str]) -> list[list[float]]:
+        return await asyncio.to_thread(self.embed_documents, texts)
+
+    def metrics(self) -> dict[str, Any]:
+        """Returns request, batching and cache counters."""
+        return {
+            "requests": self.requests,
+            "avg_batch_size": round(self.batched_texts / self.requests, 2) if self.requests else 0.0,
+            "cache_hits": self.cache_hits,
+            "dedup_hits": self.dedup_hits,
+            "cached_embeddings": len(self._cache),
+        }
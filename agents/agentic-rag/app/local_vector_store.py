@@ -0,0 +1,478 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""An in-process vector store for local development and load testing.
+
+It loads the same chunk records `ingest_data` writes to Vector Search
+(`question_id`, `chunk_id`, `text_chunk`, `embedding` and metadata columns)
+from JSONL or Parquet, and searches them with NumPy, either by brute force
+("flat") or through an inverted-file index ("ivf") that only scans the
+clusters closest to the query. A saved store is memory-mapped on load.
+
+Build a store and benchmark IVF recall and latency against brute force:
+
+    uv run python app/local_vector_store.py build --records chunks.jsonl --out .local_vector_store
+    uv run python app/local_vector_store.py benchmark --store .local_vector_store
+    uv run python app/local_vector_store.py benchmark --synthetic 50000
+"""
+
+import argparse
+import json
+import logging
+import time
+from collections.abc import Iterable, Iterator
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+logger = logging.getLogger(__name__)
+
+INDEX_FLAT = "flat"
+INDEX_IVF = "ivf"
+INDEX_TYPES = (INDEX_FLAT, INDEX_IVF)
+
+EMBEDDINGS_FILE = "embeddings.npy"
+RECORDS_FILE = "records.jsonl"
+IVF_FILE = "ivf.npz"
+CONFIG_FILE = "config.json"
+
+
+def _normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def _top_k(scores: np.ndarray, k: int) -> np.ndarray:
+    """Indices of the k highest scores, best first."""
+    k = min(k, scores.shape[0])
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    top = np.argpartition(-scores, k - 1)[:k]
+    return top[np.argsort(-scores[top])]
+
+
+def read_records(path: str | Path) -> Iterator[dict[str, Any]]:
+    """Reads chunk records from a JSONL or Parquet file (or a directory of them)."""
+    path = Path(path)
+    files = sorted(p for p in path.iterdir() if p.suffix in (".jsonl", ".parquet")) if path.is_dir() else [path]
+    for file in files:
+        if file.suffix == ".parquet":
+            import pandas as pd
+
+            for record in pd.read_parquet(file).to_dict(orient="records"):
+                yield record
+        else:
+            with file.open() as f:
+                for line in f:
+                    if line.strip():
+                        yield json.loads(line)
+
+
+def kmeans(vectors: np.ndarray, n_clusters: int, iterations: int = 10, sample_size: int = 50000, seed: int = 0) -> np.ndarray:
+    """Spherical k-means on unit vectors. Returns unit-norm centroids."""
+    rng = np.random.default_rng(seed)
+    n = vectors.shape[0]
+    sample = vectors[rng.choice(n, size=min(n, sample_size), replace=False)] if n > sample_size else np.asarray(vectors)
+    centroids = sample[rng.choice(sample.shape[0], size=n_clusters, replace=False)].copy()
+    for _ in range(iterations):
+        assignments = np.argmax(sample @ centroids.T, axis=1)
+        for cluster in range(n_clusters):
+            members = sample[assignments == cluster]
+            if members.shape[0]:
+                centroids[cluster] = members.sum(axis=0)
+            else:
+                # Re-seed empty clusters with a random point.
+                centroids[cluster] = sample[rng.integers(sample.shape[0])]
+        centroids = _normalize_rows(centroids)
+    return centroids
+
+
+class LocalVectorStore(VectorStore):
+    """A NumPy vector store with brute-force or IVF search, persisted to a directory.
+
+    Embeddings are kept L2-normalized, so scores are cosine similarities.
+
+    Args:
+        embedding: Embeddings used for text queries and `add_texts`.
+        index_type: "flat" for exact brute-force search, "ivf" for approximate
+            search over the `nprobe` nearest of `nlist` clusters.
+        nlist: Number of IVF clusters. Defaults to about sqrt(number of vectors).
+        nprobe: Number of IVF clusters scanned per query.
+    """
+
+    def __init__(
+        self,
+        embedding: Embeddings | None = None,
+        index_type: str = INDEX_FLAT,
+        nlist: int | None = None,
+        nprobe: int = 8,
+    ) -> None:
+        if index_type not in INDEX_TYPES:
+            raise ValueError(f"Unknown index type '{index_type}'. Supported types are: {INDEX_TYPES}")
+        self.embedding = embedding
+        self.index_type = index_type
+        self.nlist = nlist
+        self.nprobe = nprobe
+
+        self._vectors: np.ndarray = np.zeros((0, 0), dtype=np.float32)
+        # Rows are appended into a buffer with spare capacity, which grows
+        # geometrically; `_vectors` is a view of its filled rows.
+        self._buffer: np.ndarray | None = None
+        self._ids: list[str] = []
+        self._texts: list[str] = []
+        self._metadatas: list[dict[str, Any]] = []
+        self._positions: dict[str, int] = {}
+        # IVF index: rows sorted by cluster, and each cluster's slice of them.
+        self._centroids: np.ndarray | None = None
+        self._ivf_rows: np.ndarray | None = None
+        self._ivf_offsets: np.ndarray | None = None
+
+    def __len__(self) -> int:
+        return len(self._ids)
+
+    @property
+    def embeddings(self) -> Embeddings | None:
+        return self.embedding
+
+    # --- Writing ---
+
+    def add_texts_with_embeddings(
+        self,
+        texts: list[str],
+        embeddings: list[list[float]],
+        metadatas: list[dict[str, Any]] | None = None,
+        ids: list[str] | None = None,
+        is_complete_overwrite: bool = False,
+        **kwargs: Any,
+    ) -> list[str]:
+        """Adds precomputed embeddings, with the same signature as `VectorSearchVectorStore`.
+
+        Existing ids are overwritten. `is_complete_overwrite` is accepted for
+        compatibility; records are always upserted by id.
+        """
+        if not texts:
+            return []
+        ids = [str(i) for i in ids] if ids else [str(len(self._ids) + i) for i in range(len(texts))]
+        metadatas = metadatas or [{} for _ in texts]
+        new_vectors = _normalize_rows(np.asarray(embeddings, dtype=np.float32))
+        if self._vectors.size and new_vectors.shape[1] != self._vectors.shape[1]:
+            raise ValueError(f"Embeddings have {new_vectors.shape[1]} dimensions, the store holds {self._vectors.shape[1]}.")
+
+        new_rows = sum(1 for doc_id in set(ids) if doc_id not in self._positions)
+        self._reserve(len(self._ids) + new_rows, new_vectors.shape[1])
+        for i, doc_id in enumerate(ids):
+            position = self._positions.get(doc_id)
+            if position is None:
+                position = self._positions[doc_id] = len(self._ids)
+                self._ids.append(doc_id)
+                self._texts.append(texts[i])
+                self._metadatas.append(dict(metadatas[i]))
+            else:
+                self._texts[position] = texts[i]
+                self._metadatas[position] = dict(metadatas[i])
+            self._buffer[position] = new_vectors[i]
+        self._vectors = self._buffer[: len(self._ids)]
+        self._invalidate_index()
+        return ids
+
+    def _reserve(self, rows: int, dim: int) -> None:
+        """Makes the writable buffer hold at least `rows` rows, doubling its capacity as needed."""
+        if self._buffer is not None and self._buffer.shape[0] >= rows:
+            return
+        capacity = max(rows, 2 * (self._buffer.shape[0] if self._buffer is not None else 0), 1024)
+        buffer = np.empty((capacity, dim), dtype=np.float32)
+        if self._ids:
+            # Also copies a memory-mapped matrix into memory on the first write.
+            buffer[: len(self._ids)] = self._vectors
+        self._buffer = buffer
+
+    def add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: list[dict] | None = None,
+        ids: list[str] | None = None,
+        **kwargs: Any,
+    ) -> list[str]:
+        if self.embedding is None:
+            raise ValueError("add_texts needs an embedding model; use add_texts_with_embeddings instead.")
+        texts = list(texts)
+        return self.add_texts_with_embeddings(texts, self.embedding.embed_documents(texts), metadatas, ids)
+
+    def add_records(self, records: Iterable[dict[str, Any]], batch_size: int = 1000) -> int:
+        """Adds chunk records as produced for `ingest_data` (`text_chunk`, `embedding`, ids and metadata)."""
+        added = 0
+        batch: list[dict[str, Any]] = []
+        for record in records:
+            batch.append(record)
+            if len(batch) >= batch_size:
+                added += self._add_record_batch(batch)
+                batch = []
+        if batch:
+            added += self._add_record_batch(batch)
+        return added
+
+    def _add_record_batch(self, records: list[dict[str, Any]]) -> int:
+        ids = [str(record.get("chunk_id") or record.get("question_id")) for record in records]
+        texts = [record["text_chunk"] for record in records]
+        embeddings = [record["embedding"] for record in records]
+        metadatas = [
+            {key: value for key, value in record.items() if key not in ("embedding", "last_edit_date")}
+            for record in records
+        ]
+        self.add_texts_with_embeddings(texts, embeddings, metadatas, ids)
+        return len(records)
+
+    def delete(self, ids: list[str] | None = None, **kwargs: Any) -> bool | None:
+        if not ids:
+            return False
+        remove = {self._positions[str(doc_id)] for doc_id in ids if str(doc_id) in self._positions}
+        if not remove:
+            return False
+        keep = [i for i in range(len(self._ids)) if i not in remove]
+        self._vectors = np.asarray(self._vectors)[keep]
+        self._buffer = None
+        self._ids = [self._ids[i] for i in keep]
+        self._texts = [self._texts[i] for i in keep]
+        self._metadatas = [self._metadatas[i] for i in keep]
+        self._positions = {doc_id: i for i, doc_id in enumerate(self._ids)}
+        self._invalidate_index()
+        return True
+
+    # --- IVF index ---
+
+    def _invalidate_index(self) -> None:
+        self._centroids = self._ivf_rows = self._ivf_offsets = None
+
+    def build_index(self, seed: int = 0) -> None:
+        """Clusters the vectors for IVF search. Called lazily by the first IVF query."""
+        n = len(self._ids)
+        if not n:
+            return
+        nlist = max(1, min(self.nlist or int(np.sqrt(n)), n))
+        started = time.perf_counter()
+        self._centroids = kmeans(self._vectors, nlist, seed=seed)
+        assignments = np.argmax(self._vectors @ self._centroids.T, axis=1)
+        self._ivf_rows = np.argsort(assignments, kind="stable")
+        self._ivf_offsets = np.searchsorted(assignments[self._ivf_rows], np.arange(nlist + 1))
+        logger.info(f"Built IVF index with {nlist} lists over {n} vectors in {time.perf_counter() - started:.2f}s.")
+
+    def _candidates(self, query: np.ndarray) -> np.ndarray | None:
+        if self.index_type != INDEX_IVF:
+            return None
+        if self._centroids is None:
+            self.build_index()
+        lists = _top_k(self._centroids @ query, self.nprobe)
+        return np.concatenate([self._ivf_rows[self._ivf_offsets[c] : self._ivf_offsets[c + 1]] for c in lists])
+
+    # --- Search ---
+
+    def search_vector(self, embedding: list[float], k: int = 4) -> list[tuple[int, float]]:
+        """Returns (row, cosine similarity) pairs of the k nearest vectors."""
+        if not self._ids:
+            return []
+        query = _normalize_rows(np.asarray(embedding, dtype=np.float32))
+        candidates = self._candidates(query)
+        if candidates is None:
+            scores = self._vectors @ query
+            rows = _top_k(scores, k)
+            return [(int(row), float(scores[row])) for row in rows]
+        scores = self._vectors[candidates] @ query
+        top = _top_k(scores, k)
+        return [(int(candidates[i]), float(scores[i])) for i in top]
+
+    def _document(self, row: int) -> Document:
+        metadata = dict(self._metadatas[row])
+        metadata.setdefault("id", self._ids[row])
+        return Document(page_content=self._texts[row], metadata=metadata)
+
+    def similarity_search_by_vector_with_score(self, embedding: list[float], k: int = 4, **kwargs: Any) -> list[tuple[Document, float]]:
+        return [(self._document(row), score) for row, score in self.search_vector(embedding, k)]
+
+    def similarity_search_by_vector(self, embedding: list[float], k: int = 4, **kwargs: Any) -> list[Document]:
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k)]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> list[tuple[Document, float]]:
+        if self.embedding is None:
+            raise ValueError("Text queries need an embedding model.")
+        return self.similarity_search_by_vector_with_score(self.embedding.embed_query(query), k)
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> list[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k)]
+
+    def _select_relevance_score_fn(self) -> Any:
+        # Cosine similarity in [-1, 1] to a relevance score in [0, 1].
+        return lambda score: (score + 1) / 2
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: list[str],
+        embedding: Embeddings,
+        metadatas: list[dict] | None = None,
+        ids: list[str] | None = None,
+        **kwargs: Any,
+    ) -> "LocalVectorStore":
+        store = cls(embedding=embedding, **kwargs)
+        store.add_texts(texts, metadatas, ids)
+        return store
+
+    # --- Persistence ---
+
+    def save(self, path: str | Path) -> None:
+        """Writes the store (and its IVF index, if built) to a directory."""
+        path = Path(path)
+        path.mkdir(parents=True, exist_ok=True)
+        np.save(path / EMBEDDINGS_FILE, np.asarray(self._vectors))
+        with (path / RECORDS_FILE).open("w") as f:
+            for doc_id, text, metadata in zip(self._ids, self._texts, self._metadatas):
+                f.write(json.dumps({"id": doc_id, "text": text, "metadata": metadata}, default=str) + "\n")
+        if self.index_type == INDEX_IVF:
+            if self._centroids is None:
+                self.build_index()
+            if self._centroids is not None:
+                np.savez(path / IVF_FILE, centroids=self._centroids, rows=self._ivf_rows, offsets=self._ivf_offsets)
+        (path / CONFIG_FILE).write_text(json.dumps({"index_type": self.index_type, "nlist": self.nlist, "nprobe": self.nprobe}))
+        logger.info(f"Saved {len(self)} vectors to {path}.")
+
+    @classmethod
+    def load(
+        cls,
+        path: str | Path,
+        embedding: Embeddings | None = None,
+        index_type: str | None = None,
+        nprobe: int | None = None,
+        mmap: bool = True,
+    ) -> "LocalVectorStore":
+        """Loads a saved store. The embedding matrix is memory-mapped unless `mmap` is False."""
+        path = Path(path)
+        config = json.loads((path / CONFIG_FILE).read_text()) if (path / CONFIG_FILE).exists() else {}
+        store = cls(
+            embedding=embedding,
+            index_type=index_type or config.get("index_type", INDEX_FLAT),
+            nlist=config.get("nlist"),
+            nprobe=nprobe or config.get("nprobe", 8),
+        )
+        store._vectors = np.load(path / EMBEDDINGS_FILE, mmap_mode="r" if mmap else None)
+        with (path / RECORDS_FILE).open() as f:
+            for line in f:
+                record = json.loads(line)
+                store._positions[record["id"]] = len(store._ids)
+                store._ids.append(record["id"])
+                store._texts.append(record["text"])
+                store._metadatas.append(record["metadata"])
+        if store.index_type == INDEX_IVF and (path / IVF_FILE).exists():
+            ivf = np.load(path / IVF_FILE)
+            store._centroids, store._ivf_rows, store._ivf_offsets = ivf["centroids"], ivf["rows"], ivf["offsets"]
+        logger.info(f"Loaded {len(store)} vectors from {path} ({store.index_type} index).")
+        return store
+
+
+# --- Benchmark ---
+
+
+def _synthetic_vectors(n: int, dim: int, clusters: int, seed: int) -> np.ndarray:
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dim))
+    return _normalize_rows(centers[rng.integers(clusters, size=n)] + 0.5 * rng.normal(size=(n, dim)))
+
+
+def benchmark(
+    store: LocalVectorStore,
+    queries: np.ndarray,
+    k: int = 10,
+    nprobes: Iterable[int] = (1, 4, 8, 16, 32),
+) -> list[dict[str, Any]]:
+    """Measures recall@k and per-query latency of IVF search against brute force."""
+    index_type = store.index_type
+    results = []
+    try:
+        store.index_type = INDEX_FLAT
+        exact = []
+        started = time.perf_counter()
+        for query in queries:
+            exact.append({row for row, _ in store.search_vector(query, k)})
+        elapsed = time.perf_counter() - started
+        results.append({"index": INDEX_FLAT, "nprobe": None, "recall": 1.0, "ms_per_query": 1000 * elapsed / len(queries)})
+
+        store.index_type = INDEX_IVF
+        if store._centroids is None:
+            store.build_index()
+        for nprobe in nprobes:
+            store.nprobe = nprobe
+            hits = 0
+            started = time.perf_counter()
+            for query, truth in zip(queries, exact):
+                hits += len(truth & {row for row, _ in store.search_vector(query, k)})
+            elapsed = time.perf_counter() - started
+            results.append({
+                "index": INDEX_IVF,
+                "nprobe": nprobe,
+                "recall": hits / sum(len(truth) for truth in exact),
+                "ms_per_query": 1000 * elapsed / len(queries),
+            })
+    finally:
+        store.index_type = index_type
+    return results
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Build or benchmark a local vector store.")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    build = subparsers.add_parser("build", help="Build a store from ingestion records (JSONL or Parquet).")
+    build.add_argument("--records", required=True, help="Records file or directory.")
+    build.add_argument("--out", required=True, help="Directory to write the store to.")
+    build.add_argument("--index", choices=INDEX_TYPES, default=INDEX_IVF)
+    build.add_argument("--nlist", type=int, default=None)
+
+    bench = subparsers.add_parser("benchmark", help="Compare IVF recall and latency with brute force.")
+    bench.add_argument("--store", help="A saved store to benchmark. Queries are sampled from its vectors.")
+    bench.add_argument("--synthetic", type=int, default=20000, help="Synthetic vectors to use when no store is given.")
+    bench.add_argument("--dim", type=int, default=256)
+    bench.add_argument("--queries", type=int, default=200)
+    bench.add_argument("--k", type=int, default=10)
+    bench.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    if args.command == "build":
+        store = LocalVectorStore(index_type=args.index, nlist=args.nlist)
+        added = store.add_records(read_records(args.records))
+        store.save(args.out)
+        print(f"Built a {args.index} store with {added} records in {args.out}")
+        return
+
+    if args.store:
+        store = LocalVectorStore.load(args.store, index_type=INDEX_IVF)
+    else:
+        vectors = _synthetic_vectors(args.synthetic, args.dim, clusters=max(8, args.synthetic // 500), seed=args.seed)
+        store = LocalVectorStore(index_type=INDEX_IVF)
+        store.add_texts_with_embeddings([""] * len(vectors), vectors)
+    rng = np.random.default_rng(args.seed + 1)
+    base = np.asarray(store._vectors[rng.choice(len(store), size=min(args.queries, len(store)), replace=False)])
+    queries = _normalize_rows(base + 0.1 * rng.normal(size=base.shape))
+
+    print(f"--- {len(store)} vectors, {queries.shape[0]} queries, recall@{args.k} ---")
+    for result in benchmark(store, queries, k=args.k):
+        nprobe = "" if result["nprobe"] is None else f"nprobe={result['nprobe']}"
+        print(f"  {result['index']:<5} {nprobe:<11} recall={result['recall']:.3f}  {result['ms_per_query']:.3f} ms/query")
+
+
+if __name__ == "__main__":
+    main()
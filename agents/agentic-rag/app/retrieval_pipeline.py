@@ -0,0 +1,253 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import hashlib
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from dataclasses import dataclass, field
+from typing import Any
+
+from langchain_core.documents import Document
+
+logger = logging.getLogger(__name__)
+
+
+def document_key(doc: Document) -> str:
+    """Identifies a document across sources: its "id" metadata, else a hash of its content."""
+    doc_id = doc.metadata.get("id") if doc.metadata else None
+    if doc_id:
+        return str(doc_id)
+    return hashlib.sha256(doc.page_content.encode("utf-8")).hexdigest()
+
+
+def reciprocal_rank_fusion(
+    ranked_lists: dict[str, list[Document]], k: int = 60
+) -> list[tuple[Document, float]]:
+    """Merges ranked lists with reciprocal-rank fusion.
+
+    Each document scores sum(1 / (k + rank)) over the lists it appears in
+    (rank starting at 1), which needs no comparable scores across sources.
+
+    Args:
+        ranked_lists: The ranked documents of each source, by source name.
+        k: Damping constant; 60 is the usual choice.
+
+    Returns:
+        The fused (document, score) pairs, best first.
+    """
+    scores: dict[str, float] = {}
+    docs: dict[str, Document] = {}
+    for source_docs in ranked_lists.values():
+        for rank, doc in enumerate(source_docs, start=1):
+            key = document_key(doc)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (k + rank)
+            docs.setdefault(key, doc)
+    return sorted(((docs[key], score) for key, score in scores.items()), key=lambda item: item[1], reverse=True)
+
+
+@dataclass
+class RetrievalResult:
+    """The documents returned by a `RetrievalPipeline` run and how they were produced.
+
+    A result is `degraded` when a source failed or missed its deadline, or
+    when re-ranking was attempted and did not finish. Degraded results are
+    usable but should not be cached.
+    """
+
+    docs: list[Document]
+    sources: list[str] = field(default_factory=list)
+    skipped_sources: list[str] = field(default_factory=list)
+    reranked: bool = False
+    rerank_failed: bool = False
+    timings: dict[str, float] = field(default_factory=dict)
+
+    @property
+    def degraded(self) -> bool:
+        return bool(self.skipped_sources) or self.rerank_failed
+
+
+class RetrievalPipeline:
+    """Retrieves from several sources concurrently, fuses and re-ranks the results.
+
+    1. Retrieve: the query is sent to every source at once, each on its own
+       thread of the run. Sources that fail or miss the `retrieval_budget_s`
+       deadline are left out and the result is marked degraded; the run
+       fails if no source answers.
+    2. Fuse: results are merged with reciprocal-rank fusion.
+    3. Re-rank: the fused candidates are re-ranked by `compressor` (e.g.
+       Vertex AI Rank) within `rerank_budget_s`, on a thread of its own. On
+       timeout or error the fused order is kept and the result is degraded.
+       Re-ranking is skipped when there is a single candidate, or when
+       `skip_rerank_margin` is set, a single source answered with similarity
+       scores, and the score of the last kept document beats the next one by
+       at least that relative margin. Fused scores only depend on ranks, so
+       they can't tell a clear cut-off from a close one.
+
+    Sources that expose a vector store are searched with a precomputed query
+    embedding when one is passed to `run`, which also returns the store's
+    similarity scores (higher is more similar, as with the DOT_PRODUCT
+    indexes of this app). For the margin to ever apply, such a source must
+    return more than `top_n` documents.
+
+    Args:
+        sources: Retrievers by name, e.g. {"vector_search": ..., "vertex_ai_search": ...}.
+        compressor: The re-ranker, or None to return the fused order.
+        top_n: Number of documents returned.
+        rrf_k: Reciprocal-rank fusion constant.
+        retrieval_budget_s: Deadline for the retrieve stage.
+        rerank_budget_s: Deadline for the re-rank stage.
+        skip_rerank_margin: Relative similarity gap above which re-ranking is skipped.
+    """
+
+    def __init__(
+        self,
+        sources: dict[str, Any],
+        compressor: Any | None = None,
+        top_n: int = 5,
+        rrf_k: int = 60,
+        retrieval_budget_s: float = 2.0,
+        rerank_budget_s: float = 1.5,
+        skip_rerank_margin: float | None = None,
+    ) -> None:
+        if not sources:
+            raise ValueError("RetrievalPipeline needs at least one source.")
+        self.sources = sources
+        self.compressor = compressor
+        self.top_n = top_n
+        self.rrf_k = rrf_k
+        self.retrieval_budget_s = retrieval_budget_s
+        self.rerank_budget_s = rerank_budget_s
+        self.skip_rerank_margin = skip_rerank_margin
+
+    @staticmethod
+    def _invoke_source(
+        retriever: Any, query: str, query_embedding: list[float] | None
+    ) -> tuple[list[Document], list[float] | None]:
+        """Returns a source's documents, with their similarity scores when the source has them."""
+        vectorstore = getattr(retriever, "vectorstore", None)
+        if query_embedding is not None and getattr(retriever, "search_type", "similarity") == "similarity":
+            search_kwargs = retriever.search_kwargs or {}
+            if hasattr(vectorstore, "similarity_search_by_vector_with_score"):
+                scored = vectorstore.similarity_search_by_vector_with_score(query_embedding, **search_kwargs)
+                return [doc for doc, _ in scored], [float(score) for _, score in scored]
+            if hasattr(vectorstore, "similarity_search_by_vector"):
+                return vectorstore.similarity_search_by_vector(query_embedding, **search_kwargs), None
+        return retriever.invoke(query), None
+
+    def _retrieve(
+        self, query: str, query_embedding: list[float] | None
+    ) -> tuple[dict[str, list[Document]], dict[str, list[float] | None], list[str]]:
+        # A pool per run, with a thread per source, so under concurrent runs no
+        # source call queues behind another run's and eats into the budget.
+        # Threads of sources that miss the deadline finish in the background.
+        executor = ThreadPoolExecutor(max_workers=len(self.sources), thread_name_prefix="retrieval")
+        try:
+            futures = {
+                executor.submit(self._invoke_source, retriever, query, query_embedding): name
+                for name, retriever in self.sources.items()
+            }
+            _, not_done = wait(futures, timeout=self.retrieval_budget_s)
+        finally:
+            executor.shutdown(wait=False)
+
+        results: dict[str, list[Document]] = {}
+        scores: dict[str, list[float] | None] = {}
+        skipped = []
+        errors = []
+        for future, name in futures.items():
+            if future in not_done:
+                skipped.append(name)
+                logger.warning(f"Retrieval source '{name}' missed the {self.retrieval_budget_s}s budget and was skipped.")
+            elif future.exception() is not None:
+                skipped.append(name)
+                errors.append(future.exception())
+                logger.warning(f"Retrieval source '{name}' failed and was skipped: {future.exception()}")
+            else:
+                results[name], scores[name] = future.result()
+        if not results:
+            if errors:
+                raise errors[0]
+            raise TimeoutError(f"No retrieval source answered within {self.retrieval_budget_s}s.")
+        return results, scores, skipped
+
+    def _rerank(self, query: str, candidates: list[Document]) -> list[Document]:
+        # The re-ranker gets its own thread, so it never waits behind a source.
+        executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="rerank")
+        try:
+            future = executor.submit(self.compressor.compress_documents, documents=candidates, query=query)
+            return list(future.result(timeout=self.rerank_budget_s))
+        finally:
+            executor.shutdown(wait=False)
+
+    def _decisive(self, fused: list[tuple[Document, float]], scores: dict[str, list[float] | None]) -> bool:
+        if len(fused) <= 1:
+            return True
+        if self.skip_rerank_margin is None or len(fused) <= self.top_n:
+            return False
+        # Similarity scores are only comparable within a source, and with a
+        # single source the fused order is that source's order.
+        if len(scores) != 1:
+            return False
+        source_scores = next(iter(scores.values()))
+        if source_scores is None or len(source_scores) <= self.top_n:
+            return False
+        last_kept, first_dropped = source_scores[self.top_n - 1], source_scores[self.top_n]
+        if last_kept <= 0:
+            return False
+        return (last_kept - first_dropped) / last_kept >= self.skip_rerank_margin
+
+    def run(self, query: str, query_embedding: list[float] | None = None) -> RetrievalResult:
+        """Runs the pipeline for a query."""
+        timings: dict[str, float] = {}
+        started = time.perf_counter()
+        ranked_lists, scores, skipped = self._retrieve(query, query_embedding)
+        timings["retrieve"] = time.perf_counter() - started
+
+        stage_started = time.perf_counter()
+        fused = reciprocal_rank_fusion(ranked_lists, k=self.rrf_k)
+        # Annotate copies: the sources' documents may be shared with a vector
+        # store or a cache.
+        candidates = [
+            doc.model_copy(update={"metadata": {**(doc.metadata or {}), "rrf_score": score}}) for doc, score in fused
+        ]
+        timings["fuse"] = time.perf_counter() - stage_started
+
+        result = RetrievalResult(
+            docs=candidates[: self.top_n], sources=list(ranked_lists), skipped_sources=skipped, timings=timings
+        )
+        if self.compressor is not None and candidates and not self._decisive(fused, scores):
+            stage_started = time.perf_counter()
+            try:
+                result.docs = self._rerank(query, candidates)[: self.top_n]
+                result.reranked = True
+            except FutureTimeoutError:
+                result.rerank_failed = True
+                logger.warning(f"Re-ranking missed the {self.rerank_budget_s}s budget. Using the fused order.")
+            except Exception as e:
+                result.rerank_failed = True
+                logger.warning(f"Re-ranking failed, using the fused order: {e}")
+            timings["rerank"] = time.perf_counter() - stage_started
+
+        timings["total"] = time.perf_counter() - started
+        logger.debug(
+            f"Retrieval pipeline timings: {timings}, sources: {result.sources}, reranked: {result.reranked}, "
+            f"degraded: {result.degraded}"
+        )
+        return result
+
+    def invoke(self, query: str) -> list[Document]:
+        """Returns the final documents for a query."""
+        return self.run(query).docs
@@ -18,11 +18,34 @@ import os
 
 from unittest.mock import MagicMock
 from langchain_google_community.vertex_rank import VertexAIRank
-from langchain_google_vertexai import VertexAIEmbeddings
+from langchain_core.embeddings import Embeddings
 from google.cloud import aiplatform
 from langchain_google_vertexai import VectorSearchVectorStore
+from langchain_google_community import VertexAISearchRetriever
 from langchain_core.vectorstores import VectorStoreRetriever
 
+# "vertex" (Vertex AI Vector Search) or "local" (app.local_vector_store).
+VECTOR_STORE_BACKEND = os.getenv("VECTOR_STORE_BACKEND", "vertex")
+LOCAL_VECTOR_STORE_PATH = os.getenv("LOCAL_VECTOR_STORE_PATH", ".local_vector_store")
+LOCAL_VECTOR_STORE_INDEX = os.getenv("LOCAL_VECTOR_STORE_INDEX", "")
+LOCAL_VECTOR_STORE_NPROBE = int(os.getenv("LOCAL_VECTOR_STORE_NPROBE", "8"))
+
+
+def get_local_retriever(embedding: Embeddings, path: str = LOCAL_VECTOR_STORE_PATH) -> VectorStoreRetriever:
+    """
+    Creates a retriever over an in-process vector store built from the
+    ingestion records (see app/local_vector_store.py), for local development
+    and load testing without Vector Search.
+    """
+    from app.local_vector_store import LocalVectorStore
+
+    return LocalVectorStore.load(
+        path,
+        embedding=embedding,
+        index_type=LOCAL_VECTOR_STORE_INDEX or None,
+        nprobe=LOCAL_VECTOR_STORE_NPROBE,
+    ).as_retriever()
+
 
 def get_retriever(
     project_id: str,
@@ -30,11 +53,15 @@ def get_retriever(
     vector_search_bucket: str,
     vector_search_index: str,
     vector_search_index_endpoint: str,
-    embedding: VertexAIEmbeddings,
+    embedding: Embeddings,
 ) -> VectorStoreRetriever:
     """
     Creates and returns an instance of the retriever service.
+    `embedding` can be a `VertexAIEmbeddings` or an `app.embeddings.BatchingEmbeddings` wrapping one.
+    Set VECTOR_STORE_BACKEND=local to search a local vector store instead.
     """
+    if VECTOR_STORE_BACKEND == "local":
+        return get_local_retriever(embedding)
     try:
         aiplatform.init(
             project=project_id,
@@ -68,6 +95,27 @@ def get_retriever(
         return retriever
 
 
+def get_vertex_ai_search_retriever(
+    project_id: str, location_id: str, data_store_id: str
+) -> VertexAISearchRetriever:
+    """
+    Creates and returns a Vertex AI Search retriever, used as an additional
+    source of the retrieval pipeline.
+    """
+    try:
+        return VertexAISearchRetriever(
+            project_id=project_id,
+            location_id=location_id,
+            data_store_id=data_store_id,
+            get_extractive_answers=True,
+            max_documents=5,
+        )
+    except Exception:
+        retriever = MagicMock()
+        retriever.invoke = lambda x: []
+        return retriever
+
+
 def get_compressor(project_id: str, top_n: int = 5) -> VertexAIRank:
     """
     Creates and returns an instance of the compressor service.
@@ -0,0 +1,222 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import logging
+import threading
+import time
+from collections.abc import Callable, Sequence
+from typing import Any
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+def _normalize_text(query: str) -> str:
+    return " ".join(query.casefold().split())
+
+
+class SemanticCache:
+    """An in-process cache of ranked retrieval results keyed by query embedding.
+
+    Query embeddings are L2-normalized and kept in one preallocated NumPy
+    matrix, so a lookup is a single matrix-vector product. A lookup hits when
+    the best cosine similarity reaches `threshold`, which lets paraphrased
+    repeats of a question reuse the earlier ranked documents. Entries expire
+    after `ttl_seconds`; when the cache is full, expired entries are evicted
+    first, then the least recently used one.
+
+    Args:
+        threshold: Minimum cosine similarity for a hit.
+        ttl_seconds: How long an entry can be served.
+        max_entries: Maximum number of cached queries.
+        clock: Time source, injectable for tests.
+    """
+
+    def __init__(
+        self,
+        threshold: float = 0.95,
+        ttl_seconds: float = 3600,
+        max_entries: int = 1024,
+        clock: Callable[[], float] = time.monotonic,
+    ) -> None:
+        if not 0 < threshold <= 1:
+            raise ValueError("threshold must be in (0, 1].")
+        if max_entries < 1:
+            raise ValueError("max_entries must be at least 1.")
+        self.threshold = threshold
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.clock = clock
+
+        self._vectors: np.ndarray | None = None
+        self._values: list[Any] = [None] * max_entries
+        self._texts: list[str | None] = [None] * max_entries
+        self._created = np.zeros(max_entries)
+        self._last_used = np.zeros(max_entries)
+        self._occupied = np.zeros(max_entries, dtype=bool)
+        self._by_text: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return int(self._occupied.sum())
+
+    def _expired(self, now: float) -> np.ndarray:
+        return self._occupied & (now - self._created > self.ttl_seconds)
+
+    def _free(self, slots: np.ndarray) -> None:
+        for slot in np.flatnonzero(slots):
+            text = self._texts[slot]
+            if text is not None and self._by_text.get(text) == slot:
+                del self._by_text[text]
+            self._values[slot] = None
+            self._texts[slot] = None
+            self._occupied[slot] = False
+            self.evictions += 1
+
+    def get_by_text(self, query: str) -> Any | None:
+        """Returns the cached value for a query seen before verbatim, skipping the embedding call."""
+        with self._lock:
+            slot = self._by_text.get(_normalize_text(query))
+            if slot is None:
+                return None
+            now = self.clock()
+            if now - self._created[slot] > self.ttl_seconds:
+                return None
+            self._last_used[slot] = now
+            self.hits += 1
+            return self._values[slot]
+
+    def get(self, embedding: Sequence[float]) -> Any | None:
+        """Returns the cached value of the most similar query, or None on a miss."""
+        vector = self._unit(embedding)
+        with self._lock:
+            now = self.clock()
+            live = self._occupied & ~self._expired(now)
+            if self._vectors is None or not live.any():
+                self.misses += 1
+                return None
+            similarities = np.where(live, self._vectors @ vector, -np.inf)
+            slot = int(np.argmax(similarities))
+            if similarities[slot] < self.threshold:
+                self.misses += 1
+                return None
+            self._last_used[slot] = now
+            self.hits += 1
+            logger.debug(f"Semantic cache hit (similarity {similarities[slot]:.3f}).")
+            return self._values[slot]
+
+    def put(self, query: str, embedding: Sequence[float], value: Any) -> None:
+        """Caches a value for a query and its embedding."""
+        vector = self._unit(embedding)
+        with self._lock:
+            now = self.clock()
+            if self._vectors is None:
+                self._vectors = np.zeros((self.max_entries, vector.shape[0]), dtype=np.float32)
+            elif vector.shape[0] != self._vectors.shape[1]:
+                raise ValueError(
+                    f"Embedding has {vector.shape[0]} dimensions, the cache holds {self._vectors.shape[1]}."
+                )
+
+            self._free(self._expired(now))
+            free_slots = np.flatnonzero(~self._occupied)
+            if free_slots.size:
+                slot = int(free_slots[0])
+            else:
+                slot = int(np.argmin(self._last_used))
+                self._free(np.arange(self.max_entries) == slot)
+
+            text = _normalize_text(query)
+            self._vectors[slot] = vector
+            self._values[slot] = value
+            self._texts[slot] = text
+            self._created[slot] = now
+            self._last_used[slot] = now
+            self._occupied[slot] = True
+            self._by_text[text] = slot
+
+    def clear(self) -> None:
+        with self._lock:
+            self._free(self._occupied.copy())
+
+    @staticmethod
+    def _unit(embedding: Sequence[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def metrics(self) -> dict[str, Any]:
+        """Returns hit/miss counters and the hit rate."""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self),
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+class CachedRetrieval:
+    """Runs a retrieval pipeline, serving repeat questions from a `SemanticCache`.
+
+    On a miss, the query embedding computed for the cache lookup is passed on
+    to the pipeline, which reuses it for vector search, so a miss costs no
+    extra embedding call. Only complete results are cached: empty or degraded
+    ones (a source or the re-ranker did not answer) are returned uncached, so
+    the next ask retries them.
+
+    Args:
+        pipeline: The `RetrievalPipeline` that retrieves and re-ranks documents.
+        embedding: The embeddings used for cache keys; should match the retriever's.
+        cache: The cache to use, or None to always retrieve.
+        log_every: Log the cache metrics every this many lookups.
+    """
+
+    def __init__(
+        self,
+        pipeline: Any,
+        embedding: Any,
+        cache: SemanticCache | None = None,
+        log_every: int = 100,
+    ) -> None:
+        self.pipeline = pipeline
+        self.embedding = embedding
+        self.cache = cache
+        self.log_every = log_every
+        self._lookups = 0
+
+    def invoke(self, query: str) -> list[Any]:
+        """Returns the ranked documents for a query."""
+        if self.cache is None:
+            return self.pipeline.invoke(query)
+
+        ranked_docs = self.cache.get_by_text(query)
+        if ranked_docs is None:
+            query_embedding = self.embedding.embed_query(query)
+            ranked_docs = self.cache.get(query_embedding)
+            if ranked_docs is None:
+                result = self.pipeline.run(query, query_embedding)
+                ranked_docs = result.docs
+                if ranked_docs and not result.degraded:
+                    self.cache.put(query, query_embedding, ranked_docs)
+
+        self._lookups += 1
+        if self.log_every and self._lookups % self.log_every == 0:
+            logger.info(f"Semantic cache metrics: {self.cache.metrics()}")
+        return ranked_docs
@@ -0,0 +1,115 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmarks PDF parsing and chunking in document_ingestion.
+
+Scales the bundled test_data/AliceInWonderland.pdf up to --pages pages by
+repeating it, then parses and chunks it with different numbers of worker
+processes. Reports pages/s, chunks/s and the peak resident memory of the
+parent process (Linux only; tracemalloc would also slow down the forked
+workers).
+
+Run from data_ingestion/:
+
+    uv run --extra local python benchmarks/document_ingestion_benchmark.py --pages 5000 --workers 1 4 8
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from data_ingestion_pipeline.document_ingestion import ingest_documents  # noqa: E402
+
+BUNDLED_PDF = Path(__file__).resolve().parents[4] / "test_data" / "AliceInWonderland.pdf"
+
+
+def scale_pdf(source: Path, pages: int, out: Path) -> int:
+    """Writes a PDF of at least `pages` pages by repeating `source`. Returns its page count."""
+    from pypdf import PdfReader, PdfWriter
+
+    reader = PdfReader(source)
+    writer = PdfWriter()
+    while len(writer.pages) < pages:
+        for page in reader.pages:
+            writer.add_page(page)
+    with out.open("wb") as f:
+        writer.write(f)
+    return len(writer.pages)
+
+
+def _rss_mb() -> float | None:
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE") / 2**20
+    except OSError:
+        return None
+
+
+class PeakMemory:
+    """Samples the resident memory of this process in a background thread."""
+
+    def __init__(self, interval: float = 0.05) -> None:
+        self.interval = interval
+        self.peak_mb = _rss_mb()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._sample, daemon=True)
+
+    def _sample(self) -> None:
+        while not self._stop.wait(self.interval):
+            rss = _rss_mb()
+            if rss is not None:
+                self.peak_mb = max(self.peak_mb or 0.0, rss)
+
+    def __enter__(self) -> "PeakMemory":
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._stop.set()
+        self._thread.join()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pdf", type=Path, default=BUNDLED_PDF)
+    parser.add_argument("--pages", type=int, default=2000)
+    parser.add_argument("--pages-per-task", type=int, default=16)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, os.cpu_count() or 1])
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        pdf = Path(tmp) / "scaled.pdf"
+        num_pages = scale_pdf(args.pdf, args.pages, pdf)
+        print(f"{pdf.stat().st_size / 2**20:.1f} MB PDF with {num_pages} pages")
+        print(f"{'workers':<10}{'seconds':>10}{'pages/s':>10}{'chunks/s':>10}{'chunks':>10}{'peak RSS MB':>12}")
+        for workers in args.workers:
+            started = time.perf_counter()
+            pages = chunks = 0
+            with PeakMemory() as memory:
+                for records, task in ingest_documents(str(pdf), workers=workers, pages_per_task=args.pages_per_task):
+                    pages += task["pages"]
+                    chunks += len(records)
+            seconds = time.perf_counter() - started
+            peak = "n/a" if memory.peak_mb is None else f"{memory.peak_mb:.1f}"
+            print(f"{workers:<10}{seconds:>10.2f}{pages / seconds:>10.0f}{chunks / seconds:>10.0f}{chunks:>10}{peak:>12}")
+
+
+if __name__ == "__main__":
+    main()
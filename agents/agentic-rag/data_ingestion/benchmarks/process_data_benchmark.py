@@ -0,0 +1,127 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Benchmarks the markdown conversion and chunking stage of process_data.
+
+Runs the component's own transform helpers on synthetic StackOverflow-like
+rows, comparing the old approach (materialize every row, then transform in
+one process) with streaming pages through a process pool. Reports
+questions/s, chunks/s and the peak memory allocated in the parent process.
+
+Run from data_ingestion/:
+
+    uv run --extra local python benchmarks/process_data_benchmark.py --questions 20000 --workers 1 4 8
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+
+from data_ingestion_pipeline.components import process_data_helpers as helpers  # noqa: E402
+
+WORDS = "python list dict import function class error value loop thread pandas numpy".split()
+
+
+def _paragraph(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words))
+
+
+def _html(rng: random.Random, paragraphs: int) -> str:
+    parts = []
+    for _ in range(paragraphs):
+        parts.append(f"<p>{_paragraph(rng, rng.randint(20, 80))} <code>{rng.choice(WORDS)}()</code></p>")
+        if rng.random() < 0.3:
+            parts.append(f"<pre><code>{_paragraph(rng, 15)}\n{_paragraph(rng, 15)}</code></pre>")
+    return "".join(parts)
+
+
+def synthetic_pages(questions: int, page_size: int, seed: int = 0):
+    """Yields pages of rows shaped like the component's BigQuery query results."""
+    rng = random.Random(seed)
+    start = datetime(2020, 1, 1)
+    page = []
+    for question_id in range(questions):
+        page.append(
+            {
+                "creation_date": start,
+                "last_edit_date": start + timedelta(minutes=question_id),
+                "question_id": question_id,
+                "question_title": _paragraph(rng, 8),
+                "question_text": _html(rng, rng.randint(1, 4)),
+                "answers": [{"body": _html(rng, rng.randint(1, 5))} for _ in range(rng.randint(0, 4))],
+            }
+        )
+        if len(page) == page_size:
+            yield page
+            page = []
+    if page:
+        yield page
+
+
+def _measure(name: str, questions: int, run) -> dict:
+    tracemalloc.start()
+    started = time.perf_counter()
+    chunks = run()
+    elapsed = time.perf_counter() - started
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {
+        "mode": name,
+        "seconds": elapsed,
+        "questions_per_s": questions / elapsed,
+        "chunks_per_s": chunks / elapsed,
+        "chunks": chunks,
+        "peak_mb": peak / 2**20,
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--questions", type=int, default=5000)
+    parser.add_argument("--page-size", type=int, default=500)
+    parser.add_argument("--chunk-size", type=int, default=1500)
+    parser.add_argument("--chunk-overlap", type=int, default=20)
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, os.cpu_count() or 1])
+    args = parser.parse_args()
+
+    split_args = (args.chunk_size, args.chunk_overlap)
+
+    def materialized() -> int:
+        rows = [row for page in synthetic_pages(args.questions, args.page_size) for row in page]
+        return len(helpers.transform_page(rows, *split_args))
+
+    def streamed(workers: int) -> int:
+        pages = synthetic_pages(args.questions, args.page_size)
+        return sum(len(chunks) for chunks in helpers.stream_transform(pages, helpers.transform_page, workers, *split_args))
+
+    results = [_measure("materialized", args.questions, materialized)]
+    for workers in args.workers:
+        results.append(_measure(f"streamed, {workers} worker(s)", args.questions, lambda: streamed(workers)))
+
+    print(f"{'mode':<26}{'seconds':>10}{'questions/s':>14}{'chunks/s':>12}{'chunks':>10}{'peak MB':>10}")
+    for r in results:
+        print(
+            f"{r['mode']:<26}{r['seconds']:>10.2f}{r['questions_per_s']:>14.0f}"
+            f"{r['chunks_per_s']:>12.0f}{r['chunks']:>10}{r['peak_mb']:>10.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -27,22 +27,54 @@ def ingest_data(
     vector_search_index: str,
     vector_search_index_endpoint: str,
     vector_search_data_bucket_name: str,
-    schedule_time: str,
     ingestion_batch_size: int,
     input_table: Input[BQTable],
     is_incremental: bool = True,
-    look_back_days: int = 1,
+    manifest_table: str = "",
+    upload_concurrency: int = 4,
+    upload_max_retries: int = 5,
 ) -> None:
-    """Process and ingest documents into Vertex AI Vector Search.
+    """Sync the chunks of the input table into Vertex AI Vector Search.
+
+    A manifest table records the chunk_id and content_hash of every chunk in
+    the index. Each run diffs the input table against it: new or modified
+    chunks are upserted by chunk_id, chunks that are no longer in the input
+    table are deleted, and the manifest is then replaced by the current state.
+    A failed run leaves the manifest untouched, so the next run retries the
+    same delta.
+
+    Indexes built before the manifest existed hold one datapoint per question,
+    keyed by the bare question_id. While the manifest is missing or empty,
+    those legacy ids are deleted too, once the chunks replacing them have been
+    upserted.
+
+    Changed chunks are read from BigQuery as Arrow record batches. While up to
+    `upload_concurrency` batches upload, the next one is converted, and failed
+    uploads are retried with exponential backoff.
 
     Args:
         project_id: Google Cloud project ID
+        location: Google Cloud region
+        vector_search_index: Vector Search index resource name
+        vector_search_index_endpoint: Vector Search index endpoint resource name
+        vector_search_data_bucket_name: Bucket backing the vector store
+        ingestion_batch_size: Chunks per upsert request
+        input_table: Deduplicated chunk table produced by process_data
+        is_incremental: Whether to upsert only the delta; otherwise every chunk is upserted
+        manifest_table: Manifest table name (defaults to "<input table>_index_manifest")
+        upload_concurrency: Batches uploaded concurrently
+        upload_max_retries: Retries of a failed batch upload
     """
     import logging
-    from datetime import datetime, timedelta
+    import threading
+    import time
+    from collections import deque
+    from concurrent.futures import ThreadPoolExecutor
 
-    import bigframes.pandas as bpd
-    from google.cloud import aiplatform
+    import backoff
+    import google.api_core.exceptions
+    import pyarrow as pa
+    from google.cloud import aiplatform, bigquery
     from langchain_google_vertexai import VectorSearchVectorStore
     from langchain_google_vertexai import VertexAIEmbeddings
 
@@ -51,51 +83,156 @@ def ingest_data(
 
     # Initialize clients
     logging.info("Initializing clients...")
-    bpd.options.bigquery.project = project_id
-    bpd.options.bigquery.location = location
+    bq_client = bigquery.Client(project=project_id, location=location)
     logging.info("Clients initialized.")
 
-    # Set date range for data fetch
-    schedule_time_dt: datetime = datetime.fromisoformat(
-        schedule_time.replace("Z", "+00:00")
-    )
-    if schedule_time_dt.year == 1970:
-        logging.warning(
-            "Pipeline schedule not set. Setting schedule_time to current date."
-        )
-        schedule_time_dt = datetime.now()
+    # --- Upload helpers ---
+
+    def iter_batches(record_batches, batch_size: int):
+        """Regroups Arrow record batches into tables of batch_size rows."""
+        pending = []
+        pending_rows = 0
+        for record_batch in record_batches:
+            pending.append(record_batch)
+            pending_rows += record_batch.num_rows
+            while pending_rows >= batch_size:
+                table = pa.Table.from_batches(pending)
+                yield table.slice(0, batch_size)
+                rest = table.slice(batch_size)
+                pending = rest.to_batches()
+                pending_rows = rest.num_rows
+        if pending_rows:
+            yield pa.Table.from_batches(pending)
 
-    # Note: The following line sets the schedule time 5 years back to allow sample data to be present.
-    # For your use case, please comment out the following line to use the actual schedule time.
-    schedule_time_dt = schedule_time_dt - timedelta(days=5 * 365)
+    def serialize_batch(table) -> dict:
+        """Converts a batch of chunks to the arguments of add_texts_with_embeddings."""
+        return {
+            "ids": [str(chunk_id) for chunk_id in table.column("chunk_id").to_pylist()],
+            "texts": table.column("text_chunk").to_pylist(),
+            "embeddings": table.column("embedding").to_pylist(),
+            "metadatas": table.select(
+                [name for name in table.column_names if name != "embedding"]
+            ).to_pylist(),
+        }
 
-    START_DATE: datetime = schedule_time_dt - timedelta(
-        days=look_back_days
-    )  # Start date for data processing window
-    END_DATE: datetime = schedule_time_dt  # End date for data processing window
+    def upload_pipelined(batches, upload, concurrency: int, max_retries: int) -> dict:
+        """Calls upload(batch) for each batch, with up to `concurrency` batches in
+        flight, retrying transient errors. The next batch is produced while
+        the others upload. Returns rows, seconds and retries."""
+        stats = {"rows": 0, "seconds": 0.0, "retries": 0}
+        stats_lock = threading.Lock()
 
-    logging.info(f"Date range set: START_DATE={START_DATE}, END_DATE={END_DATE}")
+        def count_retry(details) -> None:
+            with stats_lock:
+                stats["retries"] += 1
+            logging.warning(
+                f"Upload failed, retry {details['tries']} in {details['wait']:.1f}s: {details['exception']}"
+            )
+
+        retrying_upload = backoff.on_exception(
+            backoff.expo,
+            (
+                google.api_core.exceptions.ServiceUnavailable,
+                google.api_core.exceptions.TooManyRequests,
+                google.api_core.exceptions.DeadlineExceeded,
+                google.api_core.exceptions.InternalServerError,
+                google.api_core.exceptions.Aborted,
+                ConnectionError,
+            ),
+            max_tries=max_retries + 1,
+            on_backoff=count_retry,
+        )(upload)
+
+        def finish(future, rows: int) -> None:
+            future.result()
+            stats["rows"] += rows
+            stats["seconds"] = time.perf_counter() - started
+            logging.info(
+                f"Uploaded {stats['rows']} rows ({stats['rows'] / max(stats['seconds'], 1e-9):.0f} rows/s, {stats['retries']} retries)."
+            )
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max(1, concurrency)) as executor:
+            in_flight = deque()
+            for batch, rows in batches:
+                in_flight.append((executor.submit(retrying_upload, batch), rows))
+                if len(in_flight) >= max(1, concurrency):
+                    finish(*in_flight.popleft())
+            while in_flight:
+                finish(*in_flight.popleft())
+        stats["seconds"] = time.perf_counter() - started
+        return stats
 
     dataset = input_table.metadata["datasetId"]
     table = input_table.metadata["tableId"]
+    table_id = f"{project_id}.{dataset}.{table}"
+    manifest_table_id = (
+        f"{project_id}.{dataset}.{manifest_table or f'{table}_index_manifest'}"
+    )
+
+    try:
+        first_sync = bq_client.get_table(manifest_table_id).num_rows == 0
+    except google.api_core.exceptions.NotFound:
+        first_sync = True
 
+    bq_client.create_table(
+        bigquery.Table(
+            manifest_table_id,
+            schema=[
+                bigquery.SchemaField("chunk_id", "STRING"),
+                bigquery.SchemaField("content_hash", "STRING"),
+                bigquery.SchemaField("indexed_at", "TIMESTAMP"),
+            ],
+        ),
+        exists_ok=True,
+    )
+
+    # One row per chunk_id in the current state of the input table.
+    current_chunks = f"""
+        SELECT *
+        FROM `{table_id}`
+        QUALIFY ROW_NUMBER() OVER (PARTITION BY chunk_id ORDER BY creation_timestamp DESC) = 1
+    """
     query = f"""
         SELECT
-            question_id
-            , last_edit_date
-            , full_text_md
-            , text_chunk
-            , chunk_id
-            , embedding
-        FROM  {project_id}.{dataset}.{table}
-        WHERE TRUE
-                {f'AND DATETIME(creation_timestamp) BETWEEN DATETIME("{START_DATE}") AND DATETIME("{END_DATE}")' if is_incremental else ""}
+            current.question_id
+            , current.full_text_md
+            , current.text_chunk
+            , current.chunk_id
+            , current.embedding
+        FROM ({current_chunks}) AS current
+        LEFT JOIN `{manifest_table_id}` AS manifest USING (chunk_id)
+        WHERE {"manifest.content_hash IS DISTINCT FROM current.content_hash" if is_incremental else "TRUE"}
     """
-    df = (
-        bpd.read_gbq(query)
-        .sort_values("last_edit_date", ascending=False)
-        .drop_duplicates("question_id")
-        .reset_index(drop=True)
+    upsert_rows = bq_client.query(query).result(page_size=ingestion_batch_size)
+    deleted_ids = [
+        row.chunk_id
+        for row in bq_client.query(
+            f"""
+            SELECT chunk_id
+            FROM `{manifest_table_id}`
+            WHERE chunk_id NOT IN (SELECT chunk_id FROM `{table_id}` WHERE chunk_id IS NOT NULL)
+            """
+        ).result()
+    ]
+    if first_sync:
+        # Migrate from the pre-manifest layout, keyed by question_id.
+        legacy_ids = [
+            row.legacy_id
+            for row in bq_client.query(
+                f"""
+                SELECT DISTINCT CAST(question_id AS STRING) AS legacy_id
+                FROM `{table_id}`
+                WHERE question_id IS NOT NULL
+                """
+            ).result()
+        ]
+        logging.info(
+            f"No index manifest yet: deleting {len(legacy_ids)} legacy datapoints keyed by question_id."
+        )
+        deleted_ids += legacy_ids
+    logging.info(
+        f"{upsert_rows.total_rows} chunks to upsert, {len(deleted_ids)} chunks to delete."
     )
 
     aiplatform.init(
@@ -119,23 +256,49 @@ def ingest_data(
         stream_update=True,
     )
 
-    for batch_num, start in enumerate(range(0, len(df), ingestion_batch_size)):
-        ids = (
-            df.iloc[start : start + ingestion_batch_size]
-            .question_id.astype(str)
-            .tolist()
-        )
-        texts = df.iloc[start : start + ingestion_batch_size].text_chunk.tolist()
-        embeddings = df.iloc[start : start + ingestion_batch_size].embedding.tolist()
-        metadatas = (
-            df.iloc[start : start + ingestion_batch_size]
-            .drop(columns=["embedding", "last_edit_date"])
-            .to_dict(orient="records")
-        )
-        vector_store.add_texts_with_embeddings(
-            ids=ids,
-            texts=texts,
-            embeddings=embeddings,
-            metadatas=metadatas,
-            is_complete_overwrite=True,
-        )
+    upserted = upload_pipelined(
+        (
+            (serialize_batch(table), table.num_rows)
+            for table in iter_batches(
+                upsert_rows.to_arrow_iterable(), ingestion_batch_size
+            )
+        ),
+        lambda batch: vector_store.add_texts_with_embeddings(
+            **batch, is_complete_overwrite=False
+        ),
+        upload_concurrency,
+        upload_max_retries,
+    )
+    logging.info(f"Upserted chunks: {upserted}")
+
+    deleted = upload_pipelined(
+        (
+            (ids, len(ids))
+            for ids in (
+                deleted_ids[start : start + ingestion_batch_size]
+                for start in range(0, len(deleted_ids), ingestion_batch_size)
+            )
+        ),
+        lambda ids: vector_store.delete(ids=ids),
+        upload_concurrency,
+        upload_max_retries,
+    )
+    logging.info(f"Deleted chunks: {deleted}")
+
+    # Record what the index now holds, keeping indexed_at of unchanged chunks.
+    bq_client.query(
+        f"""
+        CREATE OR REPLACE TABLE `{manifest_table_id}` AS
+        SELECT
+            current.chunk_id
+            , current.content_hash
+            , IF(
+                manifest.content_hash IS NOT DISTINCT FROM current.content_hash,
+                manifest.indexed_at,
+                CURRENT_TIMESTAMP()
+            ) AS indexed_at
+        FROM ({current_chunks}) AS current
+        LEFT JOIN `{manifest_table_id}` AS manifest USING (chunk_id)
+        """
+    ).result()
+    logging.info("Index manifest updated.")
@@ -20,14 +20,24 @@ https://github.com/GoogleCloudPlatform/generative-ai/blob/main/gemini/use-cases/
 It leverages BigQuery for data processing. We also suggest looking at remote functions for enhanced scalability.
 """
 
+import os
+
 from kfp.dsl import Dataset, Output, component
 
 
 from google_cloud_pipeline_components.types.artifact_types import BQTable
 
+# The data processing base image with this package installed on top (see
+# data_ingestion/Dockerfile), so the component's worker processes can import
+# process_data_helpers. `make data-ingestion` builds and pushes it.
+DATA_PROCESSING_IMAGE = os.getenv(
+    "DATA_PROCESSING_IMAGE",
+    "us-docker.pkg.dev/production-ai-template/starter-pack/data_processing:0.2",
+)
+
 
 @component(
-    base_image="us-docker.pkg.dev/production-ai-template/starter-pack/data_processing:0.2",
+    base_image=DATA_PROCESSING_IMAGE,
 )
 def process_data(
     project_id: str,
@@ -41,15 +51,28 @@ def process_data(
     destination_table: str = "incremental_questions_embeddings",
     deduped_table: str = "questions_embeddings",
     location: str = "us-central1",
+    page_size: int = 500,
+    max_workers: int = 0,
+    write_batch_size: int = 5000,
+    reuse_embeddings: bool = True,
 ) -> None:
     """Process StackOverflow questions and answers by:
-    1. Fetching data from BigQuery
+    1. Fetching data from BigQuery, page by page
     2. Converting HTML to markdown
     3. Splitting text into chunks
-    4. Generating embeddings
+    4. Generating embeddings for new or modified chunks
     5. Storing results in BigQuery
     6. Exporting to JSONL
 
+    Steps 2 and 3 run on a process pool as pages stream in, and the chunks are
+    loaded into a BigQuery staging table in batches, so memory stays flat
+    regardless of the size of the window. The staging table is dropped when
+    the run ends, whether it succeeds or not.
+
+    Every chunk carries a SHA-256 `content_hash` of its text. Chunks whose
+    chunk_id and content_hash already exist in `deduped_table` reuse the stored
+    embedding, so only new or modified chunks are sent to the embedding model.
+
     Args:
         output_files: Output dataset path
         is_incremental: Whether to process only recent data
@@ -60,22 +83,24 @@ def process_data(
         destination_table: Table for storing incremental results
         deduped_table: Table for storing deduplicated results
         location: BigQuery location
+        page_size: Questions fetched from BigQuery per page
+        max_workers: Processes converting and splitting pages (0 for one per CPU)
+        write_batch_size: Chunks per load into the staging table
+        reuse_embeddings: Whether to reuse stored embeddings of unchanged chunks
     """
     import logging
+    import os
+    import time
     from datetime import datetime, timedelta
 
     import backoff
     import bigframes.ml.llm as llm
     import bigframes.pandas as bpd
     import google.api_core.exceptions
-    import swifter
     from google.cloud import bigquery
-    from langchain.text_splitter import RecursiveCharacterTextSplitter
-    from markdownify import markdownify
 
     # Initialize logging
     logging.basicConfig(level=logging.INFO)
-    logging.info(f"Using {swifter} for apply operations.")
 
     # Initialize clients
     logging.info("Initializing clients...")
@@ -105,10 +130,27 @@ def process_data(
 
     logging.info(f"Date range set: START_DATE={START_DATE}, END_DATE={END_DATE}")
 
-    def fetch_stackoverflow_data(
+    # --- Transform helpers ---
+    # The worker processes are spawned, not forked: the BigQuery client has
+    # started threads by now, and forking a threaded process can deadlock.
+    # Spawned workers import the helpers by name, so they come from this
+    # package, installed in the component's image.
+    try:
+        from data_ingestion_pipeline.components import (
+            process_data_helpers as helpers,
+        )
+    except ImportError as e:
+        raise RuntimeError(
+            "process_data must run in an image with the data-ingestion-pipeline "
+            "package installed. Build it from data_ingestion/Dockerfile and set "
+            "DATA_PROCESSING_IMAGE when compiling the pipeline."
+        ) from e
+
+    def fetch_stackoverflow_pages(
         dataset_suffix: str, start_date: str, end_date: str
-    ) -> bpd.DataFrame:
-        """Fetch StackOverflow data from BigQuery."""
+    ):
+        """Fetch StackOverflow data from BigQuery, one page of rows at a time.
+        Only the latest edit of each question is kept."""
         query = f"""
             SELECT
                 creation_date,
@@ -120,23 +162,11 @@ def process_data(
             FROM `production-ai-template.stackoverflow_qa_{dataset_suffix}.stackoverflow_python_questions_and_answers`
             WHERE TRUE
                 {f'AND TIMESTAMP_TRUNC(creation_date, DAY) BETWEEN TIMESTAMP("{start_date}") AND TIMESTAMP("{end_date}")' if is_incremental else ""}
+            QUALIFY ROW_NUMBER() OVER (PARTITION BY question_id ORDER BY last_edit_date DESC) = 1
         """
         logging.info("Fetching StackOverflow data from BigQuery...")
-        return bpd.read_gbq(query)
-
-    def convert_html_to_markdown(html: str) -> str:
-        """Convert HTML into Markdown for easier parsing and rendering after LLM response."""
-        return markdownify(html).strip()
-
-    def create_answers_markdown(answers: list) -> str:
-        """Convert each answer's HTML to markdown and concatenate into a single markdown text."""
-        answers_md = ""
-        for index, answer_record in enumerate(answers):
-            answers_md += (
-                f"\n\n## Answer {index + 1}:\n"  # Answer number is H2 heading size
-            )
-            answers_md += convert_html_to_markdown(answer_record["body"])
-        return answers_md
+        for page in bq_client.query(query).result(page_size=page_size).pages:
+            yield [dict(row.items()) for row in page]
 
     def create_table_if_not_exist(
         df: bpd.DataFrame,
@@ -160,107 +190,159 @@ def process_data(
         bq_client.create_dataset(dataset, exists_ok=True)
         bq_client.create_table(table=table, exists_ok=True)
 
-    # Fetch and preprocess data
-    logging.info("Fetching and preprocessing data...")
-    df = fetch_stackoverflow_data(
-        start_date=START_DATE.strftime("%Y-%m-%d"),
-        end_date=END_DATE.strftime("%Y-%m-%d"),
-        dataset_suffix=location.lower().replace("-", "_"),
-    )
-    df = (
-        df.sort_values("last_edit_date", ascending=False)
-        .drop_duplicates("question_id")
-        .reset_index(drop=True)
-    )
-    logging.info("Data fetched and preprocessed.")
-
-    # Convert content to markdown
-    logging.info("Converting content to markdown...")
-
-    # Create markdown fields efficiently
-    df["question_title_md"] = (
-        "# " + df["question_title"] + "\n"
-    )  # Title is H1 heading size
-    df["question_text_md"] = (
-        df["question_text"].to_pandas().swifter.apply(convert_html_to_markdown) + "\n"
-    )
-    df["answers_md"] = df["answers"].to_pandas().swifter.apply(create_answers_markdown)
-
-    # Create a column containing the whole markdown text
-    df["full_text_md"] = (
-        df["question_title_md"] + df["question_text_md"] + df["answers_md"]
-    )
-    logging.info("Content converted to markdown.")
-
-    # Keep only necessary columns
-    df = df[["last_edit_date", "question_id", "question_text", "full_text_md"]]
-
-    # Split text into chunks
-    logging.info("Splitting text into chunks...")
-    text_splitter = RecursiveCharacterTextSplitter(
-        chunk_size=chunk_size,
-        chunk_overlap=chunk_overlap,
-        length_function=len,
-    )
+    # Convert and split pages as they arrive, and load the chunks into a
+    # staging table in batches.
+    logging.info("Converting content to markdown and splitting it into chunks...")
+    dataset = bigquery.Dataset(f"{project_id}.{destination_dataset}")
+    dataset.location = location
+    bq_client.create_dataset(dataset, exists_ok=True)
+    staging_table_id = f"{project_id}.{destination_dataset}.{destination_table}_chunks_staging"
+    staging_schema = [
+        bigquery.SchemaField("last_edit_date", "TIMESTAMP"),
+        bigquery.SchemaField("question_id", "INT64"),
+        bigquery.SchemaField("question_text", "STRING"),
+        bigquery.SchemaField("full_text_md", "STRING"),
+        bigquery.SchemaField("text_chunk", "STRING"),
+        bigquery.SchemaField("chunk_id", "STRING"),
+        bigquery.SchemaField("content_hash", "STRING"),
+    ]
+    bq_client.delete_table(staging_table_id, not_found_ok=True)
+    bq_client.create_table(bigquery.Table(staging_table_id, schema=staging_schema))
+    try:
+        staging_job_config = bigquery.LoadJobConfig(
+            schema=staging_schema,
+            write_disposition=bigquery.WriteDisposition.WRITE_APPEND,
+        )
 
-    df["text_chunk"] = (
-        df["full_text_md"]
-        .to_pandas()
-        .astype(object)
-        .swifter.apply(text_splitter.split_text)
-    )
-    logging.info("Text split into chunks.")
+        def load_chunks(chunks: list) -> None:
+            bq_client.load_table_from_json(
+                chunks, staging_table_id, job_config=staging_job_config
+            ).result()
 
-    # Create chunk IDs and explode chunks into rows
-    logging.info("Creating chunk IDs and exploding chunks into rows...")
-    chunk_ids = [
-        str(idx) for text_chunk in df["text_chunk"] for idx in range(len(text_chunk))
-    ]
-    df = df.explode("text_chunk").reset_index(drop=True)
-    df["chunk_id"] = df["question_id"].astype("string") + "__" + chunk_ids
-    logging.info("Chunk IDs created and chunks exploded.")
+        workers = max_workers or os.cpu_count() or 1
+        pages = fetch_stackoverflow_pages(
+            start_date=START_DATE.strftime("%Y-%m-%d"),
+            end_date=END_DATE.strftime("%Y-%m-%d"),
+            dataset_suffix=location.lower().replace("-", "_"),
+        )
+        started = time.perf_counter()
+        pending_chunks: list = []
+        total_chunks = 0
+        for page_chunks in helpers.stream_transform(
+            pages, helpers.transform_page, workers, chunk_size, chunk_overlap
+        ):
+            pending_chunks.extend(page_chunks)
+            if len(pending_chunks) >= write_batch_size:
+                load_chunks(pending_chunks)
+                total_chunks += len(pending_chunks)
+                pending_chunks = []
+                logging.info(
+                    f"Loaded {total_chunks} chunks ({total_chunks / (time.perf_counter() - started):.0f} chunks/s)."
+                )
+        if pending_chunks:
+            load_chunks(pending_chunks)
+            total_chunks += len(pending_chunks)
+        if not total_chunks:
+            logging.warning("No questions found in the processing window.")
+        logging.info(
+            f"Content converted and split into {total_chunks} chunks in {time.perf_counter() - started:.1f}s."
+        )
 
-    # Generate embeddings
-    logging.info("Generating embeddings...")
+        # Split the chunks into those whose embedding can be reused from the
+        # deduplicated table (same chunk_id and content_hash) and those to embed.
+        deduped_table_id = f"{project_id}.{destination_dataset}.{deduped_table}"
+        try:
+            existing_columns = {
+                field.name for field in bq_client.get_table(deduped_table_id).schema
+            }
+        except google.api_core.exceptions.NotFound:
+            existing_columns = set()
+        if reuse_embeddings and {"chunk_id", "content_hash"} <= existing_columns:
+            stored_embeddings = f"""
+                SELECT chunk_id, content_hash, embedding, embedding_statistics, embedding_status
+                FROM `{deduped_table_id}`
+                WHERE embedding_status = ''
+                QUALIFY ROW_NUMBER() OVER (PARTITION BY chunk_id, content_hash) = 1
+            """
+            df_to_embed = bpd.read_gbq(
+                f"""
+                SELECT staging.*
+                FROM `{staging_table_id}` AS staging
+                LEFT JOIN ({stored_embeddings}) AS stored USING (chunk_id, content_hash)
+                WHERE stored.chunk_id IS NULL
+                """,
+                use_cache=False,
+            )
+            df_reused = bpd.read_gbq(
+                f"""
+                SELECT staging.*, stored.embedding, stored.embedding_statistics, stored.embedding_status
+                FROM `{staging_table_id}` AS staging
+                JOIN ({stored_embeddings}) AS stored USING (chunk_id, content_hash)
+                """,
+                use_cache=False,
+            )
+        else:
+            df_to_embed = bpd.read_gbq(staging_table_id, use_cache=False)
+            df_reused = None
+
+        num_to_embed = len(df_to_embed)
+        num_reused = len(df_reused) if df_reused is not None else 0
+        logging.info(
+            f"{num_to_embed} new or modified chunks to embed, {num_reused} unchanged chunks reuse stored embeddings."
+        )
 
-    # The first invocation in a new project might fail due to permission propagation.
-    @backoff.on_exception(
-        backoff.expo, google.api_core.exceptions.InvalidArgument, max_tries=10
-    )
-    def create_embedder() -> llm.TextEmbeddingGenerator:
-        return llm.TextEmbeddingGenerator(model_name="text-embedding-005")
+        # Generate embeddings (also for an empty window, so the tables get their schema)
+        if num_to_embed or not num_reused:
+            logging.info("Generating embeddings...")
 
-    embedder = create_embedder()
+            # The first invocation in a new project might fail due to permission propagation.
+            @backoff.on_exception(
+                backoff.expo, google.api_core.exceptions.InvalidArgument, max_tries=10
+            )
+            def create_embedder() -> llm.TextEmbeddingGenerator:
+                return llm.TextEmbeddingGenerator(model_name="text-embedding-005")
 
-    embeddings_df = embedder.predict(df["text_chunk"])
-    logging.info("Embeddings generated.")
+            embedder = create_embedder()
 
-    df = df.assign(
-        embedding=embeddings_df["ml_generate_embedding_result"],
-        embedding_statistics=embeddings_df["ml_generate_embedding_statistics"],
-        embedding_status=embeddings_df["ml_generate_embedding_status"],
-        creation_timestamp=datetime.now(),
-    )
+            embeddings_df = embedder.predict(df_to_embed["text_chunk"])
+            logging.info("Embeddings generated.")
 
-    # Store results in BigQuery
-    PARTITION_DATE_COLUMN = "creation_timestamp"
+            df_to_embed = df_to_embed.assign(
+                embedding=embeddings_df["ml_generate_embedding_result"],
+                embedding_statistics=embeddings_df["ml_generate_embedding_statistics"],
+                embedding_status=embeddings_df["ml_generate_embedding_status"],
+            )
 
-    # Create and populate incremental table
-    logging.info("Creating and populating incremental table...")
-    create_table_if_not_exist(
-        df=df,
-        project_id=project_id,
-        dataset_id=destination_dataset,
-        table_id=destination_table,
-        partition_column=PARTITION_DATE_COLUMN,
-    )
+        if not num_reused:
+            df = df_to_embed
+        elif not num_to_embed:
+            df = df_reused
+        else:
+            df = bpd.concat([df_to_embed, df_reused[df_to_embed.columns]], ignore_index=True)
+        df = df.assign(creation_timestamp=datetime.now())
+
+        # Store results in BigQuery
+        PARTITION_DATE_COLUMN = "creation_timestamp"
+
+        # Create and populate incremental table
+        logging.info("Creating and populating incremental table...")
+        create_table_if_not_exist(
+            df=df,
+            project_id=project_id,
+            dataset_id=destination_dataset,
+            table_id=destination_table,
+            partition_column=PARTITION_DATE_COLUMN,
+        )
 
-    if_exists_mode = "append" if is_incremental else "replace"
-    df.to_gbq(
-        destination_table=f"{destination_dataset}.{destination_table}",
-        if_exists=if_exists_mode,
-    )
-    logging.info("Incremental table created and populated.")
+        if_exists_mode = "append" if is_incremental else "replace"
+        df.to_gbq(
+            destination_table=f"{destination_dataset}.{destination_table}",
+            if_exists=if_exists_mode,
+        )
+        logging.info("Incremental table created and populated.")
+    finally:
+        # Drop the staging table even if the run fails, so it doesn't linger.
+        bq_client.delete_table(staging_table_id, not_found_ok=True)
 
     # Create deduplicated table
     logging.info("Creating deduplicated table...")
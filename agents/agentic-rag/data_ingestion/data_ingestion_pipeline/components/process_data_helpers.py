@@ -0,0 +1,117 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+# ruff: noqa
+
+"""Transform helpers of the `process_data` component.
+
+They run in worker processes, which are spawned rather than forked (the
+component's BigQuery client has started threads by then), so they live in a
+real module the workers can import. Lightweight KFP components only ship the
+component function, so the package is installed in the component's image
+(see data_ingestion/Dockerfile). Third-party libraries are imported where
+they are used, so `local_pipeline`, `document_ingestion` and the benchmarks
+can import this module without them.
+"""
+
+import hashlib
+import multiprocessing
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+
+def convert_html_to_markdown(html: str) -> str:
+    """Convert HTML into Markdown for easier parsing and rendering after LLM response."""
+    from markdownify import markdownify
+
+    return markdownify(html or "").strip()
+
+
+def create_answers_markdown(answers: list) -> str:
+    """Convert each answer's HTML to markdown and concatenate into a single markdown text."""
+    answers_md = ""
+    for index, answer_record in enumerate(answers or []):
+        answers_md += (
+            f"\n\n## Answer {index + 1}:\n"  # Answer number is H2 heading size
+        )
+        answers_md += convert_html_to_markdown(answer_record["body"])
+    return answers_md
+
+
+def markdown_page(rows: list) -> list:
+    """Converts a page of questions and their answers to one markdown text each."""
+    return [
+        {
+            **row,
+            "full_text_md": (
+                "# " + row["question_title"] + "\n"  # Title is H1 heading size
+                + convert_html_to_markdown(row["question_text"]) + "\n"
+                + create_answers_markdown(row["answers"])
+            ),
+        }
+        for row in rows
+    ]
+
+
+def split_page(rows: list, chunk_size: int, chunk_overlap: int) -> list:
+    """Splits a page of markdown questions into chunk rows."""
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        length_function=len,
+    )
+    chunks = []
+    for row in rows:
+        last_edit_date = row["last_edit_date"]
+        for index, text_chunk in enumerate(text_splitter.split_text(row["full_text_md"])):
+            chunks.append(
+                {
+                    "last_edit_date": last_edit_date.isoformat() if last_edit_date else None,
+                    "question_id": row["question_id"],
+                    "question_text": row["question_text"],
+                    "full_text_md": row["full_text_md"],
+                    "text_chunk": text_chunk,
+                    "chunk_id": f"{row['question_id']}__{index}",
+                    "content_hash": hashlib.sha256(text_chunk.encode("utf-8")).hexdigest(),
+                }
+            )
+    return chunks
+
+
+def transform_page(rows: list, chunk_size: int, chunk_overlap: int) -> list:
+    """Converts a page of questions to markdown and splits it into chunk rows."""
+    return split_page(markdown_page(rows), chunk_size, chunk_overlap)
+
+
+def stream_transform(pages, transform, workers: int, *args):
+    """Yields transform(page, *args) for each page, in order, keeping at most
+    2 * workers pages in flight so memory doesn't grow with the input.
+
+    `transform` must be a module-level function of an importable module, as
+    the worker processes are spawned and import it by name."""
+    if workers <= 1:
+        for page in pages:
+            yield transform(page, *args)
+        return
+    with ProcessPoolExecutor(
+        max_workers=workers, mp_context=multiprocessing.get_context("spawn")
+    ) as executor:
+        in_flight = deque()
+        for page in pages:
+            in_flight.append(executor.submit(transform, page, *args))
+            if len(in_flight) >= 2 * workers:
+                yield in_flight.popleft().result()
+        while in_flight:
+            yield in_flight.popleft().result()
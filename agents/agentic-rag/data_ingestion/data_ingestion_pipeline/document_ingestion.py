@@ -0,0 +1,210 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Ingests PDF and text documents from a directory or GCS prefix.
+
+Documents are cut into tasks of `pages_per_task` PDF pages (or one text
+file), which a process pool parses and splits with the same splitter and
+settings as `process_data`, so a single large PDF is spread over all workers.
+Tasks are streamed: GCS objects are downloaded as tasks are needed and
+deleted once parsed, and only a bounded number of tasks is in flight.
+
+Each chunk record carries `chunk_id`, `doc_id`, `source`, `page` (1-based,
+None for text files), `text_chunk` and `content_hash`. Records can be embedded
+and written with the embedders and sinks of `local_pipeline`. Besides the
+pipeline's dependencies, this needs the `local` extra (which includes pypdf,
+and google-cloud-storage for gs:// sources):
+
+    uv run --extra local python -m data_ingestion_pipeline.document_ingestion \\
+        --source gs://my-bucket/docs/ --embedder vertex --sink jsonl --out chunks.jsonl
+"""
+
+import argparse
+import hashlib
+import inspect
+import logging
+import os
+import tempfile
+import time
+from collections.abc import Iterator
+from pathlib import Path
+from typing import Any
+
+from data_ingestion_pipeline.components.process_data import process_data
+from data_ingestion_pipeline.local_pipeline import (
+    EMBEDDERS,
+    SINKS,
+    embed_and_write,
+    get_embedder,
+    get_sink,
+    helpers,
+)
+
+logger = logging.getLogger(__name__)
+
+PDF_SUFFIXES = (".pdf",)
+TEXT_SUFFIXES = (".txt", ".md")
+
+_process_data_parameters = inspect.signature(process_data.python_func).parameters
+DEFAULT_CHUNK_SIZE: int = _process_data_parameters["chunk_size"].default
+DEFAULT_CHUNK_OVERLAP: int = _process_data_parameters["chunk_overlap"].default
+
+
+def _doc_id(source: str) -> str:
+    return hashlib.sha256(source.encode("utf-8")).hexdigest()[:16]
+
+
+def list_documents(source: str) -> Iterator[str]:
+    """Yields the supported documents under a local path or a gs:// prefix."""
+    suffixes = PDF_SUFFIXES + TEXT_SUFFIXES
+    if source.startswith("gs://"):
+        from google.cloud import storage
+
+        bucket, _, prefix = source[len("gs://") :].partition("/")
+        for blob in storage.Client().list_blobs(bucket, prefix=prefix):
+            if blob.name.lower().endswith(suffixes):
+                yield f"gs://{bucket}/{blob.name}"
+        return
+    path = Path(source)
+    files = sorted(path.rglob("*")) if path.is_dir() else [path]
+    for file in files:
+        if file.is_file() and file.suffix.lower() in suffixes:
+            yield str(file)
+
+
+def _download(uri: str, download_dir: str) -> str:
+    from google.cloud import storage
+
+    bucket, _, name = uri[len("gs://") :].partition("/")
+    path = os.path.join(download_dir, f"{_doc_id(uri)}{Path(name).suffix}")
+    storage.Client().bucket(bucket).blob(name).download_to_filename(path)
+    return path
+
+
+def iter_tasks(source: str, pages_per_task: int, download_dir: str) -> Iterator[dict[str, Any]]:
+    """Yields parse tasks: a PDF page range or a whole text file.
+
+    The last task of each downloaded document is marked, so its file can be
+    deleted once that task is done.
+    """
+    from pypdf import PdfReader
+
+    for uri in list_documents(source):
+        temporary = uri.startswith("gs://")
+        path = _download(uri, download_dir) if temporary else uri
+        task = {"path": path, "source": uri, "temporary": temporary}
+        if not path.lower().endswith(PDF_SUFFIXES):
+            yield {**task, "start": None, "stop": None, "last": True}
+            continue
+        num_pages = len(PdfReader(path).pages)
+        if not num_pages:
+            # No task will be marked last, so the file is removed here.
+            if temporary:
+                os.remove(path)
+            continue
+        for start in range(0, num_pages, pages_per_task):
+            stop = min(start + pages_per_task, num_pages)
+            yield {**task, "start": start, "stop": stop, "last": stop == num_pages}
+
+
+def parse_task(task: dict[str, Any], chunk_size: int, chunk_overlap: int) -> tuple[list[dict[str, Any]], dict[str, Any]]:
+    """Parses a task's pages and splits them into chunk records. Returns the records and the task."""
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,
+        chunk_overlap=chunk_overlap,
+        length_function=len,
+    )
+    doc_id = _doc_id(task["source"])
+    if task["start"] is None:
+        pages = [(None, Path(task["path"]).read_text(errors="replace"))]
+    else:
+        from pypdf import PdfReader
+
+        reader = PdfReader(task["path"])
+        pages = [(number + 1, reader.pages[number].extract_text() or "") for number in range(task["start"], task["stop"])]
+
+    records = []
+    for page, text in pages:
+        prefix = doc_id if page is None else f"{doc_id}__p{page}"
+        for index, text_chunk in enumerate(text_splitter.split_text(text)):
+            records.append(
+                {
+                    "chunk_id": f"{prefix}__{index}",
+                    "doc_id": doc_id,
+                    "source": task["source"],
+                    "page": page,
+                    "text_chunk": text_chunk,
+                    "content_hash": hashlib.sha256(text_chunk.encode("utf-8")).hexdigest(),
+                }
+            )
+    return records, {**task, "pages": len(pages)}
+
+
+def ingest_documents(
+    source: str,
+    workers: int = 1,
+    pages_per_task: int = 16,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    chunk_overlap: int = DEFAULT_CHUNK_OVERLAP,
+) -> Iterator[tuple[list[dict[str, Any]], dict[str, Any]]]:
+    """Yields the chunk records of each task, in document and page order, with the task."""
+    with tempfile.TemporaryDirectory(prefix="document_ingestion_") as download_dir:
+        tasks = iter_tasks(source, pages_per_task, download_dir)
+        for records, task in helpers.stream_transform(tasks, parse_task, workers, chunk_size, chunk_overlap):
+            if task["temporary"] and task["last"]:
+                os.remove(task["path"])
+            yield records, task
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Parse and chunk PDF and text documents, then embed and write them.")
+    parser.add_argument("--source", required=True, help="A file, directory or gs://bucket/prefix.")
+    parser.add_argument("--embedder", choices=EMBEDDERS, default="fake")
+    parser.add_argument("--dimensions", type=int, default=768, help="Dimensions of the fake embeddings.")
+    parser.add_argument("--sink", choices=SINKS, default="none")
+    parser.add_argument("--out", help="Output directory (local) or file (jsonl).")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--pages-per-task", type=int, default=16)
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser.add_argument("--chunk-overlap", type=int, default=DEFAULT_CHUNK_OVERLAP)
+    parser.add_argument("--embed-batch-size", type=int, default=250)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    embedder = get_embedder(args.embedder, args.dimensions)
+    sink = get_sink(args.sink, args.out)
+    timings = {"parse": 0.0, "embed": 0.0, "write": 0.0}
+    pages = chunks = 0
+    started = time.perf_counter()
+    parse_started = started
+    for records, task in ingest_documents(
+        args.source, args.workers, args.pages_per_task, args.chunk_size, args.chunk_overlap
+    ):
+        timings["parse"] += time.perf_counter() - parse_started
+        pages += task["pages"]
+        chunks += len(records)
+        embed_and_write(records, embedder, sink, timings, args.embed_batch_size)
+        parse_started = time.perf_counter()
+    sink.close()
+    seconds = time.perf_counter() - started
+    print(
+        f"{pages} pages, {chunks} chunks in {seconds:.2f}s ({pages / seconds:.0f} pages/s); "
+        + ", ".join(f"{stage} {stage_seconds:.2f}s" for stage, stage_seconds in timings.items())
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,285 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""Runs the ingestion pipeline locally, without BigQuery or Vector Search.
+
+StackOverflow rows are read from a Parquet or JSONL export instead of
+BigQuery, converted and split by the helpers of the `process_data` component,
+embedded by a pluggable embedder and written to a pluggable sink. Each stage
+(fetch, markdown, split, embed, write) is timed, so ingestion throughput can
+be profiled and compared between changes.
+
+Embedders:
+    fake: Deterministic hash-based vectors; no credentials or network needed.
+    vertex: text-embedding-005 through Vertex AI, as in the pipeline.
+
+Sinks:
+    local: The agentic-rag LocalVectorStore, saved to --out.
+    jsonl: Chunk records as written for ingest_data, to --out
+        (`app/local_vector_store.py build` can index them later).
+    none: Discards the chunks, to measure the other stages.
+
+Besides the pipeline's dependencies, this needs the `local` extra
+(markdownify, langchain, numpy and pyarrow). Run from data_ingestion/:
+
+    uv run --extra local python -m data_ingestion_pipeline.local_pipeline \\
+        --input stackoverflow.parquet --sink local --out ../.local_vector_store --workers 4
+"""
+
+import argparse
+import importlib.util
+import json
+import logging
+import os
+import sys
+import time
+from collections.abc import Iterator
+from datetime import datetime
+from pathlib import Path
+from typing import Any
+
+from data_ingestion_pipeline.components import process_data_helpers as helpers
+
+logger = logging.getLogger(__name__)
+
+STAGES = ("fetch", "markdown", "split", "embed", "write")
+EMBEDDERS = ("fake", "vertex")
+SINKS = ("local", "jsonl", "none")
+
+# agentic-rag/app/local_vector_store.py; loaded by path because importing the
+# app package builds the agent.
+LOCAL_VECTOR_STORE_PATH = Path(__file__).resolve().parents[2] / "app" / "local_vector_store.py"
+
+
+def _parse_row(row: dict[str, Any]) -> dict[str, Any]:
+    # The BigQuery query renames question_body; exports may not.
+    if "question_text" not in row:
+        row["question_text"] = row.pop("question_body", "")
+    if isinstance(row.get("last_edit_date"), str):
+        row["last_edit_date"] = datetime.fromisoformat(row["last_edit_date"].replace("Z", "+00:00"))
+    return row
+
+
+def read_pages(path: str | Path, page_size: int) -> Iterator[list[dict[str, Any]]]:
+    """Yields pages of question rows from a Parquet or JSONL file (or a directory of them)."""
+    path = Path(path)
+    files = sorted(p for p in path.iterdir() if p.suffix in (".jsonl", ".parquet")) if path.is_dir() else [path]
+    for file in files:
+        if file.suffix == ".parquet":
+            import pyarrow.parquet as pq
+
+            for batch in pq.ParquetFile(file).iter_batches(batch_size=page_size):
+                yield [_parse_row(row) for row in batch.to_pylist()]
+            continue
+        page = []
+        with file.open() as f:
+            for line in f:
+                if line.strip():
+                    page.append(_parse_row(json.loads(line)))
+                    if len(page) == page_size:
+                        yield page
+                        page = []
+        if page:
+            yield page
+
+
+def transform_page_timed(rows: list[dict[str, Any]], chunk_size: int, chunk_overlap: int) -> tuple[list[dict[str, Any]], dict[str, float]]:
+    """Runs process_data's markdown and split helpers on a page, timing each."""
+    started = time.perf_counter()
+    markdown_rows = helpers.markdown_page(rows)
+    converted = time.perf_counter()
+    chunks = helpers.split_page(markdown_rows, chunk_size, chunk_overlap)
+    return chunks, {"markdown": converted - started, "split": time.perf_counter() - converted}
+
+
+def get_embedder(name: str, dimensions: int = 768) -> Any:
+    if name == "fake":
+        from langchain_core.embeddings import DeterministicFakeEmbedding
+
+        return DeterministicFakeEmbedding(size=dimensions)
+    if name == "vertex":
+        from langchain_google_vertexai import VertexAIEmbeddings
+
+        return VertexAIEmbeddings(model_name="text-embedding-005")
+    raise ValueError(f"Unknown embedder '{name}'. Supported embedders are: {EMBEDDERS}")
+
+
+def _load_local_vector_store_module() -> Any:
+    spec = importlib.util.spec_from_file_location("local_vector_store", LOCAL_VECTOR_STORE_PATH)
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[spec.name] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+class LocalVectorStoreSink:
+    """Upserts chunks into a LocalVectorStore, saved to `out` on close."""
+
+    def __init__(self, out: str | Path) -> None:
+        self.out = out
+        self.store = _load_local_vector_store_module().LocalVectorStore()
+
+    def write(self, chunks: list[dict[str, Any]]) -> None:
+        self.store.add_records(chunks, batch_size=len(chunks) or 1)
+
+    def close(self) -> None:
+        self.store.save(self.out)
+
+
+class JsonlSink:
+    """Writes chunk records, one JSON object per line."""
+
+    def __init__(self, out: str | Path) -> None:
+        self._file = open(out, "w")
+
+    def write(self, chunks: list[dict[str, Any]]) -> None:
+        for chunk in chunks:
+            self._file.write(json.dumps(chunk, default=str) + "\n")
+
+    def close(self) -> None:
+        self._file.close()
+
+
+class NullSink:
+    def write(self, chunks: list[dict[str, Any]]) -> None:
+        pass
+
+    def close(self) -> None:
+        pass
+
+
+def get_sink(name: str, out: str | Path | None) -> Any:
+    if name == "none":
+        return NullSink()
+    if name not in SINKS:
+        raise ValueError(f"Unknown sink '{name}'. Supported sinks are: {SINKS}")
+    if not out:
+        raise ValueError(f"The '{name}' sink needs an output path.")
+    return LocalVectorStoreSink(out) if name == "local" else JsonlSink(out)
+
+
+def embed_and_write(
+    chunks: list[dict[str, Any]],
+    embedder: Any,
+    sink: Any,
+    timings: dict[str, float],
+    embed_batch_size: int = 250,
+) -> None:
+    """Embeds chunk records in batches and writes them to the sink, adding to `timings`."""
+    for start in range(0, len(chunks), embed_batch_size):
+        batch = chunks[start : start + embed_batch_size]
+        stage_started = time.perf_counter()
+        embeddings = embedder.embed_documents([chunk["text_chunk"] for chunk in batch])
+        timings["embed"] = timings.get("embed", 0.0) + time.perf_counter() - stage_started
+        stage_started = time.perf_counter()
+        sink.write([{**chunk, "embedding": embedding} for chunk, embedding in zip(batch, embeddings)])
+        timings["write"] = timings.get("write", 0.0) + time.perf_counter() - stage_started
+
+
+def run(
+    pages: Iterator[list[dict[str, Any]]],
+    embedder: Any,
+    sink: Any,
+    chunk_size: int = 1500,
+    chunk_overlap: int = 20,
+    workers: int = 1,
+    embed_batch_size: int = 250,
+) -> dict[str, Any]:
+    """Runs the pipeline stages over pages of question rows.
+
+    Markdown conversion and splitting run on `workers` processes, as in
+    process_data; their times are summed over the workers. Embedding and
+    writing run in this process, one batch of up to `embed_batch_size` chunks
+    at a time.
+
+    Returns:
+        The wall time, row and chunk counts, and the seconds spent per stage.
+    """
+    timings = dict.fromkeys(STAGES, 0.0)
+    questions = 0
+    total_chunks = 0
+
+    def timed_pages() -> Iterator[list[dict[str, Any]]]:
+        nonlocal questions
+        iterator = iter(pages)
+        while True:
+            started = time.perf_counter()
+            page = next(iterator, None)
+            timings["fetch"] += time.perf_counter() - started
+            if page is None:
+                return
+            questions += len(page)
+            yield page
+
+    started = time.perf_counter()
+    for chunks, page_timings in helpers.stream_transform(
+        timed_pages(), transform_page_timed, workers, chunk_size, chunk_overlap
+    ):
+        for stage, seconds in page_timings.items():
+            timings[stage] += seconds
+        embed_and_write(chunks, embedder, sink, timings, embed_batch_size)
+        total_chunks += len(chunks)
+    stage_started = time.perf_counter()
+    sink.close()
+    timings["write"] += time.perf_counter() - stage_started
+    return {
+        "seconds": time.perf_counter() - started,
+        "questions": questions,
+        "chunks": total_chunks,
+        "timings": timings,
+    }
+
+
+def format_report(report: dict[str, Any]) -> str:
+    seconds = report["seconds"] or 1e-9
+    lines = [
+        f"{report['questions']} questions, {report['chunks']} chunks in {report['seconds']:.2f}s "
+        f"({report['questions'] / seconds:.0f} questions/s, {report['chunks'] / seconds:.0f} chunks/s)",
+        f"{'stage':<10}{'seconds':>10}{'share':>8}",
+    ]
+    busy = sum(report["timings"].values()) or 1e-9
+    for stage, stage_seconds in report["timings"].items():
+        lines.append(f"{stage:<10}{stage_seconds:>10.2f}{stage_seconds / busy:>8.0%}")
+    return "\n".join(lines)
+
+
+def main(argv: list[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Run the ingestion pipeline locally and time each stage.")
+    parser.add_argument("--input", required=True, help="Parquet or JSONL file (or directory) of StackOverflow rows.")
+    parser.add_argument("--embedder", choices=EMBEDDERS, default="fake")
+    parser.add_argument("--dimensions", type=int, default=768, help="Dimensions of the fake embeddings.")
+    parser.add_argument("--sink", choices=SINKS, default="none")
+    parser.add_argument("--out", help="Output directory (local) or file (jsonl).")
+    parser.add_argument("--page-size", type=int, default=500)
+    parser.add_argument("--chunk-size", type=int, default=1500)
+    parser.add_argument("--chunk-overlap", type=int, default=20)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--embed-batch-size", type=int, default=250)
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO)
+
+    report = run(
+        read_pages(args.input, args.page_size),
+        get_embedder(args.embedder, args.dimensions),
+        get_sink(args.sink, args.out),
+        chunk_size=args.chunk_size,
+        chunk_overlap=args.chunk_overlap,
+        workers=args.workers,
+        embed_batch_size=args.embed_batch_size,
+    )
+    print(format_report(report))
+
+
+if __name__ == "__main__":
+    main()
@@ -32,6 +32,7 @@ def pipeline(
     vector_search_index_endpoint: str = "",
     vector_search_data_bucket_name: str = "",
     ingestion_batch_size: int = 1000,
+    ingestion_concurrency: int = 4,
 ) -> None:
     """Processes data and ingests it into a datastore for RAG Retrieval"""
 
@@ -57,8 +58,7 @@ def pipeline(
         vector_search_index_endpoint=vector_search_index_endpoint,
         vector_search_data_bucket_name=vector_search_data_bucket_name,
         input_table=processed_data.output,
-        schedule_time=dsl.PIPELINE_JOB_SCHEDULE_TIME_UTC_PLACEHOLDER,
-        is_incremental=False,
-        look_back_days=look_back_days,
+        is_incremental=is_incremental,
         ingestion_batch_size=ingestion_batch_size,
+        upload_concurrency=ingestion_concurrency,
     ).set_retry(num_retries=2)
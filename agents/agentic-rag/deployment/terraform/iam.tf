@@ -72,6 +72,16 @@ resource "google_project_iam_member" "cicd_run_invoker_artifact_registry_reader"
 
 }
 
+# 5. Allow Vertex AI Pipelines to pull the data processing image stored in the CICD project
+resource "google_project_iam_member" "cicd_pipeline_artifact_registry_reader" {
+  for_each = local.deploy_project_ids
+  project  = var.cicd_runner_project_id
+
+  role       = "roles/artifactregistry.reader"
+  member     = "serviceAccount:service-${data.google_project.projects[each.key].number}@gcp-sa-aiplatform-cc.iam.gserviceaccount.com"
+  depends_on = [resource.google_project_service.cicd_services, resource.google_project_service.deploy_project_services]
+
+}
 
 
 
@@ -0,0 +1,329 @@
+import fcntl
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import asdict, dataclass
+from datetime import timedelta
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Context caching configuration (from environment).
+ENABLE_CONTEXT_CACHE = os.environ.get("ENABLE_CONTEXT_CACHE", "false").lower() == "true"
+# Vertex AI rejects cached content below a minimum size, so smaller prefixes are sent inline.
+CONTEXT_CACHE_MIN_TOKENS = int(os.environ.get("CONTEXT_CACHE_MIN_TOKENS", "4096"))
+CONTEXT_CACHE_TTL_SECONDS = int(os.environ.get("CONTEXT_CACHE_TTL_SECONDS", "3600"))
+# Extend a cache entry's TTL when less than this much time is left on it.
+CONTEXT_CACHE_REFRESH_SECONDS = int(os.environ.get("CONTEXT_CACHE_REFRESH_SECONDS", "300"))
+# Local index of created caches, so separate runs and prompt files can reuse them.
+CONTEXT_CACHE_INDEX = os.environ.get("CONTEXT_CACHE_INDEX", str(Path.home() / ".cache" / "gemini_playground" / "context_cache.json"))
+
+
+@dataclass
+class CacheEntry:
+    """A server-side cached content handle and when it expires."""
+
+    name: str
+    model_name: str
+    expire_time: float
+
+
+def _describe(value: Any) -> str:
+    """Stable text form of a prefix component, used for hashing."""
+    if value is None:
+        return ""
+    if isinstance(value, str):
+        return value
+    if isinstance(value, (list, tuple)):
+        return "\n".join(_describe(v) for v in value)
+    to_dict = getattr(value, "to_dict", None)
+    if callable(to_dict):
+        try:
+            return json.dumps(to_dict(), sort_keys=True, default=str)
+        except TypeError:
+            pass
+    return repr(value)
+
+
+def prefix_key(
+    model_name: str,
+    system_instruction: Any = None,
+    tools: Any = None,
+    contents: Any = None,
+    project: Optional[str] = None,
+    location: Optional[str] = None,
+) -> str:
+    """
+    Returns a content hash identifying a stable prompt prefix for a model.
+    Cached contents are regional project resources, so the project and
+    location are part of the key.
+    """
+    digest = hashlib.sha256()
+    for component in (project, location, model_name, system_instruction, tools, contents):
+        digest.update(_describe(component).encode("utf-8"))
+        digest.update(b"\x00")
+    return digest.hexdigest()
+
+
+def _default_scope() -> Tuple[Optional[str], Optional[str]]:
+    """Returns the project and location Vertex AI was initialized with, falling back to the environment."""
+    try:
+        from google.cloud.aiplatform import initializer
+
+        return initializer.global_config.project, initializer.global_config.location
+    except Exception:
+        return os.environ.get("PROJECT_ID"), os.environ.get("REGION")
+
+
+def estimate_prefix_tokens(system_instruction: Any = None, tools: Any = None, contents: Any = None) -> int:
+    """Cheap token estimate (~4 characters per token) of a prompt prefix."""
+    return sum(len(_describe(c)) for c in (system_instruction, tools, contents)) // 4
+
+
+class LocalCacheBackend:
+    """
+    An in-process stand-in for Vertex AI context caching. It hands out fake
+    cache names and tracks expiry against an injectable clock, so the caching
+    decisions can be exercised offline.
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.time):
+        self.clock = clock
+        self.entries: Dict[str, float] = {}
+        self.created = 0
+        self.refreshed = 0
+
+    def create(self, model_name: str, system_instruction: Any, tools: Any, contents: Any, ttl: timedelta) -> CacheEntry:
+        name = f"local/cachedContents/{uuid.uuid4().hex}"
+        self.entries[name] = self.clock() + ttl.total_seconds()
+        self.created += 1
+        return CacheEntry(name=name, model_name=model_name, expire_time=self.entries[name])
+
+    def refresh(self, entry: CacheEntry, ttl: timedelta) -> CacheEntry:
+        if entry.name not in self.entries:
+            raise LookupError(f"Cached content '{entry.name}' does not exist.")
+        self.entries[entry.name] = self.clock() + ttl.total_seconds()
+        self.refreshed += 1
+        return CacheEntry(name=entry.name, model_name=entry.model_name, expire_time=self.entries[entry.name])
+
+    def model_for(self, entry: CacheEntry, **model_kwargs) -> Any:
+        return entry
+
+
+class VertexCacheBackend:
+    """Creates and refreshes cached contents with the Vertex AI SDK."""
+
+    def __init__(self, clock: Callable[[], float] = time.time):
+        self.clock = clock
+
+    def create(self, model_name: str, system_instruction: Any, tools: Any, contents: Any, ttl: timedelta) -> CacheEntry:
+        from vertexai.preview import caching
+
+        cached_content = caching.CachedContent.create(
+            model_name=model_name,
+            system_instruction=system_instruction,
+            tools=tools or None,
+            contents=contents or None,
+            ttl=ttl,
+        )
+        return CacheEntry(name=cached_content.name, model_name=model_name, expire_time=self.clock() + ttl.total_seconds())
+
+    def refresh(self, entry: CacheEntry, ttl: timedelta) -> CacheEntry:
+        from vertexai.preview import caching
+
+        caching.CachedContent(cached_content_name=entry.name).update(ttl=ttl)
+        return CacheEntry(name=entry.name, model_name=entry.model_name, expire_time=self.clock() + ttl.total_seconds())
+
+    def model_for(self, entry: CacheEntry, **model_kwargs) -> Any:
+        from vertexai.preview import caching
+        from vertexai.preview.generative_models import GenerativeModel
+
+        cached_content = caching.CachedContent(cached_content_name=entry.name)
+        return GenerativeModel.from_cached_content(cached_content=cached_content, **model_kwargs)
+
+
+class ContextCacheManager:
+    """
+    Decides when a stable prompt prefix (system instruction, tools and large
+    documents) should be served from a server-side context cache, and reuses
+    the cache across calls, agents and prompt files.
+
+    Entries are keyed by a content hash of the prefix, kept in memory and in an
+    optional JSON index on disk, and refreshed when less than
+    `refresh_margin` is left before they expire. Prefixes smaller than
+    `min_tokens` are not cached.
+    """
+
+    def __init__(
+        self,
+        backend: Any = None,
+        min_tokens: int = CONTEXT_CACHE_MIN_TOKENS,
+        ttl: timedelta = timedelta(seconds=CONTEXT_CACHE_TTL_SECONDS),
+        refresh_margin: timedelta = timedelta(seconds=CONTEXT_CACHE_REFRESH_SECONDS),
+        index_path: Optional[str] = None,
+        token_counter: Optional[Callable[..., int]] = None,
+    ):
+        self.backend = backend or VertexCacheBackend()
+        self.min_tokens = min_tokens
+        self.ttl = ttl
+        self.refresh_margin = refresh_margin
+        self.index_path = Path(index_path) if index_path else None
+        self.token_counter = token_counter or estimate_prefix_tokens
+        self._entries: Dict[str, CacheEntry] = {}
+        self._lock = threading.Lock()
+        self._load_index()
+
+    def _read_index(self) -> Dict[str, CacheEntry]:
+        if not self.index_path or not self.index_path.exists():
+            return {}
+        try:
+            raw = json.loads(self.index_path.read_text())
+            return {key: CacheEntry(**value) for key, value in raw.items()}
+        except (ValueError, TypeError) as e:
+            logger.warning(f"Ignoring unreadable context cache index '{self.index_path}': {e}")
+            return {}
+
+    def _load_index(self) -> None:
+        self._entries = self._read_index()
+
+    @contextmanager
+    def _index_lock(self) -> Iterator[None]:
+        # Other processes share the index; they write it one at a time.
+        with open(f"{self.index_path}.lock", "w") as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _save_index(self) -> None:
+        """
+        Merges the in-memory entries into the index on disk and replaces it
+        atomically, so entries written by other processes since it was loaded
+        are kept and readers never see a partially written file.
+        """
+        if not self.index_path:
+            return
+        try:
+            self.index_path.parent.mkdir(parents=True, exist_ok=True)
+            with self._index_lock():
+                for key, entry in self._read_index().items():
+                    current = self._entries.get(key)
+                    if current is None or entry.expire_time > current.expire_time:
+                        self._entries[key] = entry
+                now = self.backend.clock()
+                self._entries = {key: entry for key, entry in self._entries.items() if entry.expire_time > now}
+                live = {key: asdict(entry) for key, entry in self._entries.items()}
+                fd, tmp_path = tempfile.mkstemp(dir=self.index_path.parent, prefix=f".{self.index_path.name}.")
+                try:
+                    with os.fdopen(fd, "w") as f:
+                        json.dump(live, f, indent=2)
+                    os.replace(tmp_path, self.index_path)
+                except BaseException:
+                    os.unlink(tmp_path)
+                    raise
+        except OSError as e:
+            logger.warning(f"Could not write context cache index '{self.index_path}': {e}")
+
+    def is_fresh(self, entry: CacheEntry) -> bool:
+        """Returns True if an entry has more than `refresh_margin` left, so it needs no refresh."""
+        return entry.expire_time - self.backend.clock() > self.refresh_margin.total_seconds()
+
+    def get_or_create(
+        self,
+        model_name: str,
+        system_instruction: Any = None,
+        tools: Optional[List[Any]] = None,
+        contents: Optional[List[Any]] = None,
+        project: Optional[str] = None,
+        location: Optional[str] = None,
+    ) -> Optional[CacheEntry]:
+        """
+        Returns a live cache entry for the prefix, creating or refreshing it as
+        needed, or None if the prefix should be sent inline. The project and
+        location default to the ones Vertex AI was initialized with.
+        """
+        tokens = self.token_counter(system_instruction=system_instruction, tools=tools, contents=contents)
+        if tokens < self.min_tokens:
+            logger.info(f"Prefix is ~{tokens} tokens, below the {self.min_tokens} token caching minimum. Sending it inline.")
+            return None
+
+        if project is None or location is None:
+            default_project, default_location = _default_scope()
+            project = project or default_project
+            location = location or default_location
+        key = prefix_key(model_name, system_instruction, tools, contents, project=project, location=location)
+        with self._lock:
+            entry = self._entries.get(key)
+            now = self.backend.clock()
+            try:
+                if entry and self.is_fresh(entry):
+                    logger.info(f"Reusing context cache '{entry.name}'.")
+                    return entry
+                if entry and entry.expire_time > now:
+                    logger.info(f"Refreshing context cache '{entry.name}' before it expires.")
+                    try:
+                        entry = self.backend.refresh(entry, self.ttl)
+                    except Exception as e:
+                        logger.warning(f"Could not refresh context cache '{entry.name}', recreating it: {e}")
+                        entry = None
+                else:
+                    entry = None
+                if entry is None:
+                    entry = self.backend.create(model_name, system_instruction, tools, contents, self.ttl)
+                    logger.info(f"Created context cache '{entry.name}' for ~{tokens} prefix tokens.")
+            except Exception as e:
+                logger.warning(f"Context caching unavailable, sending the prefix inline: {e}")
+                self._entries.pop(key, None)
+                return None
+
+            self._entries[key] = entry
+            self._save_index()
+            return entry
+
+    def model_for(self, entry: CacheEntry, **model_kwargs) -> Any:
+        """Returns a model bound to the cached content."""
+        return self.backend.model_for(entry, **model_kwargs)
+
+
+_default_manager: Optional[ContextCacheManager] = None
+
+
+def get_default_manager() -> ContextCacheManager:
+    """Returns the process-wide manager backed by Vertex AI and the on-disk index."""
+    global _default_manager
+    if _default_manager is None:
+        _default_manager = ContextCacheManager(index_path=CONTEXT_CACHE_INDEX)
+    return _default_manager
+
+
+def cached_model(
+    model_name: str,
+    system_instruction: Any = None,
+    tools: Optional[List[Any]] = None,
+    contents: Optional[List[Any]] = None,
+    manager: Optional[ContextCacheManager] = None,
+    project: Optional[str] = None,
+    location: Optional[str] = None,
+    **model_kwargs,
+) -> Optional[Any]:
+    """
+    Returns a GenerativeModel bound to a context cache holding the given
+    prefix, or None if caching is disabled, not worthwhile or unavailable.
+    Requests made with a cached model must not pass the system instruction or
+    tools again; they are part of the cache.
+    """
+    if not ENABLE_CONTEXT_CACHE and manager is None:
+        return None
+    manager = manager or get_default_manager()
+    entry = manager.get_or_create(model_name, system_instruction, tools, contents, project=project, location=location)
+    if entry is None:
+        return None
+    return manager.model_for(entry, **model_kwargs)
@@ -9,11 +9,12 @@ project_root = Path(__file__).resolve().parents[2]
 if str(project_root) not in sys.path:
     sys.path.insert(0, str(project_root))
 
-from agents.agent_base import BaseAgent
+from agents.agent_registry import get_registry
 
 agent_name = Path(__file__).parent.name
 PROJECT_ID = os.environ.get("PROJECT_ID")
 LOCATION = os.environ.get("REGION", "us-central1")
 
-root_agent = BaseAgent(agent_name=agent_name, project=PROJECT_ID, location=LOCATION)
-root_agent.setup()
\ No newline at end of file
+# The agent is set up on its first query (or when pre-warmed), so importing
+# this module for agent discovery stays cheap.
+root_agent = get_registry().get_agent(agent_name, project=PROJECT_ID, location=LOCATION)
@@ -0,0 +1,191 @@
+import logging
+from dataclasses import dataclass
+from typing import Any, Callable, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Supported compaction policies.
+POLICY_NONE = "none"
+POLICY_SLIDING_WINDOW = "sliding_window"
+POLICY_SUMMARIZE = "summarize"
+POLICIES = (POLICY_NONE, POLICY_SLIDING_WINDOW, POLICY_SUMMARIZE)
+
+SUMMARY_PROMPT = (
+    "Summarize the following earlier steps of an agent session. Keep every fact, "
+    "tool result and decision that later steps may rely on, and be concise.\n\n"
+    "{previous_summary}{turns}"
+)
+
+
+def content_text(content: Any) -> str:
+    """
+    Returns a best-effort text rendering of a conversation turn. Handles plain
+    strings, Parts and Contents (including function calls and responses).
+    """
+    if content is None:
+        return ""
+    if isinstance(content, str):
+        return content
+    parts = getattr(content, "parts", None)
+    if parts is not None:
+        return "\n".join(content_text(part) for part in parts)
+    function_call = getattr(content, "function_call", None)
+    if function_call and getattr(function_call, "name", None):
+        return f"function_call {function_call.name}({dict(function_call.args)})"
+    function_response = getattr(content, "function_response", None)
+    if function_response and getattr(function_response, "name", None):
+        return f"function_response {function_response.name}: {dict(function_response.response)}"
+    text = getattr(content, "text", None)
+    if isinstance(text, str):
+        return text
+    return str(content)
+
+
+def estimate_tokens(content: Any) -> int:
+    """Cheap token estimate (~4 characters per token), used when no counter is given."""
+    return max(1, len(content_text(content)) // 4)
+
+
+def _role(content: Any) -> str:
+    # Plain strings and Parts are sent as user input.
+    return getattr(content, "role", None) or "user"
+
+
+def _is_function_response(content: Any) -> bool:
+    parts = getattr(content, "parts", None) or [content]
+    return any(getattr(getattr(part, "function_response", None), "name", None) for part in parts)
+
+
+@dataclass
+class Turn:
+    """One entry of the conversation, with its token count."""
+
+    content: Any
+    tokens: int
+
+
+class ConversationHistory:
+    """
+    A conversation history that tracks tokens per turn and keeps the total
+    under `max_tokens` using a compaction policy:
+
+    - "none": keep everything (the previous behavior).
+    - "sliding_window": drop the oldest turns.
+    - "summarize": fold the oldest turns into a rolling summary produced by
+      `summarizer`.
+
+    The first `pinned_turns` turns (typically the task prompt) are never
+    dropped. Turns are dropped a whole exchange at a time, and a function call
+    is always dropped together with its function response, so the remaining
+    history stays valid for the model. `summary_turn_factory` turns the summary
+    text into one turn or a list of turns to place after the pinned turns.
+    """
+
+    def __init__(
+        self,
+        policy: str = POLICY_SLIDING_WINDOW,
+        max_tokens: int = 32000,
+        pinned_turns: int = 1,
+        min_recent_turns: int = 2,
+        token_counter: Optional[Callable[[Any], int]] = None,
+        summarizer: Optional[Callable[[str], str]] = None,
+        summary_turn_factory: Optional[Callable[[str], Any]] = None,
+    ):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown history policy '{policy}'. Supported policies are: {POLICIES}")
+        if policy == POLICY_SUMMARIZE and summarizer is None:
+            raise ValueError("The 'summarize' history policy requires a summarizer.")
+
+        self.policy = policy
+        self.max_tokens = max_tokens
+        self.pinned_turns = pinned_turns
+        self.min_recent_turns = min_recent_turns
+        self.token_counter = token_counter or estimate_tokens
+        self.summarizer = summarizer
+        self.summary_turn_factory = summary_turn_factory or (lambda text: text)
+
+        self.turns: List[Turn] = []
+        self.summary: str = ""
+        self.summary_tokens: int = 0
+        self.dropped_turns: int = 0
+
+    def __len__(self) -> int:
+        return len(self.turns)
+
+    @property
+    def total_tokens(self) -> int:
+        return sum(turn.tokens for turn in self.turns) + self.summary_tokens
+
+    def append(self, content: Any, tokens: Optional[int] = None) -> None:
+        """Adds a turn and compacts the history if it is over budget."""
+        if tokens is None:
+            tokens = self.token_counter(content)
+        self.turns.append(Turn(content=content, tokens=tokens))
+        self.compact()
+
+    def extend(self, contents: List[Any]) -> None:
+        for content in contents:
+            self.append(content)
+
+    def contents(self) -> List[Any]:
+        """Returns the compacted contents to send to the model."""
+        pinned = [turn.content for turn in self.turns[: self.pinned_turns]]
+        rest = [turn.content for turn in self.turns[self.pinned_turns :]]
+        if not self.summary:
+            return pinned + rest
+        summary_turns = self.summary_turn_factory(self.summary)
+        if not isinstance(summary_turns, list):
+            summary_turns = [summary_turns]
+        return pinned + summary_turns + rest
+
+    def _oldest_droppable_group(self) -> int:
+        """Returns how many turns from the first unpinned one must be dropped together."""
+        start = self.pinned_turns
+        if len(self.turns) <= start:
+            # Only pinned turns are left (they may be over budget on their own).
+            return 0
+        end = start + 1
+        # Drop whole exchanges: stop at the next turn with the same role as the
+        # first one, but never leave a function response without its call.
+        start_role = _role(self.turns[start].content)
+        while end < len(self.turns) and (
+            _role(self.turns[end].content) != start_role or _is_function_response(self.turns[end].content)
+        ):
+            end += 1
+        if len(self.turns) - end < self.min_recent_turns:
+            return 0
+        return end - start
+
+    def compact(self) -> bool:
+        """Applies the policy until the history fits. Returns True if anything changed."""
+        if self.policy == POLICY_NONE or self.total_tokens <= self.max_tokens:
+            return False
+
+        dropped: List[Turn] = []
+        while self.total_tokens > self.max_tokens:
+            group_size = self._oldest_droppable_group()
+            if not group_size:
+                break
+            dropped.extend(self.turns[self.pinned_turns : self.pinned_turns + group_size])
+            del self.turns[self.pinned_turns : self.pinned_turns + group_size]
+
+        if not dropped:
+            logger.debug(f"History is {self.total_tokens} tokens, over the {self.max_tokens} budget, but no turns can be dropped.")
+            return False
+
+        self.dropped_turns += len(dropped)
+        if self.policy == POLICY_SUMMARIZE:
+            self._summarize(dropped)
+        logger.info(f"Compacted history with policy '{self.policy}': dropped {len(dropped)} turns, now {self.total_tokens} tokens.")
+        return True
+
+    def _summarize(self, dropped: List[Turn]) -> None:
+        previous = f"Summary so far:\n{self.summary}\n\n" if self.summary else ""
+        turns_text = "\n\n".join(content_text(turn.content) for turn in dropped)
+        try:
+            self.summary = self.summarizer(SUMMARY_PROMPT.format(previous_summary=previous, turns=turns_text)).strip()
+        except Exception as e:
+            # Fall back to a sliding window rather than failing the agent step.
+            logger.warning(f"History summarization failed, keeping the previous summary: {e}")
+            return
+        self.summary_tokens = self.token_counter(self.summary)
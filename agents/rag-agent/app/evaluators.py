@@ -5,59 +5,70 @@ from google.adk.evaluation.trajectory_evaluator import TrajectoryEvaluator
 from google.adk.models import Gemini
 from google.adk.agents import Agent
 
+from app.utils.groundedness import GroundednessJudge
+from app.utils.text_matching import compile_reference
+
 
 class Groundedness(Evaluator):
     """
     A custom evaluator to check if the agent's response is grounded in the
     provided context. This is crucial for RAG agents.
+
+    Scoring is done by a GroundednessJudge, which batches the claim-level
+    checks of long contexts into concurrent judge calls and caches results.
+    `evaluate_batch` scores a whole set of test cases with shared judge calls.
     """
 
-    def __init__(self, llm: Gemini):
-        self._llm = llm
+    def __init__(
+        self,
+        llm: Gemini,
+        batch_size: int = 5,
+        max_concurrency: int = 4,
+        max_context_chars: int = 8000,
+    ):
+        self._judge = GroundednessJudge(
+            llm,
+            batch_size=batch_size,
+            max_concurrency=max_concurrency,
+            max_context_chars=max_context_chars,
+        )
 
     def evaluate(self, agent: Agent, test_case: dict) -> list[EvalMetricResult]:
-        response = test_case.get("output", {}).get("response")
-        # For RAG, context is often part of the output
-        context = test_case.get("output", {}).get("context")
-
-        if not response or not context:
-            return [EvalMetricResult(name="groundedness", value=0.0, rationale="Missing response or context for evaluation.")]
-
-        prompt = f"""
-        You are an expert evaluator. Your task is to determine if the 'Response' is factually supported by the 'Context'.
-        A response is considered grounded if all claims it makes can be verified from the information present in the context.
-
-        - Score 1.0 if the response is fully supported by the context.
-        - Score 0.0 if the response contains information not found in the context.
-        - Score 0.5 for partially supported responses.
-
-        Provide a brief rationale for your score.
-        Format your output as a JSON object with "score" and "rationale" keys.
-
-        Context:
-        {context}
-
-        Response:
-        {response}
-        """
-        eval_response = self._llm.predict(prompt)
-
-        try:
-            result = eval_response.json()
-            score = float(result.get("score", 0.0))
-            rationale = result.get("rationale", "Could not parse rationale from LLM.")
-        except (ValueError, AttributeError):
-            score = 0.0
-            rationale = "Failed to parse evaluation response from LLM."
-
-        return [EvalMetricResult(name="groundedness", value=score, rationale=rationale)]
+        return self.evaluate_batch(agent, [test_case])[0]
+
+    def evaluate_batch(self, agent: Agent, test_cases: list[dict]) -> list[list[EvalMetricResult]]:
+        """Evaluates several test cases, sharing judge calls between them."""
+        pairs = {}
+        for index, test_case in enumerate(test_cases):
+            response = test_case.get("output", {}).get("response")
+            # For RAG, context is often part of the output
+            context = test_case.get("output", {}).get("context")
+            if response and context:
+                pairs[index] = (response, context)
+        scores = dict(zip(pairs, self._judge.score_many(list(pairs.values()))))
+
+        results = []
+        for index in range(len(test_cases)):
+            if index not in scores:
+                results.append([EvalMetricResult(name="groundedness", value=0.0, rationale="Missing response or context for evaluation.")])
+                continue
+            score, rationale = scores[index]
+            results.append([EvalMetricResult(name="groundedness", value=score, rationale=rationale)])
+        return results
 
 
 class ContainsWords(Evaluator):
     """
     A custom evaluator to check if the agent's response contains specific words.
+
+    Reference words are compiled once and cached across test cases. With
+    `whole_word=True`, "cat" does not count as present in "concatenate".
     """
 
+    def __init__(self, whole_word: bool = False, ignore_case: bool = False):
+        self._whole_word = whole_word
+        self._ignore_case = ignore_case
+
     def evaluate(self, agent: Agent, test_case: dict) -> list[EvalMetricResult]:
         response = test_case.get("response", "")
         ground_truth = test_case.get("ground_truth", {})
@@ -72,8 +83,8 @@ class ContainsWords(Evaluator):
         if not expected_words_str:
             return [EvalMetricResult(name="contains_words", value=0.0, rationale="No reference words provided for evaluation.")]
 
-        words_to_check = [word.strip() for word in expected_words_str.split(' ') if word.strip()]
-        contains_all_words = all(word in response for word in words_to_check)
+        matcher = compile_reference(expected_words_str, self._whole_word, self._ignore_case)
+        contains_all_words = matcher.contains_all(response)
 
         actual_score = 1.0 if contains_all_words else 0.0
         expected_score = ground_truth.get("contains_words_expected_value", 0.0)
@@ -0,0 +1,245 @@
+"""
+Batched, cached LLM-judge scoring of response groundedness.
+
+Shared by the Groundedness evaluator of the rag-agent app and the one in the
+repository root `evaluators.py`, which only wrap the (score, rationale) pair
+in their framework's metric type.
+"""
+
+import hashlib
+import json
+import logging
+import re
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+logger = logging.getLogger(__name__)
+
+
+# Judge prompt for a batch of (context, claim) items. The judge returns one
+# JSON result per item so several checks share a single round trip.
+GROUNDEDNESS_BATCH_PROMPT = """
+You are an expert evaluator. For each item below, determine if the 'Response' is factually supported by the 'Context'.
+A response is considered grounded if all claims it makes can be verified from the information present in the context.
+
+- Score 1.0 if the response is fully supported by the context.
+- Score 0.0 if the response contains information not found in the context.
+- Score 0.5 for partially supported responses.
+
+Provide a brief rationale for each score.
+Format your output as a JSON array with one object per item, each with "id", "score" and "rationale" keys.
+"id" must be the item id given below as a bare integer, e.g. 0, not "Item 0".
+
+{items}
+"""
+
+SENTENCE_PATTERN = re.compile(r"(?<=[.!?])\s+")
+WORD_PATTERN = re.compile(r"\w+")
+
+
+def _split_claims(response: str) -> list[str]:
+    """Splits a response into sentence-level claims."""
+    return [claim.strip() for claim in SENTENCE_PATTERN.split(response) if claim.strip()]
+
+
+def _split_passages(context: str, max_chars: int) -> list[str]:
+    """Splits a context into paragraph passages no longer than max_chars."""
+    passages = []
+    for paragraph in re.split(r"\n\s*\n", context):
+        paragraph = paragraph.strip()
+        while len(paragraph) > max_chars:
+            passages.append(paragraph[:max_chars])
+            paragraph = paragraph[max_chars:]
+        if paragraph:
+            passages.append(paragraph)
+    return passages
+
+
+def _select_context(claim: str, passages: list[str], max_chars: int) -> str:
+    """Picks the passages with the most word overlap with a claim, within max_chars."""
+    claim_words = set(WORD_PATTERN.findall(claim.lower()))
+    ranked = sorted(
+        range(len(passages)),
+        key=lambda i: len(claim_words.intersection(WORD_PATTERN.findall(passages[i].lower()))),
+        reverse=True,
+    )
+    selected, used = [], 0
+    for i in ranked:
+        if used + len(passages[i]) > max_chars:
+            continue
+        selected.append(i)
+        used += len(passages[i])
+    # Keep the original document order so the judge reads coherent context.
+    return "\n\n".join(passages[i] for i in sorted(selected))
+
+
+def _parse_judge_results(eval_response) -> list[dict]:
+    """Parses the judge output into a list of result dicts."""
+    try:
+        result = eval_response.json()
+    except (ValueError, AttributeError):
+        text = getattr(eval_response, "text", eval_response)
+        if not isinstance(text, str):
+            raise ValueError("Judge response has no JSON or text payload.")
+        text = re.sub(r"^\s*```\w*\s*|\s*```\s*$", "", text)
+        result = json.loads(text)
+    if isinstance(result, dict):
+        result = result.get("results", [result])
+    if not isinstance(result, list):
+        raise ValueError("Judge response is not a JSON array.")
+    return result
+
+
+def _parse_item_id(value) -> int:
+    """Reads an item id, tolerating judges that echo it as "Item 3"."""
+    if isinstance(value, int):
+        return value
+    match = re.search(r"\d+", str(value))
+    if match is None:
+        raise ValueError(f"Invalid item id {value!r}.")
+    return int(match.group())
+
+
+class GroundednessJudge:
+    """
+    Scores whether a response is grounded in a context with an LLM judge.
+
+    Several (context, claim) checks are scored per judge call, and judge calls
+    run concurrently up to `max_concurrency`. Contexts longer than
+    `max_context_chars` are checked claim by claim against only the most
+    relevant passages, so large RAG contexts stay within the judge's input
+    budget. `score_many` packs the checks of several (response, context)
+    pairs, e.g. all test cases of an eval run, into the same judge calls.
+    Scored checks are cached by content hash in an LRU cache of
+    `max_cache_entries`. Failed or unanswered checks are not cached, so they
+    are retried by the next evaluation.
+    """
+
+    def __init__(
+        self,
+        llm,
+        batch_size: int = 5,
+        max_concurrency: int = 4,
+        max_context_chars: int = 8000,
+        max_cache_entries: int = 10000,
+    ):
+        self._llm = llm
+        self._batch_size = max(1, batch_size)
+        self._max_concurrency = max(1, max_concurrency)
+        self._max_context_chars = max_context_chars
+        self._max_cache_entries = max_cache_entries
+        self._cache: OrderedDict[str, tuple[float, str]] = OrderedDict()
+        self._cache_lock = threading.Lock()
+
+    def _build_items(self, response: str, context: str) -> list[tuple[str, str]]:
+        """Returns the (context, claim) checks needed for one response."""
+        if len(context) <= self._max_context_chars:
+            return [(context, response)]
+        passages = _split_passages(context, self._max_context_chars)
+        return [
+            (_select_context(claim, passages, self._max_context_chars), claim)
+            for claim in _split_claims(response)
+        ]
+
+    @staticmethod
+    def _item_key(item: tuple[str, str]) -> str:
+        context, claim = item
+        return hashlib.sha256(f"{context}\x00{claim}".encode("utf-8")).hexdigest()
+
+    def _cache_get(self, key: str) -> tuple[float, str] | None:
+        with self._cache_lock:
+            scored = self._cache.get(key)
+            if scored is not None:
+                self._cache.move_to_end(key)
+            return scored
+
+    def _cache_put(self, scored: dict[str, tuple[float, str]]) -> None:
+        with self._cache_lock:
+            self._cache.update(scored)
+            while len(self._cache) > self._max_cache_entries:
+                self._cache.popitem(last=False)
+
+    def _judge_batch(self, batch: list[tuple[str, tuple[str, str]]]) -> dict[str, tuple[float, str]]:
+        """Scores one batch of items with a single judge call. Returns only the items the judge scored."""
+        rendered = "\n\n".join(
+            f"Item id: {i}\nContext:\n{context}\n\nResponse:\n{claim}"
+            for i, (_, (context, claim)) in enumerate(batch)
+        )
+        try:
+            results = _parse_judge_results(self._llm.predict(GROUNDEDNESS_BATCH_PROMPT.format(items=rendered)))
+        except Exception as e:
+            logger.warning(f"Groundedness judge call failed: {e}")
+            return {}
+
+        scored = {}
+        for position, result in enumerate(results):
+            try:
+                index = _parse_item_id(result.get("id", position))
+                key = batch[index][0]
+                scored[key] = (
+                    float(result.get("score", 0.0)),
+                    result.get("rationale", "Could not parse rationale from LLM."),
+                )
+            except (ValueError, TypeError, IndexError, AttributeError):
+                continue
+        return scored
+
+    def score(self, response: str, context: str) -> tuple[float, str]:
+        """Returns the groundedness score of a response in a context, with a rationale."""
+        return self.score_many([(response, context)])[0]
+
+    def score_many(self, pairs: list[tuple[str, str]]) -> list[tuple[float, str]]:
+        """Scores several (response, context) pairs, e.g. the test cases of an eval run.
+
+        The checks of all pairs are packed into shared judge calls of
+        `batch_size` items, which run concurrently up to `max_concurrency`,
+        and a check that several pairs need is judged once.
+
+        Returns:
+            The (score, rationale) of each pair, in order
+        """
+        pair_keys: list[list[str]] = []
+        scored: dict[str, tuple[float, str]] = {}
+        pending: dict[str, tuple[str, str]] = {}
+        for response, context in pairs:
+            keys = []
+            for item in self._build_items(response, context):
+                key = self._item_key(item)
+                keys.append(key)
+                if key in scored or key in pending:
+                    continue
+                cached = self._cache_get(key)
+                if cached is not None:
+                    scored[key] = cached
+                else:
+                    pending[key] = item
+            pair_keys.append(keys)
+
+        pending_items = list(pending.items())
+        batches = [
+            pending_items[start : start + self._batch_size]
+            for start in range(0, len(pending_items), self._batch_size)
+        ]
+        if batches:
+            with ThreadPoolExecutor(max_workers=min(self._max_concurrency, len(batches))) as executor:
+                for judged in executor.map(self._judge_batch, batches):
+                    self._cache_put(judged)
+                    scored.update(judged)
+
+        return [self._aggregate([scored.get(key) for key in keys]) for keys in pair_keys]
+
+    @staticmethod
+    def _aggregate(results: list[tuple[float, str] | None]) -> tuple[float, str]:
+        """Combines the claim-level results of one pair into its score and rationale."""
+        if not results:
+            return 0.0, "No claims found in response."
+        results = [
+            result if result is not None else (0.0, "Failed to get an evaluation from the LLM for this item.")
+            for result in results
+        ]
+        score = sum(item_score for item_score, _ in results) / len(results)
+        if len(results) == 1:
+            return score, results[0][1]
+        weakest = min(results, key=lambda x: x[0])
+        return score, f"Mean of {len(results)} claim-level checks. Weakest claim: {weakest[1]}"
@@ -0,0 +1,144 @@
+"""
+Fast "contains words" matching for evaluation metrics.
+
+Used by the ContainsWords evaluator and by .scripts/eval_agent.py, and
+benchmarked by .scripts/text_matching_benchmark.py. Each reference string is
+compiled once into a `WordMatcher` (cached by reference and options), so a
+large eval set pays the reference parsing cost once per distinct reference
+rather than once per row.
+
+By default a word matches anywhere in the response, as `word in response`
+always did. Whole-word matching is opt-in: it checks word boundaries around
+each hit, so "cat" does not match inside "concatenate". Matching can also be
+made case-insensitive.
+
+A whole-word reference of many words is checked in a single pass: the
+response is split into a set of words once and each reference word is a set
+lookup, instead of one scan of the response per word. Short references keep
+one C-level substring scan per word, which a tokenizing pass can't beat.
+"""
+
+import re
+import string
+from functools import lru_cache
+from typing import List, Sequence
+
+# Whole-word references with at least this many words are checked against
+# the word set of the response instead of scanning it once per word.
+TOKEN_SET_MIN_WORDS = 40
+# Reference words scanned for before the word set is built, so that most
+# failing rows are still rejected without tokenizing the response.
+TOKEN_SET_PRECHECK_WORDS = 8
+
+_TOKEN_PATTERN = re.compile(r"\w+")
+_ASCII_WORD_BYTES = frozenset((string.ascii_letters + string.digits + "_").encode("ascii"))
+# Maps every ASCII non-word byte to a space, so an ASCII text is tokenized by
+# bytes.translate() and split() without the regex engine.
+_ASCII_TOKEN_TABLE = bytes(c if c in _ASCII_WORD_BYTES else ord(" ") for c in range(256))
+
+
+def _is_word_char(char: str) -> bool:
+    """Mirrors the regex `\\w` class used for word boundaries."""
+    return char.isalnum() or char == "_"
+
+
+def _find_whole_word(haystack: str, word: str) -> bool:
+    """Returns True if `word` occurs in `haystack` with no word characters on either side."""
+    end_offset = len(word)
+    index = haystack.find(word)
+    while index != -1:
+        before_ok = index == 0 or not _is_word_char(haystack[index - 1])
+        after = index + end_offset
+        after_ok = after == len(haystack) or not _is_word_char(haystack[after])
+        if before_ok and after_ok:
+            return True
+        index = haystack.find(word, index + 1)
+    return False
+
+
+def _tokens(haystack: str) -> set:
+    """Returns the set of maximal runs of word characters of a text, as UTF-8 bytes."""
+    if haystack.isascii():
+        return set(haystack.encode("ascii").translate(_ASCII_TOKEN_TABLE).split())
+    return {token.encode("utf-8") for token in _TOKEN_PATTERN.findall(haystack)}
+
+
+class WordMatcher:
+    """
+    A compiled matcher for the space-separated words of one reference string.
+
+    Args:
+        reference: Space-separated words that must all appear in a response.
+        whole_word: If True, "cat" does not match inside "concatenate".
+            Defaults to plain substring matching.
+        ignore_case: If True, matching is case-insensitive.
+    """
+
+    def __init__(self, reference: str, whole_word: bool = False, ignore_case: bool = False):
+        self.reference = reference
+        self.whole_word = whole_word
+        self.ignore_case = ignore_case
+
+        words = [word.strip() for word in reference.split(" ") if word.strip()]
+        # Deduplicate while preserving order, and check the longest (rarest)
+        # words first so failing rows are rejected as early as possible.
+        unique_words = list(dict.fromkeys(self._normalize(word) for word in words))
+        self.words: List[str] = sorted(unique_words, key=len, reverse=True)
+        # Words made only of word characters can be looked up in the word set
+        # of a response; the others (e.g. "U.S.") are always scanned for.
+        self._token_words = [word.encode("utf-8") for word in self.words if _TOKEN_PATTERN.fullmatch(word)]
+        self._other_words = [word for word in self.words if not _TOKEN_PATTERN.fullmatch(word)]
+        self._single_pass = whole_word and len(self._token_words) >= TOKEN_SET_MIN_WORDS
+
+    def _normalize(self, text: str) -> str:
+        return text.casefold() if self.ignore_case else text
+
+    def _contains(self, haystack: str, word: str) -> bool:
+        if self.whole_word:
+            return _find_whole_word(haystack, word)
+        return word in haystack
+
+    def contains_all(self, response: str) -> bool:
+        """Returns True if every reference word appears in the response."""
+        haystack = self._normalize(response or "")
+        if not self._single_pass:
+            return all(self._contains(haystack, word) for word in self.words)
+        if not all(self._contains(haystack, word) for word in self.words[:TOKEN_SET_PRECHECK_WORDS]):
+            return False
+        tokens = _tokens(haystack)
+        return all(word in tokens for word in self._token_words) and all(
+            _find_whole_word(haystack, word) for word in self._other_words
+        )
+
+
+@lru_cache(maxsize=4096)
+def compile_reference(reference: str, whole_word: bool = False, ignore_case: bool = False) -> WordMatcher:
+    """Returns a cached `WordMatcher` for the given reference and options."""
+    return WordMatcher(reference, whole_word=whole_word, ignore_case=ignore_case)
+
+
+def contains_words_score(
+    response: str, reference: str, whole_word: bool = False, ignore_case: bool = False
+) -> float:
+    """Scores a single row: 1.0 if the response contains every reference word, else 0.0."""
+    if not response or not reference:
+        return 0.0
+    matcher = compile_reference(reference, whole_word, ignore_case)
+    if not matcher.words:
+        return 0.0
+    return 1.0 if matcher.contains_all(response) else 0.0
+
+
+def score_contains_words_batch(
+    responses: Sequence[str],
+    references: Sequence[str],
+    whole_word: bool = False,
+    ignore_case: bool = False,
+) -> List[float]:
+    """Scores aligned lists of responses and references."""
+    if len(responses) != len(references):
+        raise ValueError(f"Got {len(responses)} responses but {len(references)} references.")
+    return [
+        contains_words_score(response, reference, whole_word, ignore_case)
+        for response, reference in zip(responses, references)
+    ]
@@ -0,0 +1,86 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+
+from app.utils.groundedness import GroundednessJudge
+
+
+class StubResponse:
+    def __init__(self, text: str) -> None:
+        self.text = text
+
+    def json(self) -> list:
+        return json.loads(self.text)
+
+
+class StubJudge:
+    """Answers every item with score 1.0, echoing ids as "Item N"."""
+
+    def __init__(self, fail: bool = False) -> None:
+        self.fail = fail
+        self.calls = 0
+
+    def predict(self, prompt: str) -> StubResponse:
+        self.calls += 1
+        if self.fail:
+            return StubResponse("not json")
+        items = prompt.count("Item id:")
+        return StubResponse(
+            json.dumps([{"id": f"Item {i}", "score": 1.0, "rationale": "ok"} for i in range(items)])
+        )
+
+
+def test_scores_are_cached() -> None:
+    llm = StubJudge()
+    judge = GroundednessJudge(llm)
+    assert judge.score("The sky is blue.", "The sky is blue.") == (1.0, "ok")
+    assert judge.score("The sky is blue.", "The sky is blue.") == (1.0, "ok")
+    assert llm.calls == 1
+
+
+def test_failures_are_not_cached() -> None:
+    llm = StubJudge(fail=True)
+    judge = GroundednessJudge(llm)
+    score, _ = judge.score("The sky is blue.", "The sky is blue.")
+    assert score == 0.0
+    llm.fail = False
+    assert judge.score("The sky is blue.", "The sky is blue.") == (1.0, "ok")
+    assert llm.calls == 2
+
+
+def test_long_context_claims_share_a_judge_call() -> None:
+    llm = StubJudge()
+    judge = GroundednessJudge(llm, batch_size=5, max_context_chars=100)
+    context = "\n\n".join(f"Paragraph {i} about the sky and the sea." for i in range(20))
+    score, rationale = judge.score("The sky is blue. The sea is wide. Fish swim.", context)
+    assert score == 1.0
+    assert rationale.startswith("Mean of 3 claim-level checks")
+    assert llm.calls == 1
+
+
+def test_cache_is_bounded() -> None:
+    judge = GroundednessJudge(StubJudge(), max_cache_entries=2)
+    for i in range(5):
+        judge.score(f"Claim {i}.", "Context.")
+    assert len(judge._cache) == 2
+
+
+def test_score_many_shares_judge_calls_between_pairs() -> None:
+    llm = StubJudge()
+    judge = GroundednessJudge(llm, batch_size=5)
+    pairs = [(f"Claim {i}.", f"Context {i}.") for i in range(10)] + [("Claim 0.", "Context 0.")]
+    results = judge.score_many(pairs)
+    assert results == [(1.0, "ok")] * 11
+    assert llm.calls == 2
@@ -0,0 +1,76 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from app.utils.text_matching import (
+    TOKEN_SET_MIN_WORDS,
+    compile_reference,
+    contains_words_score,
+    score_contains_words_batch,
+)
+
+
+def test_substring_matching_is_the_default() -> None:
+    """Without whole_word, words match inside longer words, as `in` does."""
+    assert contains_words_score("Use concatenate here.", "cat") == 1.0
+
+
+def test_whole_word_rejects_matches_inside_words() -> None:
+    assert contains_words_score("Use concatenate here.", "cat", whole_word=True) == 0.0
+    assert contains_words_score("The cat sat.", "cat", whole_word=True) == 1.0
+
+
+def test_whole_word_boundaries() -> None:
+    """Punctuation and string edges are boundaries; letters, digits and _ are not."""
+    assert contains_words_score("cat", "cat", whole_word=True) == 1.0
+    assert contains_words_score("(cat)", "cat", whole_word=True) == 1.0
+    assert contains_words_score("cat_food", "cat", whole_word=True) == 0.0
+    assert contains_words_score("cat2", "cat", whole_word=True) == 0.0
+    assert contains_words_score("Visit the U.S. today", "U.S.", whole_word=True) == 1.0
+
+
+def test_whole_word_finds_a_later_occurrence() -> None:
+    """A rejected first hit does not stop the search."""
+    assert contains_words_score("concatenate the cat", "cat", whole_word=True) == 1.0
+
+
+def test_ignore_case() -> None:
+    assert contains_words_score("ALICE met the Rabbit", "alice rabbit") == 0.0
+    assert contains_words_score("ALICE met the Rabbit", "alice rabbit", ignore_case=True) == 1.0
+
+
+def test_all_words_are_required() -> None:
+    assert contains_words_score("Alice met the rabbit", "Alice Queen") == 0.0
+    assert contains_words_score("", "Alice") == 0.0
+    assert contains_words_score("Alice", "   ") == 0.0
+
+
+def test_compile_reference_is_cached_per_options() -> None:
+    assert compile_reference("Alice rabbit") is compile_reference("Alice rabbit")
+    assert compile_reference("Alice rabbit") is not compile_reference("Alice rabbit", True)
+
+
+def test_score_batch() -> None:
+    assert score_contains_words_batch(["a cat", "a dog"], ["cat", "cat"]) == [1.0, 0.0]
+
+
+def test_long_whole_word_references_match_like_short_ones() -> None:
+    """References long enough for the single-pass word set score the same way."""
+    words = [f"word{i}" for i in range(TOKEN_SET_MIN_WORDS)]
+    reference = " ".join([*words, "U.S.", "cat"])
+    response = "Visit the U.S. with a cat: " + ", ".join(words)
+    assert contains_words_score(response, reference, whole_word=True) == 1.0
+    assert contains_words_score(response.replace(" cat", " concatenate"), reference, whole_word=True) == 0.0
+    assert contains_words_score(response.replace("word7,", "word7x,"), reference, whole_word=True) == 0.0
+    assert contains_words_score(response.upper(), reference, whole_word=True, ignore_case=True) == 1.0
+    assert contains_words_score(response.upper(), reference, whole_word=True) == 0.0
@@ -0,0 +1,119 @@
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Any, Callable, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Session pool defaults (from environment).
+AGENT_MAX_SESSIONS = int(os.environ.get("AGENT_MAX_SESSIONS", "256"))
+AGENT_SESSION_TTL_SECONDS = int(os.environ.get("AGENT_SESSION_TTL_SECONDS", "1800"))
+
+DEFAULT_SESSION_ID = "default"
+
+# The session id of the request being served. The web server sets it from the
+# request body, so agent queries made while serving the request use that
+# session without every caller having to pass it through.
+current_session_id: ContextVar[Optional[str]] = ContextVar("current_session_id", default=None)
+
+
+@contextmanager
+def session_scope(session_id: Optional[str]) -> Iterator[None]:
+    """Makes `session_id` the current session for agent queries made inside the block."""
+    token = current_session_id.set(session_id)
+    try:
+        yield
+    finally:
+        current_session_id.reset(token)
+
+
+def resolve_session_id(session_id: Optional[str] = None) -> str:
+    """Returns the given session id, else the current request's, else the default one."""
+    return session_id or current_session_id.get() or DEFAULT_SESSION_ID
+
+
+@dataclass
+class AgentSession:
+    """One user's chat session with an agent, and the lock that serializes its turns."""
+
+    session_id: str
+    chat: Any = None
+    history: Any = None
+    # The model the chat was started from, so a rebuilt model can be picked up.
+    model: Any = None
+    last_used: float = 0.0
+    lock: threading.Lock = field(default_factory=threading.Lock)
+
+
+class SessionPool:
+    """
+    A bounded pool of chat sessions keyed by session_id.
+
+    Sessions idle for longer than `ttl_seconds` are evicted, and when more than
+    `max_sessions` are open the least recently used idle ones are evicted first.
+    A session whose lock is held (a turn is in flight) is never evicted.
+    """
+
+    def __init__(
+        self,
+        max_sessions: int = AGENT_MAX_SESSIONS,
+        ttl_seconds: float = AGENT_SESSION_TTL_SECONDS,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        if max_sessions < 1:
+            raise ValueError("max_sessions must be at least 1.")
+        self.max_sessions = max_sessions
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self._sessions: "OrderedDict[str, AgentSession]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.evicted = 0
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def __contains__(self, session_id: str) -> bool:
+        return session_id in self._sessions
+
+    def get(self, session_id: str) -> AgentSession:
+        """Returns the session for an id, creating it if needed, and marks it as recently used."""
+        with self._lock:
+            now = self.clock()
+            session = self._sessions.get(session_id)
+            if session is None:
+                session = AgentSession(session_id=session_id)
+                self._sessions[session_id] = session
+            session.last_used = now
+            self._sessions.move_to_end(session_id)
+            self._evict(now, keep=session_id)
+            return session
+
+    def discard(self, session_id: str) -> bool:
+        """Forgets a session. Returns True if it existed."""
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def clear(self) -> None:
+        with self._lock:
+            self._sessions.clear()
+
+    def sessions(self) -> List[AgentSession]:
+        with self._lock:
+            return list(self._sessions.values())
+
+    def _evict(self, now: float, keep: Optional[str] = None) -> None:
+        # Sessions are ordered from least to most recently used.
+        for session_id, session in list(self._sessions.items()):
+            if session_id == keep or session.lock.locked():
+                continue
+            expired = now - session.last_used > self.ttl_seconds
+            if not expired and len(self._sessions) <= self.max_sessions:
+                break
+            del self._sessions[session_id]
+            self.evicted += 1
+            logger.debug(f"Evicted {'idle' if expired else 'least recently used'} session '{session_id}'.")
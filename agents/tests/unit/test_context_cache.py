@@ -0,0 +1,131 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import json
+from datetime import timedelta
+from pathlib import Path
+
+from agents import context_cache
+
+INSTRUCTION = "You are a helpful assistant. " * 100
+
+
+class FakeClock:
+    def __init__(self) -> None:
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def make_manager(clock: FakeClock, index_path: Path | None = None) -> context_cache.ContextCacheManager:
+    return context_cache.ContextCacheManager(
+        backend=context_cache.LocalCacheBackend(clock=clock),
+        min_tokens=10,
+        ttl=timedelta(seconds=600),
+        refresh_margin=timedelta(seconds=60),
+        index_path=str(index_path) if index_path else None,
+    )
+
+
+def get(manager, **kwargs):
+    kwargs.setdefault("project", "my-project")
+    kwargs.setdefault("location", "us-central1")
+    return manager.get_or_create("gemini-2.0-flash", system_instruction=INSTRUCTION, **kwargs)
+
+
+def test_creates_then_reuses_an_entry() -> None:
+    clock = FakeClock()
+    manager = make_manager(clock)
+    first = get(manager)
+    clock.now += 100
+    assert get(manager) == first
+    assert manager.backend.created == 1
+    assert manager.backend.refreshed == 0
+
+
+def test_refreshes_an_entry_close_to_expiry() -> None:
+    clock = FakeClock()
+    manager = make_manager(clock)
+    first = get(manager)
+    clock.now += 580
+    refreshed = get(manager)
+    assert refreshed.name == first.name
+    assert refreshed.expire_time == clock.now + 600
+    assert manager.backend.created == 1
+    assert manager.backend.refreshed == 1
+
+
+def test_recreates_an_expired_entry() -> None:
+    clock = FakeClock()
+    manager = make_manager(clock)
+    first = get(manager)
+    clock.now += 601
+    recreated = get(manager)
+    assert recreated.name != first.name
+    assert manager.backend.created == 2
+    assert manager.backend.refreshed == 0
+
+
+def test_small_prefixes_are_sent_inline() -> None:
+    manager = make_manager(FakeClock())
+    assert manager.get_or_create("gemini-2.0-flash", system_instruction="Hi.") is None
+    assert manager.backend.created == 0
+
+
+def test_entries_are_scoped_by_project_and_location() -> None:
+    manager = make_manager(FakeClock())
+    first = get(manager)
+    assert get(manager, project="other-project") != first
+    assert get(manager, location="europe-west4") != first
+    assert manager.backend.created == 3
+
+
+def test_prefix_key_includes_project_and_location() -> None:
+    key = context_cache.prefix_key("gemini-2.0-flash", INSTRUCTION, project="a", location="us-central1")
+    assert key != context_cache.prefix_key("gemini-2.0-flash", INSTRUCTION, project="b", location="us-central1")
+    assert key != context_cache.prefix_key("gemini-2.0-flash", INSTRUCTION, project="a", location="europe-west4")
+
+
+def test_index_is_shared_between_managers(tmp_path: Path) -> None:
+    clock = FakeClock()
+    index_path = tmp_path / "index.json"
+    first = get(make_manager(clock, index_path))
+    other = make_manager(clock, index_path)
+    assert get(other) == first
+    assert other.backend.created == 0
+
+
+def test_saving_the_index_keeps_entries_written_by_others(tmp_path: Path) -> None:
+    clock = FakeClock()
+    index_path = tmp_path / "index.json"
+    # Both managers load the (empty) index before either of them writes it.
+    one = make_manager(clock, index_path)
+    two = make_manager(clock, index_path)
+    get(one, project="one")
+    get(two, project="two")
+
+    assert len(json.loads(index_path.read_text())) == 2
+    assert [p.name for p in tmp_path.iterdir() if p.name.startswith(".")] == []
+
+
+def test_saving_the_index_drops_expired_entries(tmp_path: Path) -> None:
+    clock = FakeClock()
+    index_path = tmp_path / "index.json"
+    manager = make_manager(clock, index_path)
+    get(manager, project="old")
+    clock.now += 601
+    get(manager, project="new")
+
+    assert len(json.loads(index_path.read_text())) == 1
@@ -0,0 +1,49 @@
+# Copyright 2025 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from agents.history import ConversationHistory
+
+
+class Content:
+    def __init__(self, role: str, text: str) -> None:
+        self.role = role
+        self.text = text
+
+
+def test_pinned_turn_over_budget_is_kept() -> None:
+    history = ConversationHistory(max_tokens=10)
+    history.append("x" * 400)
+    assert history.contents() == ["x" * 400]
+    assert history.dropped_turns == 0
+
+
+def test_pinned_turn_over_budget_still_drops_old_turns() -> None:
+    history = ConversationHistory(max_tokens=10, min_recent_turns=2)
+    history.append("x" * 400)
+    for i in range(4):
+        history.append(Content("user" if i % 2 == 0 else "model", f"turn {i}"))
+    assert [turn.content.text for turn in history.turns[1:]] == ["turn 2", "turn 3"]
+    assert history.dropped_turns == 2
+
+
+def test_group_over_budget_is_dropped_whole() -> None:
+    history = ConversationHistory(max_tokens=50, min_recent_turns=2)
+    history.append("task")
+    history.append(Content("user", "a" * 400))
+    history.append(Content("model", "b" * 400))
+    history.append(Content("user", "question"))
+    history.append(Content("model", "answer"))
+    assert history.contents()[0] == "task"
+    assert [turn.content.text for turn in history.turns[1:]] == ["question", "answer"]
+    assert history.total_tokens <= 50
@@ -0,0 +1,463 @@
+import asyncio
+import importlib
+import inspect
+import json
+import logging
+import os
+import threading
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Tool execution defaults (from environment). A tool config in agent.md or a
+# task file can override them per tool.
+TOOL_TIMEOUT_SECONDS = float(os.environ.get("TOOL_TIMEOUT_SECONDS", "60"))
+TOOL_MAX_CONCURRENCY = int(os.environ.get("TOOL_MAX_CONCURRENCY", "4"))
+TOOL_MEMO_TTL_SECONDS = float(os.environ.get("TOOL_MEMO_TTL_SECONDS", "300"))
+TOOL_MEMO_MAX_ENTRIES = int(os.environ.get("TOOL_MEMO_MAX_ENTRIES", "1024"))
+
+# Tool config keys understood by `ToolRegistry.configure`.
+TOOL_OPTION_KEYS = ("import_path", "timeout_seconds", "max_concurrency", "memoize", "ttl_seconds")
+
+
+@dataclass
+class ToolMetrics:
+    """Per-tool call counters and latency, as reported by `ToolRegistry.metrics`."""
+
+    calls: int = 0
+    errors: int = 0
+    timeouts: int = 0
+    cache_hits: int = 0
+    total_seconds: float = 0.0
+    max_seconds: float = 0.0
+
+    def record(self, seconds: float) -> None:
+        self.calls += 1
+        self.total_seconds += seconds
+        self.max_seconds = max(self.max_seconds, seconds)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "timeouts": self.timeouts,
+            "cache_hits": self.cache_hits,
+            "avg_seconds": round(self.total_seconds / self.calls, 4) if self.calls else 0.0,
+            "max_seconds": round(self.max_seconds, 4),
+        }
+
+
+@dataclass
+class ToolSpec:
+    """
+    How to load and run one tool.
+
+    Args:
+        name: The tool name the model calls.
+        import_path: "package.module:attribute", imported on first use.
+        func: The tool callable, if already loaded.
+        timeout_seconds: Calls taking longer fail with TimeoutError.
+        max_concurrency: Calls of this tool allowed to run at the same time.
+        memoize: Reuse results of identical calls. Only for idempotent tools.
+        ttl_seconds: How long a memoized result is reused.
+    """
+
+    name: str
+    import_path: Optional[str] = None
+    func: Optional[Callable] = None
+    timeout_seconds: float = TOOL_TIMEOUT_SECONDS
+    max_concurrency: int = TOOL_MAX_CONCURRENCY
+    memoize: bool = False
+    ttl_seconds: float = TOOL_MEMO_TTL_SECONDS
+    _semaphore: threading.BoundedSemaphore = field(init=False, repr=False)
+    # asyncio semaphores are bound to the loop they are first used on, so
+    # coroutine tools get one per event loop.
+    _async_semaphores: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Semaphore]" = field(
+        default_factory=weakref.WeakKeyDictionary, init=False, repr=False
+    )
+
+    def __post_init__(self):
+        if self.func is None and not self.import_path:
+            raise ValueError(f"Tool '{self.name}' needs either a function or an import path.")
+        self._set_limits()
+
+    def _set_limits(self) -> None:
+        if self.max_concurrency < 1:
+            raise ValueError(f"max_concurrency for tool '{self.name}' must be at least 1.")
+        self._semaphore = threading.BoundedSemaphore(self.max_concurrency)
+        self._async_semaphores = weakref.WeakKeyDictionary()
+
+    def async_semaphore(self) -> asyncio.Semaphore:
+        """Returns the concurrency limit of this tool for the running event loop."""
+        loop = asyncio.get_running_loop()
+        semaphore = self._async_semaphores.get(loop)
+        if semaphore is None:
+            semaphore = self._async_semaphores.setdefault(loop, asyncio.Semaphore(self.max_concurrency))
+        return semaphore
+
+
+def qualified_name(name: str, namespace: Optional[str] = None) -> str:
+    """Returns the registry name of a tool owned by one agent ("agent:tool"), or the shared name."""
+    return f"{namespace}:{name}" if namespace else name
+
+
+def memo_key(name: str, args: Dict[str, Any], scope: Optional[str] = None) -> Tuple[Optional[str], str, str]:
+    """Returns the memoization key for a call: its scope, the tool name and its canonical arguments."""
+    return scope, name, json.dumps(args, sort_keys=True, default=str)
+
+
+class ToolRegistry:
+    """
+    One place to register, load and run agent tools.
+
+    Tools are imported lazily on first use. Each call runs with the tool's
+    timeout and under its concurrency limit, and is timed into per-tool
+    metrics. Idempotent tools can be memoized: an identical call (same tool,
+    same arguments, same scope such as a session_id) within the TTL returns
+    the earlier result without running the tool again.
+
+    Tools are shared by name, unless registered under an agent's namespace:
+    lookups with a namespace try the agent's own tool ("agent:tool") before
+    the shared one, so two agents can bring different tools of the same name.
+
+    A timed-out synchronous tool cannot be interrupted; its worker thread
+    finishes in the background and its result is discarded.
+    """
+
+    def __init__(self, clock: Callable[[], float] = time.monotonic, max_memo_entries: int = TOOL_MEMO_MAX_ENTRIES):
+        self.clock = clock
+        self.max_memo_entries = max_memo_entries
+        self._specs: Dict[str, ToolSpec] = {}
+        self._metrics: Dict[str, ToolMetrics] = {}
+        self._memo: Dict[Tuple, Tuple[float, Any]] = {}
+        self._lock = threading.Lock()
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+    def register(
+        self,
+        name: str,
+        func: Optional[Callable] = None,
+        import_path: Optional[str] = None,
+        namespace: Optional[str] = None,
+        **options,
+    ) -> ToolSpec:
+        """
+        Registers (or replaces) a tool, shared or owned by the agent
+        `namespace`. Options are the `ToolSpec` fields.
+        """
+        name = qualified_name(name, namespace)
+        spec = ToolSpec(name=name, func=func, import_path=import_path, **options)
+        with self._lock:
+            self._specs[name] = spec
+            self._metrics.setdefault(name, ToolMetrics())
+            self._forget(name)
+        return spec
+
+    def configure(self, tool_config: Dict[str, Any], namespace: Optional[str] = None) -> Optional[ToolSpec]:
+        """
+        Applies the options of a '# Tools' JSON entry (e.g. {"type": "FunctionTool",
+        "name": ..., "timeout_seconds": 10, "memoize": true}) to a tool.
+        Registers the tool if the entry has an "import_path". Returns the spec,
+        or None if the tool is unknown.
+
+        With a namespace, the options apply to the agent's own copy of the
+        tool, so they don't change the shared tool other agents use. An
+        existing spec is updated in place, keeping its loaded function,
+        memoized results and concurrency limits unless those options change.
+        """
+        name = tool_config.get("name")
+        options = {key: tool_config[key] for key in TOOL_OPTION_KEYS if key in tool_config}
+        spec = self._lookup(name, namespace)
+        if spec is None and not options.get("import_path"):
+            return None
+        if spec is not None and not options:
+            return spec
+        if spec is None:
+            return self.register(name, namespace=namespace, **options)
+        if namespace and spec.name != qualified_name(name, namespace):
+            # The shared tool, configured for one agent: copy it into the agent's namespace.
+            current = {key: getattr(spec, key) for key in TOOL_OPTION_KEYS}
+            func = spec.func if options.get("import_path", spec.import_path) == spec.import_path else None
+            return self.register(name, func=func, namespace=namespace, **{**current, **options})
+        self._update(spec, options)
+        return spec
+
+    def _update(self, spec: ToolSpec, options: Dict[str, Any]) -> None:
+        with self._lock:
+            if "import_path" in options and options["import_path"] != spec.import_path:
+                spec.import_path = options["import_path"]
+                spec.func = None
+                self._forget(spec.name)
+            for key in ("timeout_seconds", "memoize", "ttl_seconds"):
+                if key in options:
+                    setattr(spec, key, options[key])
+            if "max_concurrency" in options and options["max_concurrency"] != spec.max_concurrency:
+                spec.max_concurrency = options["max_concurrency"]
+                # Calls in flight release the limits they acquired.
+                spec._set_limits()
+
+    def _lookup(self, name: str, namespace: Optional[str] = None) -> Optional[ToolSpec]:
+        if namespace:
+            spec = self._specs.get(qualified_name(name, namespace))
+            if spec is not None:
+                return spec
+        return self._specs.get(name)
+
+    def _get_spec(self, name: str, namespace: Optional[str] = None) -> ToolSpec:
+        spec = self._lookup(name, namespace)
+        if spec is None:
+            raise ValueError(f"Tool '{name}' is not registered.")
+        return spec
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._specs
+
+    def names(self) -> List[str]:
+        return sorted(self._specs)
+
+    def resolve(self, name: str, namespace: Optional[str] = None) -> Callable:
+        """Returns the tool callable, importing it on first use."""
+        return self._load(self._get_spec(name, namespace))
+
+    def _load(self, spec: ToolSpec) -> Callable:
+        if spec.func is None:
+            module_name, _, attribute = spec.import_path.partition(":")
+            module = importlib.import_module(module_name)
+            func = getattr(module, attribute or spec.name.rpartition(":")[2], None)
+            if not callable(func):
+                raise ValueError(f"Tool '{spec.name}' not found at '{spec.import_path}'.")
+            spec.func = func
+            logger.info(f"Loaded tool '{spec.name}' from '{spec.import_path}'.")
+        return spec.func
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(thread_name_prefix="tool-registry")
+            return self._executor
+
+    # --- Memoization ---
+
+    def _forget(self, name: str) -> None:
+        for key in [key for key in self._memo if key[1] == name]:
+            del self._memo[key]
+
+    def _memo_get(self, spec: ToolSpec, key: Tuple) -> Tuple[bool, Any]:
+        if not spec.memoize:
+            return False, None
+        with self._lock:
+            hit = self._memo.get(key)
+            if hit is None:
+                return False, None
+            stored_at, result = hit
+            if self.clock() - stored_at > spec.ttl_seconds:
+                del self._memo[key]
+                return False, None
+            self._metrics[spec.name].cache_hits += 1
+            return True, result
+
+    def _memo_put(self, spec: ToolSpec, key: Tuple, result: Any) -> None:
+        if not spec.memoize:
+            return
+        with self._lock:
+            if len(self._memo) >= self.max_memo_entries:
+                # Evict the oldest entry; dicts keep insertion order.
+                del self._memo[next(iter(self._memo))]
+            self._memo[key] = (self.clock(), result)
+
+    def clear_memo(self, scope: Optional[str] = None) -> None:
+        """Forgets memoized results, for one scope (e.g. an ended session) or all of them."""
+        with self._lock:
+            if scope is None:
+                self._memo.clear()
+            else:
+                for key in [key for key in self._memo if key[0] == scope]:
+                    del self._memo[key]
+
+    # --- Execution ---
+
+    def _run_limited(self, spec: ToolSpec, func: Callable, args: Dict[str, Any]) -> Any:
+        with spec._semaphore:
+            return func(**args)
+
+    def _record(self, spec: ToolSpec, started: float, error: Optional[BaseException] = None) -> None:
+        elapsed = time.perf_counter() - started
+        with self._lock:
+            metrics = self._metrics[spec.name]
+            metrics.record(elapsed)
+            if isinstance(error, TimeoutError):
+                metrics.timeouts += 1
+            elif error is not None:
+                metrics.errors += 1
+        logger.debug(f"Tool '{spec.name}' took {elapsed:.3f}s.")
+
+    def call(
+        self,
+        name: str,
+        args: Optional[Dict[str, Any]] = None,
+        scope: Optional[str] = None,
+        namespace: Optional[str] = None,
+    ) -> Any:
+        """
+        Runs a tool synchronously with its timeout, concurrency limit and
+        memoization. A coroutine tool runs on a new event loop, in a separate
+        thread if this one is already running a loop.
+        """
+        args = args or {}
+        spec = self._get_spec(name, namespace)
+        key = memo_key(spec.name, args, scope)
+        hit, result = self._memo_get(spec, key)
+        if hit:
+            return result
+
+        func = self._load(spec)
+        if inspect.iscoroutinefunction(func):
+            try:
+                asyncio.get_running_loop()
+            except RuntimeError:
+                return asyncio.run(self.acall(name, args, scope=scope, namespace=namespace))
+            with ThreadPoolExecutor(max_workers=1, thread_name_prefix="tool-registry-loop") as runner:
+                return runner.submit(asyncio.run, self.acall(name, args, scope=scope, namespace=namespace)).result()
+
+        started = time.perf_counter()
+        future = self._get_executor().submit(self._run_limited, spec, func, args)
+        try:
+            result = future.result(timeout=spec.timeout_seconds)
+        except FutureTimeoutError:
+            error = TimeoutError(f"Tool '{name}' timed out after {spec.timeout_seconds}s.")
+            self._record(spec, started, error)
+            raise error from None
+        except Exception as e:
+            self._record(spec, started, e)
+            raise
+        self._record(spec, started)
+        self._memo_put(spec, key, result)
+        return result
+
+    async def acall(
+        self,
+        name: str,
+        args: Optional[Dict[str, Any]] = None,
+        scope: Optional[str] = None,
+        executor: Optional[ThreadPoolExecutor] = None,
+        namespace: Optional[str] = None,
+    ) -> Any:
+        """
+        Async version of `call`. Coroutine tools are awaited directly; regular
+        tools run on `executor` (or the registry's own pool).
+        """
+        args = args or {}
+        spec = self._get_spec(name, namespace)
+        key = memo_key(spec.name, args, scope)
+        hit, result = self._memo_get(spec, key)
+        if hit:
+            return result
+
+        func = self._load(spec)
+        started = time.perf_counter()
+        try:
+            if inspect.iscoroutinefunction(func):
+                async with spec.async_semaphore():
+                    result = await asyncio.wait_for(func(**args), timeout=spec.timeout_seconds)
+            else:
+                loop = asyncio.get_running_loop()
+                result = await asyncio.wait_for(
+                    loop.run_in_executor(executor or self._get_executor(), self._run_limited, spec, func, args),
+                    timeout=spec.timeout_seconds,
+                )
+        except asyncio.TimeoutError:
+            error = TimeoutError(f"Tool '{name}' timed out after {spec.timeout_seconds}s.")
+            self._record(spec, started, error)
+            raise error from None
+        except Exception as e:
+            self._record(spec, started, e)
+            raise
+        self._record(spec, started)
+        self._memo_put(spec, key, result)
+        return result
+
+    def metrics(self) -> Dict[str, Dict[str, Any]]:
+        """Returns a snapshot of the per-tool metrics."""
+        with self._lock:
+            return {name: metrics.as_dict() for name, metrics in self._metrics.items()}
+
+    def log_metrics(self) -> None:
+        for name, metrics in self.metrics().items():
+            if metrics["calls"] or metrics["cache_hits"]:
+                logger.info(f"Tool '{name}' metrics: {metrics}")
+
+    # --- Model-facing tool definitions ---
+
+    def function_declarations(self, names: List[str], namespace: Optional[str] = None) -> List[Any]:
+        """Builds Gemini function declarations for the given registered tools."""
+        from vertexai.generative_models import FunctionDeclaration
+
+        declarations = []
+        for name in names:
+            try:
+                declarations.append(FunctionDeclaration.from_func(self.resolve(name, namespace)))
+            except (ValueError, ImportError) as e:
+                logger.warning(f"Function tool '{name}' could not be loaded: {e}")
+        return declarations
+
+    def build_tools(
+        self,
+        tool_configs: List[Dict[str, Any]],
+        agent_package: Optional[str] = None,
+        namespace: Optional[str] = None,
+    ) -> List[Any]:
+        """
+        Turns the '# Tools' JSON of an agent into Gemini Tool objects.
+
+        "VertexAiRagRetrieval" loads `rag_tool` from `<agent_package>.tools`;
+        "FunctionTool" entries are resolved through the registry (after
+        applying any per-tool options from the entry, in the agent's
+        `namespace`) and bundled into one Tool.
+        """
+        from vertexai.generative_models import Tool
+
+        tools = []
+        function_names = []
+        for tool_config in tool_configs:
+            tool_type = tool_config.get("type")
+            if tool_type == "VertexAiRagRetrieval" and agent_package:
+                try:
+                    tool_module = importlib.import_module(f"{agent_package}.tools")
+                except ImportError:
+                    logger.error(f"Could not import tools from '{agent_package}.tools'.")
+                    continue
+                rag_tool = getattr(tool_module, "rag_tool", None)
+                if rag_tool:
+                    tools.append(rag_tool)
+                    logger.info(f"Loaded RAG tool from '{agent_package}.tools'.")
+                else:
+                    logger.warning(f"RAG tool configured but not found in {agent_package}.tools")
+            elif tool_type == "FunctionTool":
+                name = tool_config.get("name")
+                if self.configure(tool_config, namespace=namespace) is None:
+                    logger.warning(f"Function tool '{name}' is not registered and has no 'import_path'.")
+                    continue
+                function_names.append(name)
+
+        declarations = self.function_declarations(function_names, namespace=namespace)
+        if declarations:
+            tools.append(Tool(function_declarations=declarations))
+        return tools
+
+
+_tool_registry: Optional[ToolRegistry] = None
+_tool_registry_lock = threading.Lock()
+
+
+def get_tool_registry() -> ToolRegistry:
+    """Returns the process-wide tool registry shared by agents and scripts."""
+    global _tool_registry
+    with _tool_registry_lock:
+        if _tool_registry is None:
+            _tool_registry = ToolRegistry()
+        return _tool_registry
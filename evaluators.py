@@ -1,3 +1,6 @@
+import os
+import sys
+
 from google.adk.evaluate import (
     Evaluation,
     Evaluator,
@@ -8,51 +11,60 @@ from google.adk.evaluate import (
 from google.adk.models import Model
 from google.adk.agents import Agent
 
+# The judge is shared with the rag-agent app's evaluators. Its directory is
+# imported from directly, because importing the rag-agent `app` package would
+# build its agent.
+sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), "agents", "rag-agent", "app", "utils"))
+
+from groundedness import GroundednessJudge
+
 
 class Groundedness(Evaluator):
     """
     A custom evaluator to check if the agent's response is grounded in the
     provided context. This is crucial for RAG agents.
+
+    Scoring is done by a GroundednessJudge, which batches the claim-level
+    checks of long contexts into concurrent judge calls and caches results.
+    `evaluate_batch` scores a whole set of test cases with shared judge calls.
     """
 
-    def __init__(self, llm: Model):
-        self._llm = llm
+    def __init__(
+        self,
+        llm: Model,
+        batch_size: int = 5,
+        max_concurrency: int = 4,
+        max_context_chars: int = 8000,
+    ):
+        self._judge = GroundednessJudge(
+            llm,
+            batch_size=batch_size,
+            max_concurrency=max_concurrency,
+            max_context_chars=max_context_chars,
+        )
 
     def evaluate(self, agent: Agent, test_case: dict) -> list[Metric]:
-        response = test_case.get("output", {}).get("response")
-        context = test_case.get("output", {}).get("context")
-
-        if not response or not context:
-            return [Metric(name="groundedness", value=0.0, rationale="Missing response or context for evaluation.")]
-
-        prompt = f"""
-        You are an expert evaluator. Your task is to determine if the 'Response' is factually supported by the 'Context'.
-        A response is considered grounded if all claims it makes can be verified from the information present in the context.
-
-        - Score 1.0 if the response is fully supported by the context.
-        - Score 0.0 if the response contains information not found in the context.
-        - Score 0.5 for partially supported responses.
-
-        Provide a brief rationale for your score.
-        Format your output as a JSON object with "score" and "rationale" keys.
-
-        Context:
-        {context}
-
-        Response:
-        {response}
-        """
-        eval_response = self._llm.predict(prompt)
+        return self.evaluate_batch(agent, [test_case])[0]
 
-        try:
-            result = eval_response.json()
-            score = float(result.get("score", 0.0))
-            rationale = result.get("rationale", "Could not parse rationale from LLM.")
-        except (ValueError, AttributeError):
-            score = 0.0
-            rationale = "Failed to parse evaluation response from LLM."
+    def evaluate_batch(self, agent: Agent, test_cases: list[dict]) -> list[list[Metric]]:
+        """Evaluates several test cases, sharing judge calls between them."""
+        pairs = {}
+        for index, test_case in enumerate(test_cases):
+            response = test_case.get("output", {}).get("response")
+            # For RAG, context is often part of the output
+            context = test_case.get("output", {}).get("context")
+            if response and context:
+                pairs[index] = (response, context)
+        scores = dict(zip(pairs, self._judge.score_many(list(pairs.values()))))
 
-        return [Metric(name="groundedness", value=score, rationale=rationale)]
+        results = []
+        for index in range(len(test_cases)):
+            if index not in scores:
+                results.append([Metric(name="groundedness", value=0.0, rationale="Missing response or context for evaluation.")])
+                continue
+            score, rationale = scores[index]
+            results.append([Metric(name="groundedness", value=score, rationale=rationale)])
+        return results
 
 
 def get_evaluators(llm: Model) -> list[Evaluator]: